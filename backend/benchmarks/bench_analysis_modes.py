@@ -0,0 +1,122 @@
+"""Validate reduced-resolution analysis modes against full resolution.
+
+Usage:
+    python benchmarks/bench_analysis_modes.py                 # synthetic JPEG defocus series
+    python benchmarks/bench_analysis_modes.py path/to/images  # real images (original files)
+    python benchmarks/bench_analysis_modes.py --fit [path]    # also print FOCUS_SCALE_CORRECTION
+
+For every mode and focus measure it reports rank agreement (Spearman rho)
+with the full-resolution score, the relative error of the scale-corrected
+score, and how often the pass/fail verdict at the default focus threshold
+matches full resolution. --fit chooses each correction to reproduce those
+verdicts (see fit_correction).
+"""
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from common import spearman, synthetic_field
+from config import ANALYSIS_MODES, DEFAULT_FOCUS_METHOD
+from services.image_processing import (
+    FOCUS_METHODS, FOCUS_SCALE_CORRECTION, analyze_image, decode_grayscale, focus_from_array,
+    default_focus_threshold
+)
+
+BLUR_SIGMAS = (0, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5)
+LAYOUTS = 3
+SIZE = 4096
+
+
+def load_originals(directory: str) -> list:
+    return [p.read_bytes() for p in sorted(Path(directory).iterdir()) if p.is_file()]
+
+
+def relative_error(values, reference) -> np.ndarray:
+    values, reference = np.asarray(values, float), np.asarray(reference, float)
+    return np.abs(values - reference) / np.maximum(np.abs(reference), 1e-9)
+
+
+def fit_correction(raw, reference, threshold) -> float:
+    """FOCUS_SCALE_CORRECTION entry for one method and mode.
+
+    Where the full-resolution scores span the default threshold, the factor
+    that best reproduces their verdicts at it (of the best ones, the closest
+    to the median ratio); otherwise the median full/reduced ratio.
+    """
+    raw = np.maximum(raw, 1e-9)
+    ratio = float(np.median(reference / raw))
+    passed = reference >= threshold
+    if passed.all() or not passed.any():
+        return ratio
+    cuts = np.sort(threshold / raw)
+    candidates = np.sqrt(cuts[:-1] * cuts[1:])
+    agreement = np.array([np.mean((raw * k >= threshold) == passed) for k in candidates])
+    best = candidates[agreement == agreement.max()]
+    return float(best[np.argmin(np.abs(np.log(best / ratio)))])
+
+
+def main():
+    args = [a for a in sys.argv[1:] if a != "--fit"]
+    fit = "--fit" in sys.argv
+    if args:
+        originals = load_originals(args[0])
+    else:
+        originals = [
+            cv2.imencode(".jpg", synthetic_field(layout, sigma, SIZE), [cv2.IMWRITE_JPEG_QUALITY, 92])[1].tobytes()
+            for layout in range(LAYOUTS) for sigma in BLUR_SIGMAS
+        ]
+    originals = [b for b in originals if decode_grayscale(b, 8) is not None]
+    if not originals:
+        print("No images found")
+        return
+
+    full = {}
+    print(f"{len(originals)} images\n")
+    print(f"{'mode':<9}{'ms/image':>10}{'speedup':>9}{'contrast err':>14}{'exposure err':>14}{'diameter err':>14}")
+    results = {}
+    for mode in ANALYSIS_MODES:
+        start = time.perf_counter()
+        results[mode] = [analyze_image(b, DEFAULT_FOCUS_METHOD, mode, thumbnail=False) for b in originals]
+        elapsed = (time.perf_counter() - start) * 1000 / len(originals)
+        full.setdefault("ms", elapsed)
+        line = f"{mode:<9}{elapsed:>10.1f}{full['ms'] / elapsed:>8.1f}x"
+        for key in ("contrast", "exposure", "diameter"):
+            pairs = [(r[key], f[key]) for r, f in zip(results[mode], results["full"]) if r[key] and f[key]]
+            err = relative_error(*zip(*pairs)) if pairs else np.array([np.nan])
+            line += f"{np.median(err) * 100:>13.1f}%"
+        print(line)
+
+    print(f"\n{'method':<22}{'mode':<9}{'rho':>7}{'median err':>12}{'p95 err':>10}{'verdict match':>15}")
+    suggested = {}
+    for method in FOCUS_METHODS:
+        reference = None
+        for mode, factor in ANALYSIS_MODES.items():
+            images = [decode_grayscale(b, factor) for b in originals]
+            raw = np.array([FOCUS_METHODS[method](img) for img in images])
+            scores = np.array([focus_from_array(img, method, factor) for img in images])
+            if reference is None:
+                reference = scores
+                continue
+            threshold = default_focus_threshold(method)
+            suggested.setdefault(method, {})[factor] = fit_correction(raw, reference, threshold)
+            err = relative_error(scores, reference)
+            line = (f"{method:<22}{mode:<9}{spearman(scores, reference):>7.3f}"
+                    f"{np.median(err) * 100:>11.1f}%{np.percentile(err, 95) * 100:>9.1f}%")
+            match = np.mean((scores >= threshold) == (reference >= threshold))
+            line += f"{match * 100:>14.0f}%"
+            print(line)
+
+    if fit:
+        print("\nFOCUS_SCALE_CORRECTION = {")
+        for method, factors in suggested.items():
+            values = ", ".join(f"{factor}: {ratio:.2f}" for factor, ratio in factors.items())
+            print(f'    "{method}": {{{values}}},')
+        print("}")
+        print("(current values:", FOCUS_SCALE_CORRECTION, ")")
+
+
+if __name__ == "__main__":
+    main()
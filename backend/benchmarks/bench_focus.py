@@ -0,0 +1,85 @@
+"""Compare focus measures on speed and ranking agreement.
+
+Usage:
+    python benchmarks/bench_focus.py                 # synthetic defocus series
+    python benchmarks/bench_focus.py path/to/images  # real images
+    python benchmarks/bench_focus.py --thresholds    # print FOCUS_DEFAULT_THRESHOLDS
+
+On the synthetic series the true order is known (less blur = sharper), so
+each measure is scored against it as well as against the Laplacian reference.
+"""
+import sys
+import time
+
+import numpy as np
+from common import spearman, synthetic_field, load_images
+from config import DEFAULT_FOCUS_THRESHOLD
+from services.image_processing import FOCUS_METHODS
+
+BLUR_SIGMAS = (0, 0.5, 1, 1.5, 2, 3, 5)
+LAYOUTS = 4
+
+
+def equivalent_thresholds(sweep=np.arange(0, 3, 0.05)):
+    """Each measure's score at the defocus where the Laplacian falls to DEFAULT_FOCUS_THRESHOLD.
+
+    Noise-free fields, since sensor noise alone keeps the Laplacian of
+    the synthetic field above the threshold at any blur. normalized_variance
+    hardly changes with defocus, so its printed value is not used as is.
+    """
+    at_threshold = {name: [] for name in FOCUS_METHODS}
+    for layout in range(LAYOUTS):
+        for sigma in sweep:
+            img = synthetic_field(layout, sigma, size=1024, noise=0)
+            if FOCUS_METHODS["laplacian"](img) < DEFAULT_FOCUS_THRESHOLD:
+                break
+        for name, func in FOCUS_METHODS.items():
+            at_threshold[name].append(func(img))
+        print(f"layout {layout}: laplacian crosses {DEFAULT_FOCUS_THRESHOLD:g} at sigma {sigma:.2f}")
+    print("\nFOCUS_DEFAULT_THRESHOLDS = {")
+    for name, values in at_threshold.items():
+        print(f'    "{name}": {float(np.median(values)):.3g},')
+    print("}")
+
+
+def main():
+    if "--thresholds" in sys.argv:
+        equivalent_thresholds()
+        return
+    if len(sys.argv) > 1:
+        images = load_images(sys.argv[1])
+        truth = None
+    else:
+        images, truth = [], []
+        for layout in range(LAYOUTS):
+            for sigma in BLUR_SIGMAS:
+                images.append(synthetic_field(layout, sigma))
+                truth.append(-sigma)
+
+    if not images:
+        print("No images found")
+        return
+
+    print(f"{len(images)} images, {images[0].shape[1]}x{images[0].shape[0]}\n")
+    scores, timings = {}, {}
+    for name, func in FOCUS_METHODS.items():
+        start = time.perf_counter()
+        scores[name] = [func(img) for img in images]
+        timings[name] = (time.perf_counter() - start) * 1000 / len(images)
+
+    reference = scores["laplacian"]
+    header = f"{'method':<22}{'ms/image':>10}{'speedup':>9}{'rho vs laplacian':>18}"
+    if truth is not None:
+        header += f"{'rho vs truth':>14}"
+    print(header)
+    for name in FOCUS_METHODS:
+        line = (f"{name:<22}{timings[name]:>10.2f}"
+                f"{timings['laplacian'] / timings[name]:>8.1f}x"
+                f"{spearman(scores[name], reference):>18.3f}")
+        if truth is not None:
+            line += f"{spearman(scores[name], truth):>14.3f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Cross-experiment query latency on a synthetic facility-scale database.
+
+Usage:
+    python benchmarks/bench_query.py              # 1,000,000 images
+    python benchmarks/bench_query.py 200000
+
+Rows are inserted through the normal images triggers, so the ingest
+figure includes image_summary maintenance. Each query is timed cold
+(empty result cache) and warm.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+QUERIES = [
+    {"group_by": "month"},
+    {"group_by": "operator,month"},
+    {"group_by": "microscope,week", "since": "2026-03-01", "until": "2026-05-31"},
+    {"group_by": "experiment", "filters": {"operator": "op3"}},
+    {"group_by": "microscope", "metric_filters": ["focus>=150"]},
+    {"group_by": "plate", "filters": {"microscope": "scope2"}, "since": "2026-04-01", "until": "2026-04-30"},
+]
+
+
+def populate(engine, rows: int, experiments: int = 200):
+    from sqlalchemy import text
+    rng = random.Random(0)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO experiments (name) VALUES (:name)"),
+                     [{"name": f"exp{n}"} for n in range(experiments)])
+        batch = []
+        for n in range(rows):
+            # A session is one operator on one microscope on one day
+            session = n // 500
+            session_rng = random.Random(session)
+            focus = rng.lognormvariate(5, 0.6)
+            exposure = rng.gauss(130, 40)
+            batch.append({
+                "exp": n * experiments // rows + 1,
+                "focus": focus, "contrast": rng.uniform(5, 60), "exposure": exposure,
+                "ready": int(focus >= 150 and 30 <= exposure <= 225),
+                "session": f"s{session}", "scope": f"scope{session_rng.randrange(8)}",
+                "operator": f"op{session_rng.randrange(12)}", "plate": f"P{n // 384}",
+                "created": f"2026-{1 + n * 12 // rows:02d}-{1 + session_rng.randrange(28):02d} 12:00:00",
+            })
+            if len(batch) == 50_000:
+                _insert(conn, batch)
+                batch = []
+        if batch:
+            _insert(conn, batch)
+
+
+def _insert(conn, batch):
+    from sqlalchemy import text
+    conn.execute(text("""
+        INSERT INTO images (experiment_id, filename, focus_score, contrast_level, exposure_level,
+                            is_ml_ready, imaging_session_id, microscope_id, operator_id,
+                            plate_id, created_at)
+        VALUES (:exp, 'x.tif', :focus, :contrast, :exposure, :ready, :session, :scope,
+                :operator, :plate, :created)
+    """), batch)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    workdir = tempfile.mkdtemp()
+    os.environ["ORGANOIDQC_DATABASE_URL"] = f"sqlite:///{workdir}/bench.db"
+
+    from database import engine, init_db, SessionLocal
+    from services.query import parse_query, run_query, QueryCache
+
+    init_db()
+    start = time.perf_counter()
+    populate(engine, rows)
+    print(f"Inserted {rows:,} images in {time.perf_counter() - start:.1f}s (triggers included)")
+
+    print(f"{'query':<70} {'source':>14} {'rows':>5} {'cold ms':>9} {'warm ms':>8}")
+    db = SessionLocal()
+    try:
+        for params in QUERIES:
+            spec = parse_query(**params)
+            cache = QueryCache(16)
+            start = time.perf_counter()
+            result = run_query(db, spec, cache)
+            cold = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            run_query(db, spec, cache)
+            warm = (time.perf_counter() - start) * 1000
+            label = " ".join(f"{k}={v}" for k, v in params.items())
+            print(f"{label:<70} {result['source']:>14} {len(result['rows']):>5} {cold:>9.1f} {warm:>8.2f}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
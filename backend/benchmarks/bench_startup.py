@@ -0,0 +1,75 @@
+"""Measure API cold-start import time with `python -X importtime`.
+
+Usage:
+    python benchmarks/bench_startup.py            # import main
+    python benchmarks/bench_startup.py routes.images
+
+Exits with status 1 if the median import time exceeds STARTUP_BUDGET_MS.
+Each run is a fresh interpreter started from an empty directory, so it
+also shows whether importing the app touches the filesystem.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent.resolve()
+
+# Cumulative import time of `main` on an idle machine (median of RUNS)
+STARTUP_BUDGET_MS = 1500
+# Imaging libraries that must only load in the code paths that use them
+HEAVY_MODULES = ("cv2", "numpy", "PIL", "pyarrow")
+RUNS = 5
+
+
+def measure_import(module: str = "main") -> tuple:
+    """Import module in a fresh interpreter.
+
+    Returns (cumulative ms of module, {name: (self ms, cumulative ms)},
+    heavy modules that got loaded, files created in the working directory).
+    """
+    env = {**os.environ, "PYTHONPATH": str(BACKEND_DIR), "PYTHONDONTWRITEBYTECODE": "1"}
+    check = f"import sys; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    with tempfile.TemporaryDirectory() as cwd:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}; {check}"],
+            cwd=cwd, env=env, capture_output=True, text=True, check=True
+        )
+        created = sorted(os.listdir(cwd))
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+
+    loaded = [m for m in result.stdout.strip().split(",") if m]
+    return timings[module][1], timings, loaded, created
+
+
+def main():
+    module = sys.argv[1] if len(sys.argv) > 1 else "main"
+    totals = []
+    for _ in range(RUNS):
+        total, timings, loaded, created = measure_import(module)
+        totals.append(total)
+
+    totals.sort()
+    median = totals[len(totals) // 2]
+    print(f"import {module}: median {median:.0f} ms, "
+          f"min {totals[0]:.0f} ms over {RUNS} runs (budget {STARTUP_BUDGET_MS} ms)")
+    print(f"heavy modules loaded: {', '.join(loaded) or 'none'}")
+    print(f"files created on import: {', '.join(created) or 'none'}\n")
+
+    # Top-level packages by cumulative time (last run)
+    top = {name: t for name, t in timings.items() if "." not in name}
+    print(f"{'module':<28} {'self ms':>9} {'cumul ms':>9}")
+    for name, (self_ms, cumulative_ms) in sorted(top.items(), key=lambda kv: -kv[1][1])[:15]:
+        print(f"{name:<28} {self_ms:>9.1f} {cumulative_ms:>9.1f}")
+    return median <= STARTUP_BUDGET_MS
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,46 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import cv2
+import numpy as np
+
+
+def spearman(a, b) -> float:
+    """Spearman rank correlation (no tie correction)"""
+    ra = np.argsort(np.argsort(a)).astype(np.float64)
+    rb = np.argsort(np.argsort(b)).astype(np.float64)
+    ra -= ra.mean()
+    rb -= rb.mean()
+    denom = np.sqrt((ra ** 2).sum() * (rb ** 2).sum())
+    return float((ra * rb).sum() / denom) if denom else 0.0
+
+
+def synthetic_field(layout_seed: int, blur_sigma: float, size: int = 2048, noise: float = 3) -> np.ndarray:
+    """Grayscale field of organoids, optionally defocused with a Gaussian blur"""
+    rng = np.random.default_rng(layout_seed)
+    img = np.full((size, size), 150, dtype=np.uint8)
+    scale = size / 512
+    for _ in range(40):
+        center = tuple(int(v) for v in rng.integers(0, size, 2))
+        radius = int(rng.integers(10, 50) * scale)
+        cv2.circle(img, center, radius, int(rng.integers(20, 90)), -1)
+        # Internal texture so blur removes real detail, not only edges
+        for _ in range(5):
+            offset = rng.integers(-radius // 2, radius // 2 + 1, 2)
+            cv2.circle(img, (center[0] + int(offset[0]), center[1] + int(offset[1])),
+                       max(1, radius // 6), int(rng.integers(90, 140)), -1)
+    if blur_sigma > 0:
+        img = cv2.GaussianBlur(img, (0, 0), blur_sigma)
+    return np.clip(img + rng.normal(0, noise, img.shape), 0, 255).astype(np.uint8)
+
+
+def load_images(directory: str) -> list:
+    """Decode every image in a directory to grayscale"""
+    images = []
+    for path in sorted(Path(directory).iterdir()):
+        img = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+        if img is not None:
+            images.append(img)
+    return images
@@ -1,20 +1,205 @@
+import json
+import os
+from dataclasses import dataclass, field, fields, asdict
 from pathlib import Path
 
-# Paths
-UPLOAD_DIR = Path("./uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+# Settings are read once at import: defaults below, overridden by a JSON file
+# named in ORGANOIDQC_CONFIG_FILE, overridden by ORGANOIDQC_<FIELD> variables
+# (e.g. ORGANOIDQC_THUMBNAIL_QUALITY=85, ORGANOIDQC_THUMBNAIL_SIZE=256,256).
+ENV_PREFIX = "ORGANOIDQC_"
+CONFIG_FILE_ENV = ENV_PREFIX + "CONFIG_FILE"
 
-# Image settings
-ALLOWED_FORMATS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff','.tif')
-THUMBNAIL_SIZE = (200, 200)
-THUMBNAIL_QUALITY = 70
+SQLITE_JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+SQLITE_SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+THUMBNAIL_FORMATS = ("JPEG", "WEBP", "PNG")
+# Analysis mode -> decode reduction factor (see services.image_processing)
+ANALYSIS_MODES = {"full": 1, "reduced": 2, "triage": 4}
+# Names of image_processing.FOCUS_METHODS, listed here so settings can be
+# validated without importing the imaging stack
+FOCUS_METHOD_NAMES = ("laplacian", "laplacian_pyr2", "laplacian_pyr4", "tenengrad",
+                      "normalized_variance", "brenner", "fft_high_freq")
 
-# ML thresholds (defaults)
-DEFAULT_FOCUS_THRESHOLD = 150
-DEFAULT_CONTRAST_THRESHOLD = 20
-DEFAULT_EXPOSURE_MIN = 30
-DEFAULT_EXPOSURE_MAX = 225
 
-# Blur detection
-BLUR_FOCUS_THRESHOLD = 80
-BLUR_CONTRAST_THRESHOLD = 20
\ No newline at end of file
+@dataclass(frozen=True)
+class Settings:
+    """Effective deployment settings (see GET /config)"""
+
+    # Paths and database; upload_dir is created at startup (services.storage.init_storage).
+    # The schema and queries are SQLite-only (json_each, UPDATE ... FROM, log2,
+    # datetime modifiers, INSERT OR REPLACE), so database_url must be a sqlite URL
+    upload_dir: Path = Path("./uploads")
+    database_url: str = "sqlite:///./organoid_qc.db"
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+
+    # SQLite pragmas, applied to every new connection
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_cache_size_kb: int = 65536
+    sqlite_mmap_size_mb: int = 256
+    sqlite_busy_timeout_ms: int = 5000
+
+    # Image analysis
+    analysis_workers: int = field(default_factory=lambda: min(4, os.cpu_count() or 1))
+    allowed_formats: tuple = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif')
+    default_focus_method: str = "laplacian"
+    default_analysis_mode: str = "full"
+    binarization_threshold: int = 50
+
+    # Thumbnails; draft lets JPEG originals decode at reduced scale
+    thumbnail_size: tuple = (200, 200)
+    thumbnail_quality: int = 70
+    thumbnail_format: str = "JPEG"
+    thumbnail_draft: bool = True
+
+    # ML thresholds (defaults for new profiles); the focus threshold is for
+    # the Laplacian, other focus methods default to their own scale
+    # (image_processing.FOCUS_DEFAULT_THRESHOLDS)
+    default_focus_threshold: float = 150
+    default_contrast_threshold: float = 20
+    default_exposure_min: float = 30
+    default_exposure_max: float = 225
+
+    # Blur detection
+    blur_focus_threshold: float = 80
+    blur_contrast_threshold: float = 20
+
+    # Near-duplicate detection (max hamming distance between 64-bit pHashes)
+    duplicate_max_distance: int = 4
+
+    # Resumable chunked uploads; unfinished sessions and idempotency keys
+    # expire after upload_session_ttl_hours (POST /maintenance/collect-orphans)
+    upload_chunk_max_mb: int = 16
+    upload_max_size_mb: int = 4096
+    upload_session_ttl_hours: float = 24
+
+    # Cleanup and reanalysis (rows per committed chunk)
+    delete_chunk_size: int = 500
+    reanalyze_chunk_size: int = 100
+    orphan_grace_seconds: int = 3600
+
+    # Archive tier: originals older than archive_after_days are compacted
+    # (every archive_interval_hours if > 0, else on POST /maintenance/compact-originals)
+    archive_after_days: float = 30
+    archive_interval_hours: float = 0
+    archive_min_saving: float = 0.05
+    archive_cache_mb: int = 64
+
+    # Event stream (server-sent events)
+    event_buffer_size: int = 1000
+    event_keepalive_seconds: float = 15
+
+    # Columnar metrics export
+    export_batch_size: int = 50_000
+
+    # Cross-experiment queries (results cached per query and data version)
+    query_cache_entries: int = 256
+    query_max_rows: int = 10_000
+
+    def __post_init__(self):
+        if self.database_url.split("://", 1)[0].split("+", 1)[0] != "sqlite":
+            raise ValueError("database_url must be a sqlite:// URL (the schema is SQLite-only)")
+        if self.sqlite_journal_mode.upper() not in SQLITE_JOURNAL_MODES:
+            raise ValueError(f"sqlite_journal_mode must be one of {', '.join(SQLITE_JOURNAL_MODES)}")
+        if self.sqlite_synchronous.upper() not in SQLITE_SYNCHRONOUS_MODES:
+            raise ValueError(f"sqlite_synchronous must be one of {', '.join(SQLITE_SYNCHRONOUS_MODES)}")
+        if self.default_analysis_mode not in ANALYSIS_MODES:
+            raise ValueError(f"default_analysis_mode must be one of {', '.join(ANALYSIS_MODES)}")
+        if self.default_focus_method not in FOCUS_METHOD_NAMES:
+            raise ValueError(f"default_focus_method must be one of {', '.join(FOCUS_METHOD_NAMES)}")
+        if self.thumbnail_format.upper() not in THUMBNAIL_FORMATS:
+            raise ValueError(f"thumbnail_format must be one of {', '.join(THUMBNAIL_FORMATS)}")
+        if len(self.thumbnail_size) != 2:
+            raise ValueError("thumbnail_size must be width,height")
+        if not 1 <= self.thumbnail_quality <= 100:
+            raise ValueError("thumbnail_quality must be between 1 and 100")
+        if not 0 <= self.binarization_threshold <= 255:
+            raise ValueError("binarization_threshold must be between 0 and 255")
+        if not 0 <= self.archive_min_saving < 1:
+            raise ValueError("archive_min_saving must be between 0 and 1")
+        for name in ("db_pool_size", "analysis_workers", "event_buffer_size",
+                     "delete_chunk_size", "reanalyze_chunk_size", "export_batch_size",
+                     "query_cache_entries", "query_max_rows",
+                     "upload_chunk_max_mb", "upload_max_size_mb"):
+            if getattr(self, name) < 1:
+                raise ValueError(f"{name} must be at least 1")
+
+    def public_dict(self) -> dict:
+        """JSON-safe view of the settings with credentials masked"""
+        values = asdict(self)
+        values["upload_dir"] = str(self.upload_dir)
+        if "@" in self.database_url:
+            scheme, rest = self.database_url.split("://", 1)
+            values["database_url"] = f"{scheme}://***@{rest.rsplit('@', 1)[1]}"
+        return values
+
+
+def _coerce(name: str, kind, value):
+    """Convert a file or environment value to the field's type"""
+    if isinstance(value, str):
+        value = value.strip()
+    if kind is bool:
+        if isinstance(value, bool):
+            return value
+        if str(value).lower() in ("1", "true", "yes", "on"):
+            return True
+        if str(value).lower() in ("0", "false", "no", "off"):
+            return False
+        raise ValueError(f"{name}: expected a boolean, got {value!r}")
+    if kind is tuple:
+        items = value.split(",") if isinstance(value, str) else list(value)
+        if name == "thumbnail_size":
+            sizes = tuple(int(v) for v in items)
+            return sizes * 2 if len(sizes) == 1 else sizes
+        return tuple(str(v).strip() for v in items)
+    if kind is Path:
+        return Path(value)
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name}: expected {kind.__name__}, got {value!r}")
+
+
+def load_settings(environ=None) -> Settings:
+    """Build settings from defaults, the optional JSON file and ORGANOIDQC_* variables"""
+    environ = os.environ if environ is None else environ
+    types = {f.name: f.type for f in fields(Settings)}
+    values = {}
+
+    config_file = environ.get(CONFIG_FILE_ENV)
+    if config_file:
+        with open(config_file) as f:
+            file_values = json.load(f)
+        unknown = sorted(set(file_values) - set(types))
+        if unknown:
+            raise ValueError(f"Unknown settings in {config_file}: {', '.join(unknown)}")
+        values.update(file_values)
+
+    for name in types:
+        env_name = ENV_PREFIX + name.upper()
+        if env_name in environ:
+            values[name] = environ[env_name]
+
+    return Settings(**{name: _coerce(name, types[name], value) for name, value in values.items()})
+
+
+settings = load_settings()
+
+# Module-level names kept for existing imports
+UPLOAD_DIR = settings.upload_dir
+ALLOWED_FORMATS = settings.allowed_formats
+THUMBNAIL_SIZE = settings.thumbnail_size
+THUMBNAIL_QUALITY = settings.thumbnail_quality
+DEFAULT_FOCUS_METHOD = settings.default_focus_method
+DEFAULT_ANALYSIS_MODE = settings.default_analysis_mode
+DEFAULT_FOCUS_THRESHOLD = settings.default_focus_threshold
+DEFAULT_CONTRAST_THRESHOLD = settings.default_contrast_threshold
+DEFAULT_EXPOSURE_MIN = settings.default_exposure_min
+DEFAULT_EXPOSURE_MAX = settings.default_exposure_max
+BLUR_FOCUS_THRESHOLD = settings.blur_focus_threshold
+BLUR_CONTRAST_THRESHOLD = settings.blur_contrast_threshold
+DUPLICATE_MAX_DISTANCE = settings.duplicate_max_distance
+DELETE_CHUNK_SIZE = settings.delete_chunk_size
+ORPHAN_GRACE_SECONDS = settings.orphan_grace_seconds
+EVENT_BUFFER_SIZE = settings.event_buffer_size
+EVENT_KEEPALIVE_SECONDS = settings.event_keepalive_seconds
@@ -1,13 +1,46 @@
-from sqlalchemy import create_engine, MetaData, text
+import math
+import sqlite3
+from sqlalchemy import create_engine, event, MetaData, text
 from sqlalchemy.orm import sessionmaker
+from config import settings
+from services.histograms import HISTOGRAM_METRICS, bin_sql
+from services.profiles import backfill_default_profiles
 
-DATABASE_URL = "sqlite:///./organoid_qc.db"
+# Always SQLite (enforced by Settings)
+DATABASE_URL = settings.database_url
+_IS_MEMORY = DATABASE_URL in ("sqlite://", "sqlite:///") or ":memory:" in DATABASE_URL
 
 engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False}
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    # In-memory SQLite uses a single-connection pool that takes no sizing
+    **({} if _IS_MEMORY else {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+    })
 )
 
+
+@event.listens_for(engine, "connect")
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Per-connection SQLite tuning from settings"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode = {settings.sqlite_journal_mode.upper()}")
+    cursor.execute(f"PRAGMA synchronous = {settings.sqlite_synchronous.upper()}")
+    # Negative cache_size is in KiB rather than pages
+    cursor.execute(f"PRAGMA cache_size = {-int(settings.sqlite_cache_size_kb)}")
+    cursor.execute(f"PRAGMA mmap_size = {int(settings.sqlite_mmap_size_mb) * 1024 * 1024}")
+    cursor.execute(f"PRAGMA busy_timeout = {int(settings.sqlite_busy_timeout_ms)}")
+    cursor.execute("PRAGMA temp_store = MEMORY")
+    # Histogram bins use log2(), which SQLite builds without math functions lack
+    try:
+        cursor.execute("SELECT log2(2)")
+    except sqlite3.OperationalError:
+        dbapi_connection.create_function(
+            "log2", 1, lambda x: math.log2(x) if x and x > 0 else None, deterministic=True
+        )
+    cursor.close()
+
 SessionLocal = sessionmaker(
     autocommit=False, 
     autoflush=False, 
@@ -15,9 +48,139 @@ SessionLocal = sessionmaker(
 )
 
 
-def init_db():
+# Key of an images row in image_summary; NULL metadata is stored as ''
+_SUMMARY_KEY = (
+    "COALESCE(date({r}.created_at), ''), {r}.experiment_id, COALESCE({r}.operator_id, ''), "
+    "COALESCE({r}.microscope_id, ''), COALESCE({r}.imaging_session_id, '')"
+)
+
+# Bumped when image_summary's columns or triggers change; init_db then
+# recreates and rebuilds it once (see schema_versions)
+_SUMMARY_VERSION = 2
+
+def _summary_delta(row: str, sign: str) -> str:
+    """Upsert adding (sign='+') or removing (sign='-') one images row from its summary bucket.
+
+    Metrics are summed with their non-NULL counts so that averages divide
+    like AVG() does; n counts every image.
+    """
+    return f"""
+        INSERT INTO image_summary (day, experiment_id, operator_id, microscope_id, imaging_session_id,
+                                   n, ready, sum_focus, sum_contrast, sum_exposure,
+                                   n_focus, n_contrast, n_exposure)
+        VALUES ({_SUMMARY_KEY.format(r=row)}, {sign}1, {sign}COALESCE({row}.is_ml_ready, 0),
+                {sign}COALESCE({row}.focus_score, 0), {sign}COALESCE({row}.contrast_level, 0),
+                {sign}COALESCE({row}.exposure_level, 0),
+                {sign}({row}.focus_score IS NOT NULL), {sign}({row}.contrast_level IS NOT NULL),
+                {sign}({row}.exposure_level IS NOT NULL))
+        ON CONFLICT (day, experiment_id, operator_id, microscope_id, imaging_session_id) DO UPDATE SET
+            n = n + excluded.n, ready = ready + excluded.ready,
+            sum_focus = sum_focus + excluded.sum_focus,
+            sum_contrast = sum_contrast + excluded.sum_contrast,
+            sum_exposure = sum_exposure + excluded.sum_exposure,
+            n_focus = n_focus + excluded.n_focus,
+            n_contrast = n_contrast + excluded.n_contrast,
+            n_exposure = n_exposure + excluded.n_exposure;
+    """
+
+def _bump_version(row: str) -> str:
+    """Advance the data version of the experiment an images row belongs to"""
+    return f"""
+        INSERT INTO data_versions (experiment_id, version) VALUES ({row}.experiment_id, 1)
+        ON CONFLICT (experiment_id) DO UPDATE SET version = version + 1;
+    """
+
+# Columns whose changes can alter a cross-experiment query result
+_QUERY_COLUMNS = (
+    "experiment_id, operator_id, microscope_id, imaging_session_id, created_at, "
+    "focus_score, contrast_level, exposure_level, is_ml_ready, organoid_diameter, "
+    "organoid_shape_regularity, plate_id, analysis_mode, focus_method"
+)
+
+def rebuild_image_summary(conn):
+    """Recompute image_summary from the images table"""
+    conn.execute(text("DELETE FROM image_summary"))
+    conn.execute(text(f"""
+        INSERT INTO image_summary (day, experiment_id, operator_id, microscope_id, imaging_session_id,
+                                   n, ready, sum_focus, sum_contrast, sum_exposure,
+                                   n_focus, n_contrast, n_exposure)
+        SELECT {_SUMMARY_KEY.format(r="images")}, COUNT(*), SUM(COALESCE(is_ml_ready, 0)),
+               SUM(COALESCE(focus_score, 0)), SUM(COALESCE(contrast_level, 0)),
+               SUM(COALESCE(exposure_level, 0)),
+               COUNT(focus_score), COUNT(contrast_level), COUNT(exposure_level)
+        FROM images
+        GROUP BY 1, 2, 3, 4, 5
+    """))
+    conn.execute(text("""
+        INSERT INTO data_versions (experiment_id, version)
+        SELECT DISTINCT experiment_id, 1 FROM images WHERE true
+        ON CONFLICT (experiment_id) DO UPDATE SET version = version + 1
+    """))
+
+
+def _schema_version(conn, component: str) -> int:
+    return conn.execute(
+        text("SELECT version FROM schema_versions WHERE component = :c"), {"c": component}
+    ).scalar() or 0
+
+def _set_schema_version(conn, component: str, version: int):
+    conn.execute(text("""
+        INSERT INTO schema_versions (component, version) VALUES (:c, :v)
+        ON CONFLICT (component) DO UPDATE SET version = excluded.version
+    """), {"c": component, "v": version})
+
+
+# Bumped when metric_histograms' key or bins change (see _SUMMARY_VERSION)
+_HISTOGRAM_VERSION = 2
+
+_HISTOGRAM_KEY = (
+    "{r}.experiment_id, COALESCE({r}.imaging_session_id, ''), COALESCE({r}.microscope_id, '')"
+)
+
+def _histogram_focus_method(metric: str, row: str) -> str:
+    """Focus scores of different measures are on different scales and are binned
+    apart; the other metrics do not depend on the method ('').
+
+    Rows from before focus methods existed are Laplacian (the column default).
+    """
+    if metric != "focus":
+        return "''"
+    return f"COALESCE({row}.focus_method, 'laplacian')"
+
+def _histogram_delta(row: str, sign: str) -> str:
+    """Upserts adding (sign='+') or removing (sign='-') one images row from its histograms"""
+    statements = []
+    for metric, (column, *_) in HISTOGRAM_METRICS.items():
+        statements.append(f"""
+            INSERT INTO metric_histograms (
+                experiment_id, imaging_session_id, microscope_id, focus_method, metric, bin, n
+            )
+            SELECT {_HISTOGRAM_KEY.format(r=row)}, {_histogram_focus_method(metric, row)},
+                   '{metric}', {bin_sql(metric, row)}, {sign}1
+            WHERE {row}.{column} IS NOT NULL
+            ON CONFLICT (experiment_id, imaging_session_id, microscope_id, focus_method, metric, bin)
+            DO UPDATE SET n = n + excluded.n;
+        """)
+    return "".join(statements)
+
+def rebuild_metric_histograms(conn):
+    """Recompute metric_histograms from the images table"""
+    conn.execute(text("DELETE FROM metric_histograms"))
+    for metric, (column, *_) in HISTOGRAM_METRICS.items():
+        conn.execute(text(f"""
+            INSERT INTO metric_histograms (
+                experiment_id, imaging_session_id, microscope_id, focus_method, metric, bin, n
+            )
+            SELECT {_HISTOGRAM_KEY.format(r="images")}, {_histogram_focus_method(metric, "images")},
+                   '{metric}', {bin_sql(metric, "images")}, COUNT(*)
+            FROM images WHERE {column} IS NOT NULL
+            GROUP BY 1, 2, 3, 4, 6
+        """))
+
+
+def init_db(bind=None):
     """Initialize database schema"""
-    with engine.begin() as conn:
+    with (bind or engine).begin() as conn:
         conn.execute(text("""
             CREATE TABLE IF NOT EXISTS experiments (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -61,6 +224,74 @@ def init_db():
             )
         """))
 
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS threshold_profiles (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                experiment_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                focus_threshold REAL NOT NULL,
+                contrast_threshold REAL NOT NULL,
+                exposure_min REAL NOT NULL,
+                exposure_max REAL NOT NULL,
+                is_active BOOLEAN DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (experiment_id, name),
+                FOREIGN KEY (experiment_id) REFERENCES experiments(id)
+            )
+        """))
+        # Cached pass/fail of each image under each profile of its experiment
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS image_evaluations (
+                profile_id INTEGER NOT NULL,
+                image_id INTEGER NOT NULL,
+                is_ml_ready BOOLEAN NOT NULL,
+                quality_reason TEXT,
+                PRIMARY KEY (profile_id, image_id)
+            ) WITHOUT ROWID
+        """))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_evaluations_image ON image_evaluations(image_id)"
+        ))
+        # Compacted originals, shared by every image with the same content hash
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS archive_blobs (
+                content_hash TEXT PRIMARY KEY,
+                object_key TEXT NOT NULL,
+                codec TEXT NOT NULL,
+                original_size INTEGER NOT NULL,
+                stored_size INTEGER NOT NULL,
+                decode_ms_original REAL,
+                decode_ms_archived REAL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            ) WITHOUT ROWID
+        """))
+
+        # Resumable uploads: accepted chunks land in uploads/partial/<id>.<offset>.chunk
+        # and are assembled into partial/<id>.part at finalize
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS upload_sessions (
+                id TEXT PRIMARY KEY,
+                experiment_id INTEGER NOT NULL,
+                filename TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                received INTEGER NOT NULL DEFAULT 0,
+                checksum TEXT,
+                metadata TEXT NOT NULL,
+                image_id INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            ) WITHOUT ROWID
+        """))
+        # Responses of completed requests by Idempotency-Key (NULL while in progress)
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key TEXT PRIMARY KEY,
+                request TEXT NOT NULL,
+                response TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            ) WITHOUT ROWID
+        """))
+
         try:
             conn.execute(text("ALTER TABLE images ADD COLUMN file_path TEXT"))
         except:
@@ -70,6 +301,215 @@ def init_db():
             conn.execute(text("ALTER TABLE images ADD COLUMN thumbnail_path TEXT"))
         except:
             pass
+
+        try:
+            conn.execute(text("ALTER TABLE experiments ADD COLUMN focus_method TEXT DEFAULT 'laplacian'"))
+        except:
+            pass
+
+        try:
+            conn.execute(text("ALTER TABLE images ADD COLUMN focus_method TEXT DEFAULT 'laplacian'"))
+        except:
+            pass
+
+        # Resolution metrics were computed at (full, reduced, triage); rows
+        # analysed before modes existed were full resolution
+        for table in ("experiments", "images"):
+            try:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN analysis_mode TEXT DEFAULT 'full'"))
+            except:
+                pass
+
+        # Plate layout (target_well_id holds the canonical well id, e.g. 'B03')
+        for column, col_type in (
+            ("plate_id", "TEXT"), ("well_row", "INTEGER"), ("well_col", "INTEGER"),
+            ("field_index", "INTEGER"), ("z_index", "INTEGER")
+        ):
+            try:
+                conn.execute(text(f"ALTER TABLE images ADD COLUMN {column} {col_type}"))
+            except:
+                pass
+
+        # Perceptual hash, split into 16-bit bands for multi-index hamming lookup
+        for column in ("phash", "phash_b0", "phash_b1", "phash_b2", "phash_b3"):
+            try:
+                conn.execute(text(f"ALTER TABLE images ADD COLUMN {column} INTEGER"))
+            except:
+                pass
+
+        # SHA-256 of the uploaded bytes; file_path is NULL once archived
+        for column, col_type in (("content_hash", "TEXT"), ("archived_at", "TIMESTAMP")):
+            try:
+                conn.execute(text(f"ALTER TABLE images ADD COLUMN {column} {col_type}"))
+            except:
+                pass
+
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_images_experiment ON images(experiment_id)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_images_content_hash ON images(content_hash)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_images_plate_well "
+            "ON images(experiment_id, plate_id, well_row, well_col)"
+        ))
+        for band in range(4):
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS idx_images_phash_b{band} ON images(phash_b{band})"
+            ))
+        # Cross-experiment queries (services.query) filter on date and equipment
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_images_created ON images(created_at)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_images_operator ON images(operator_id, created_at)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_images_microscope ON images(microscope_id, created_at)"
+        ))
+
+        # Versions of derived tables, so each is rebuilt once when its
+        # definition changes rather than checked on every startup
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_versions (
+                component TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """))
+
+        # Per-day rollup of images for facility-wide queries, kept current by
+        # triggers; an experiment's data version changes whenever a query
+        # result over its images could
+        rebuild_summary = _schema_version(conn, "image_summary") < _SUMMARY_VERSION
+        if rebuild_summary:
+            for trigger in ("insert", "delete", "update"):
+                conn.execute(text(f"DROP TRIGGER IF EXISTS trg_images_summary_{trigger}"))
+            conn.execute(text("DROP TABLE IF EXISTS image_summary"))
+            conn.execute(text("DROP TABLE IF EXISTS data_version"))
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS image_summary (
+                day TEXT NOT NULL,
+                experiment_id INTEGER NOT NULL,
+                operator_id TEXT NOT NULL,
+                microscope_id TEXT NOT NULL,
+                imaging_session_id TEXT NOT NULL,
+                n INTEGER NOT NULL,
+                ready INTEGER NOT NULL,
+                sum_focus REAL NOT NULL,
+                sum_contrast REAL NOT NULL,
+                sum_exposure REAL NOT NULL,
+                n_focus INTEGER NOT NULL,
+                n_contrast INTEGER NOT NULL,
+                n_exposure INTEGER NOT NULL,
+                PRIMARY KEY (day, experiment_id, operator_id, microscope_id, imaging_session_id)
+            ) WITHOUT ROWID
+        """))
+        # Rows are only ever incremented, never deleted, so a sum of versions
+        # never repeats for different data
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS data_versions (
+                experiment_id INTEGER PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+        """))
+
+        drop_empty = (
+            "DELETE FROM image_summary WHERE n = 0 AND "
+            "(day, experiment_id, operator_id, microscope_id, imaging_session_id) = "
+            f"({_SUMMARY_KEY.format(r='OLD')});"
+        )
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_images_summary_insert AFTER INSERT ON images BEGIN
+                {_summary_delta("NEW", "")}
+                {_bump_version("NEW")}
+            END
+        """))
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_images_summary_delete AFTER DELETE ON images BEGIN
+                {_summary_delta("OLD", "-")}
+                {drop_empty}
+                {_bump_version("OLD")}
+            END
+        """))
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_images_summary_update
+            AFTER UPDATE OF {_QUERY_COLUMNS} ON images BEGIN
+                {_summary_delta("OLD", "-")}
+                {_summary_delta("NEW", "")}
+                {drop_empty}
+                {_bump_version("OLD")}
+                {_bump_version("NEW")}
+            END
+        """))
+
+        # Mergeable fixed-bin histograms per (experiment, session, microscope)
+        # of every metric in services.histograms.HISTOGRAM_METRICS, with
+        # focus scores further split by focus method
+        rebuild_histograms = _schema_version(conn, "metric_histograms") < _HISTOGRAM_VERSION
+        if rebuild_histograms:
+            for trigger in ("insert", "delete", "update"):
+                conn.execute(text(f"DROP TRIGGER IF EXISTS trg_images_histogram_{trigger}"))
+            conn.execute(text("DROP TABLE IF EXISTS metric_histograms"))
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS metric_histograms (
+                experiment_id INTEGER NOT NULL,
+                imaging_session_id TEXT NOT NULL,
+                microscope_id TEXT NOT NULL,
+                focus_method TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                bin INTEGER NOT NULL,
+                n INTEGER NOT NULL,
+                PRIMARY KEY (experiment_id, imaging_session_id, microscope_id, focus_method, metric, bin)
+            ) WITHOUT ROWID
+        """))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_histograms_microscope ON metric_histograms(microscope_id, metric)"
+        ))
+        drop_empty_bins = (
+            "DELETE FROM metric_histograms WHERE n = 0 AND experiment_id = OLD.experiment_id "
+            "AND imaging_session_id = COALESCE(OLD.imaging_session_id, '') "
+            "AND microscope_id = COALESCE(OLD.microscope_id, '');"
+        )
+        histogram_columns = ", ".join(
+            ["experiment_id", "imaging_session_id", "microscope_id", "focus_method"]
+            + [column for column, *_ in HISTOGRAM_METRICS.values()]
+        )
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_images_histogram_insert AFTER INSERT ON images BEGIN
+                {_histogram_delta("NEW", "")}
+            END
+        """))
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_images_histogram_delete AFTER DELETE ON images BEGIN
+                {_histogram_delta("OLD", "-")}
+                {drop_empty_bins}
+            END
+        """))
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_images_histogram_update
+            AFTER UPDATE OF {histogram_columns} ON images BEGIN
+                {_histogram_delta("OLD", "-")}
+                {_histogram_delta("NEW", "")}
+                {drop_empty_bins}
+            END
+        """))
+
+        # Databases created before the current rollup definition are backfilled once
+        if rebuild_summary:
+            rebuild_image_summary(conn)
+            _set_schema_version(conn, "image_summary", _SUMMARY_VERSION)
+            print("🔁 Rebuilt image summary")
+        if rebuild_histograms:
+            rebuild_metric_histograms(conn)
+            _set_schema_version(conn, "metric_histograms", _HISTOGRAM_VERSION)
+            print("🔁 Rebuilt metric histograms")
+
+        # Experiments created before profiles existed get their default profile
+        # here, so that reading the active profile never has to create it
+        created = backfill_default_profiles(conn)
+        if created:
+            print(f"🔁 Created default profiles for {created} experiments")
         
 def get_db():
     """Dependency for getting database session"""
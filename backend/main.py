@@ -1,14 +1,24 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from database import init_db
-from routes import experiments, images, batch, exports, debug
+from config import settings
+from services.storage import init_storage
+from services.archive import compaction_loop
+from routes import experiments, images, batch, exports, debug, maintenance, duplicates, profiles, plates, events, metrics, settings as settings_routes, query, uploads, distributions
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
+    init_storage()
     init_db()
+    compaction = None
+    if settings.archive_interval_hours > 0:
+        compaction = asyncio.create_task(compaction_loop(settings.archive_interval_hours))
     yield
+    if compaction:
+        compaction.cancel()
 
 app = FastAPI(
     title="OrganoidQC API",
@@ -32,6 +42,16 @@ app.include_router(images.router)
 app.include_router(batch.router)
 app.include_router(exports.router)
 app.include_router(debug.router)
+app.include_router(maintenance.router)
+app.include_router(duplicates.router)
+app.include_router(profiles.router)
+app.include_router(plates.router)
+app.include_router(events.router)
+app.include_router(metrics.router)
+app.include_router(settings_routes.router)
+app.include_router(query.router)
+app.include_router(uploads.router)
+app.include_router(distributions.router)
 
 @app.get("/health")
 def health_check():
@@ -1,27 +1,49 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import text
+from typing import Optional
 from database import get_db
-from services.analysis import calculate_batch_statistics, detect_equipment_issues
+from services.analysis import calculate_batch_statistics, detect_equipment_issues, determine_ml_readiness
+from services.profiles import get_profile
+from services.histograms import read_histograms, percentile
 
 router = APIRouter(prefix="/experiments", tags=["batch"])
 
 @router.get("/{exp_id}/batch-report")
 def get_batch_report(
     exp_id: int,
-    focus_threshold: float = 150,
-    contrast_threshold: float = 20,
-    exposure_min: float = 30,
-    exposure_max: float = 225,
+    focus_threshold: Optional[float] = None,
+    contrast_threshold: Optional[float] = None,
+    exposure_min: Optional[float] = None,
+    exposure_max: Optional[float] = None,
+    profile: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Get batch report with custom thresholds"""
+    """Get batch report for a threshold profile (active by default) or ad-hoc thresholds"""
+    selected = get_profile(db, exp_id, profile)
+    if not selected:
+        raise HTTPException(status_code=404, detail="Experiment or profile not found")
+
+    overrides = {
+        "focus_threshold": focus_threshold,
+        "contrast_threshold": contrast_threshold,
+        "exposure_min": exposure_min,
+        "exposure_max": exposure_max,
+    }
+    adhoc = any(v is not None for v in overrides.values())
+    thresholds = {
+        field: value if value is not None else getattr(selected, field)
+        for field, value in overrides.items()
+    }
+
+    # Cached evaluations serve profile reports; ad-hoc thresholds are evaluated inline
     images = db.execute(text("""
-        SELECT focus_score, contrast_level, exposure_level, 
-               imaging_session_id, is_ml_ready, quality_reason
-        FROM images 
-        WHERE experiment_id = :id
-    """), {"id": exp_id}).fetchall()
+        SELECT i.focus_score, i.contrast_level, i.exposure_level,
+               i.imaging_session_id, e.is_ml_ready, e.quality_reason
+        FROM images i
+        LEFT JOIN image_evaluations e ON e.image_id = i.id AND e.profile_id = :pid
+        WHERE i.experiment_id = :id
+    """), {"id": exp_id, "pid": selected.id}).fetchall()
 
     if not images:
         return {
@@ -40,29 +62,45 @@ def get_batch_report(
     avg_focus = sum(img.focus_score for img in images) / total if images else 0
     avg_contrast = sum(img.contrast_level for img in images) / total if images else 0
     avg_exposure = sum(img.exposure_level for img in images) / total if images else 0
+
+    def evaluate(img):
+        if not adhoc:
+            return bool(img.is_ml_ready), img.quality_reason
+        return determine_ml_readiness(
+            img.focus_score, img.contrast_level, img.exposure_level,
+            thresholds["focus_threshold"], thresholds["contrast_threshold"],
+            thresholds["exposure_min"], thresholds["exposure_max"]
+        )
+
+    verdicts = [evaluate(img) for img in images]
     
     # Count ML-ready
-    ml_ready = sum(1 for img in images if img.focus_score >= focus_threshold 
-                   and img.contrast_level >= contrast_threshold
-                   and exposure_min <= img.exposure_level <= exposure_max)
+    ml_ready = sum(1 for is_ready, _ in verdicts if is_ready)
     
     # Group by imaging session
     sessions = {}
-    for img in images:
+    for img, (is_ready, reason) in zip(images, verdicts):
         session = img.imaging_session_id or "unknown"
         if session not in sessions:
             sessions[session] = {"total": 0, "ready": 0, "issues": []}
         sessions[session]["total"] += 1
         
-        # Check if image passes thresholds
-        is_ready = (img.focus_score >= focus_threshold 
-                   and img.contrast_level >= contrast_threshold
-                   and exposure_min <= img.exposure_level <= exposure_max)
-        
         if is_ready:
             sessions[session]["ready"] += 1
         else:
-            sessions[session]["issues"].append(img.quality_reason or "unknown_issue")
+            sessions[session]["issues"].append(reason or "unknown_issue")
+
+    # Medians come from the persisted histograms (see /distributions); focus
+    # scores are binned under the experiment's focus method
+    focus_method = db.execute(
+        text("SELECT focus_method FROM experiments WHERE id = :id"), {"id": exp_id}
+    ).scalar()
+    histograms = read_histograms(
+        db, ("focus", "contrast", "exposure"), exp_id, focus_method=focus_method
+    )
+    medians = {
+        metric: percentile(metric, counts, 50) for metric, counts in histograms.items()
+    }
 
     return {
         "total_images": total,
@@ -71,10 +109,14 @@ def get_batch_report(
         "avg_focus": round(avg_focus, 2),
         "avg_contrast": round(avg_contrast, 2),
         "avg_exposure": round(avg_exposure, 2),
+        "median_focus": round(medians["focus"], 2) if medians["focus"] is not None else None,
+        "median_contrast": round(medians["contrast"], 2) if medians["contrast"] is not None else None,
+        "median_exposure": round(medians["exposure"], 2) if medians["exposure"] is not None else None,
+        "profile": None if adhoc else selected.name,
         "applied_thresholds": {
-            "focus": focus_threshold,
-            "contrast": contrast_threshold,
-            "exposure": f"{exposure_min}-{exposure_max}"
+            "focus": thresholds["focus_threshold"],
+            "contrast": thresholds["contrast_threshold"],
+            "exposure": f"{thresholds['exposure_min']}-{thresholds['exposure_max']}"
         },
         "sessions": sessions
     }
@@ -86,7 +128,7 @@ def get_images(exp_id: int, db: Session = Depends(get_db)):
         SELECT id, filename, focus_score, contrast_level, exposure_level,
                is_ml_ready, quality_reason, organoid_diameter,
                organoid_shape_regularity, imaging_session_id, microscope_id,
-               operator_id
+               operator_id, plate_id, target_well_id, analysis_mode
         FROM images
         WHERE experiment_id = :id
         ORDER BY created_at DESC
@@ -106,6 +148,9 @@ def get_images(exp_id: int, db: Session = Depends(get_db)):
             "imaging_session_id": img.imaging_session_id,
             "microscope_id": img.microscope_id,
             "operator_id": img.operator_id,
+            "plate_id": img.plate_id,
+            "well_id": img.target_well_id,
+            "analysis_mode": img.analysis_mode,
         }
         for img in images
     ]
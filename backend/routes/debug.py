@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, BackgroundTasks, Depends
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from database import get_db
 from pathlib import Path
+from services.cleanup import clear_all_images
 
 router = APIRouter(prefix="/debug", tags=["debug"])
 
@@ -10,7 +11,7 @@ router = APIRouter(prefix="/debug", tags=["debug"])
 def debug_image(image_id: int, db: Session = Depends(get_db)):
     """Debug endpoint to check image data"""
     image = db.execute(
-        text("SELECT id, filename, file_path, thumbnail_path FROM images WHERE id = :id"),
+        text("SELECT id, filename, file_path, thumbnail_path, content_hash FROM images WHERE id = :id"),
         {"id": image_id}
     ).first()
     
@@ -24,18 +25,16 @@ def debug_image(image_id: int, db: Session = Depends(get_db)):
         "filename": image.filename,
         "file_path": image.file_path,
         "file_exists": file_exists,
+        "archived": image.file_path is None and image.content_hash is not None,
+        "content_hash": image.content_hash,
         "abs_path": str(Path(image.file_path).absolute()) if image.file_path else None
     }
 
 @router.post("/clear-images")
-def clear_images(db: Session = Depends(get_db)):
-    """Clear all images - TEMPORARY (use with caution)"""
-    try:
-        db.execute(text("DELETE FROM images"))
-        db.commit()
-        return {"message": "All images cleared", "status": "success"}
-    except Exception as e:
-        return {"message": str(e), "status": "error"}
+def clear_images(background_tasks: BackgroundTasks):
+    """Clear all images and their files - TEMPORARY (use with caution)"""
+    background_tasks.add_task(clear_all_images)
+    return {"message": "Clearing all images in background", "status": "scheduled"}
 
 @router.get("/health")
 def health_check(db: Session = Depends(get_db)):
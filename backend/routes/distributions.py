@@ -0,0 +1,125 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from typing import Optional
+from database import get_db
+from config import DEFAULT_FOCUS_METHOD
+from services.profiles import get_profile
+from services.image_processing import validate_focus_method
+from services.histograms import (
+    HISTOGRAM_METRICS, DEFAULT_PERCENTILES, validate_metrics, read_histograms,
+    summarize, suggest_thresholds
+)
+
+router = APIRouter(tags=["distributions"])
+
+def _parse_percentiles(percentiles: Optional[str]) -> tuple:
+    if not percentiles:
+        return DEFAULT_PERCENTILES
+    try:
+        values = tuple(float(p) for p in percentiles.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="percentiles must be comma-separated numbers")
+    if not all(0 <= p <= 100 for p in values):
+        raise HTTPException(status_code=400, detail="percentiles must be between 0 and 100")
+    return values
+
+def _distributions(histograms: dict, percentiles: tuple, bins: bool) -> dict:
+    return {
+        metric: summarize(metric, counts, percentiles, bins)
+        for metric, counts in histograms.items()
+    }
+
+def _require_experiment(db, exp_id: int):
+    experiment = db.execute(
+        text("SELECT id, focus_method FROM experiments WHERE id = :id"), {"id": exp_id}
+    ).first()
+    if not experiment:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+    return experiment
+
+@router.get("/experiments/{exp_id}/distributions")
+def experiment_distributions(
+    exp_id: int,
+    metrics: Optional[str] = None,
+    session: Optional[str] = None,
+    microscope: Optional[str] = None,
+    percentiles: Optional[str] = None,
+    bins: bool = True,
+    db: Session = Depends(get_db)
+):
+    """Percentiles and histograms of focus, contrast, exposure, diameter and circularity.
+
+    Read from the persisted per-session histograms, so the cost does not
+    grow with the number of images. Log-binned metrics (focus, diameter)
+    are resolved to about 9% and 4%; linear ones to their bin width.
+    Focus scores are those of the experiment's focus method.
+    """
+    experiment = _require_experiment(db, exp_id)
+    focus_method = experiment.focus_method or DEFAULT_FOCUS_METHOD
+    selected = validate_metrics(metrics.split(",")) if metrics else list(HISTOGRAM_METRICS)
+    histograms = read_histograms(db, selected, exp_id, session, microscope, focus_method)
+    return {
+        "experiment_id": exp_id,
+        "session": session,
+        "microscope": microscope,
+        "focus_method": focus_method,
+        "metrics": _distributions(histograms, _parse_percentiles(percentiles), bins),
+    }
+
+@router.get("/experiments/{exp_id}/suggested-thresholds")
+def suggested_thresholds(
+    exp_id: int,
+    session: Optional[str] = None,
+    microscope: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Thresholds derived from the experiment's own metric distributions.
+
+    The result has the fields of a threshold profile, so with a name added
+    it can be posted to /experiments/{id}/profiles; the active profile is
+    included for comparison.
+    """
+    experiment = _require_experiment(db, exp_id)
+    active = get_profile(db, exp_id)
+    if not active:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+    histograms = read_histograms(
+        db, ("focus", "contrast", "exposure"), exp_id, session, microscope,
+        experiment.focus_method or DEFAULT_FOCUS_METHOD
+    )
+    suggested = suggest_thresholds(histograms)
+    if not suggested["sample_size"]:
+        raise HTTPException(status_code=404, detail="No images to derive thresholds from")
+    return {
+        **suggested,
+        "active_profile": {
+            "name": active.name,
+            "focus_threshold": active.focus_threshold,
+            "contrast_threshold": active.contrast_threshold,
+            "exposure_min": active.exposure_min,
+            "exposure_max": active.exposure_max,
+        },
+    }
+
+@router.get("/microscopes/{microscope_id}/distributions")
+def microscope_distributions(
+    microscope_id: str,
+    metrics: Optional[str] = None,
+    focus_method: str = DEFAULT_FOCUS_METHOD,
+    percentiles: Optional[str] = None,
+    bins: bool = True,
+    db: Session = Depends(get_db)
+):
+    """Metric distributions of one microscope across every experiment.
+
+    Focus scores are merged only across experiments using focus_method.
+    """
+    validate_focus_method(focus_method)
+    selected = validate_metrics(metrics.split(",")) if metrics else list(HISTOGRAM_METRICS)
+    histograms = read_histograms(db, selected, microscope=microscope_id, focus_method=focus_method)
+    return {
+        "microscope": microscope_id,
+        "focus_method": focus_method,
+        "metrics": _distributions(histograms, _parse_percentiles(percentiles), bins),
+    }
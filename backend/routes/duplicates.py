@@ -0,0 +1,67 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from database import get_db
+from config import DUPLICATE_MAX_DISTANCE
+from services.dedup import find_duplicate_groups, find_similar_images
+
+router = APIRouter(tags=["duplicates"])
+
+@router.get("/experiments/{exp_id}/duplicates")
+def experiment_duplicates(
+    exp_id: int,
+    max_distance: int = Query(DUPLICATE_MAX_DISTANCE, ge=0, le=32),
+    db: Session = Depends(get_db)
+):
+    """Group near-identical images within an experiment"""
+    rows = db.execute(text("""
+        SELECT id, filename, phash, focus_score
+        FROM images
+        WHERE experiment_id = :id AND phash IS NOT NULL
+    """), {"id": exp_id}).fetchall()
+
+    groups = find_duplicate_groups(rows, max_distance)
+    return {
+        "max_distance": max_distance,
+        "hashed_images": len(rows),
+        "duplicate_groups": len(groups),
+        "redundant_images": sum(len(g) - 1 for g in groups),
+        "groups": [
+            {
+                "keep_id": members[0].id,
+                "image_ids": [m.id for m in members],
+                "filenames": [m.filename for m in members]
+            }
+            for members in groups
+        ]
+    }
+
+@router.get("/images/{image_id}/similar")
+def similar_images(
+    image_id: int,
+    max_distance: int = Query(DUPLICATE_MAX_DISTANCE, ge=0, le=32),
+    scope: str = Query("experiment", pattern="^(experiment|archive)$"),
+    db: Session = Depends(get_db)
+):
+    """Find near-duplicates of an image in its experiment or across the archive"""
+    image = db.execute(
+        text("SELECT id, experiment_id, phash FROM images WHERE id = :id"),
+        {"id": image_id}
+    ).first()
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+    if image.phash is None:
+        raise HTTPException(status_code=409, detail="Image has no perceptual hash")
+
+    exp_id = image.experiment_id if scope == "experiment" else None
+    matches = find_similar_images(db, image.phash, max_distance, exp_id)
+    return [
+        {
+            "id": row.id,
+            "experiment_id": row.experiment_id,
+            "filename": row.filename,
+            "distance": distance
+        }
+        for distance, row in matches
+        if row.id != image_id
+    ]
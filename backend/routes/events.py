@@ -0,0 +1,29 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import text
+from typing import Optional
+from database import SessionLocal
+from services.events import bus
+
+router = APIRouter(prefix="/experiments", tags=["events"])
+
+@router.get("/{exp_id}/events")
+async def experiment_events(exp_id: int, request: Request, since: Optional[str] = None):
+    """Server-sent events: per-image results and summary deltas as they are committed.
+
+    Reconnecting clients resume via the Last-Event-ID header (or ?since=).
+    """
+    # Short-lived session: the stream itself must not hold a database connection
+    with SessionLocal() as db:
+        exists = db.execute(
+            text("SELECT id FROM experiments WHERE id = :id"), {"id": exp_id}
+        ).scalar()
+    if not exists:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+
+    last_event_id = request.headers.get("last-event-id") or since
+    return StreamingResponse(
+        bus.stream(exp_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
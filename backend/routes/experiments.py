@@ -1,39 +1,157 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from pydantic import BaseModel
+from typing import Optional
 from database import get_db
+from config import DEFAULT_FOCUS_METHOD, DEFAULT_ANALYSIS_MODE
+from services.image_processing import (
+    validate_focus_method, validate_analysis_mode, default_focus_threshold
+)
+from services.cleanup import delete_experiment_data
+from services.reanalysis import reanalyze_experiment, count_upgradable
+from services.events import bus
+from services.profiles import ensure_default_profile
 
 router = APIRouter(prefix="/experiments", tags=["experiments"])
 
 class ExperimentCreate(BaseModel):
     name: str
+    focus_method: str = DEFAULT_FOCUS_METHOD
+    analysis_mode: str = DEFAULT_ANALYSIS_MODE
+
+class ExperimentUpdate(BaseModel):
+    focus_method: Optional[str] = None
+    analysis_mode: Optional[str] = None
 
 @router.post("", status_code=status.HTTP_201_CREATED)
 def create_experiment(exp: ExperimentCreate, db: Session = Depends(get_db)):
     """Create a new experiment"""
+    validate_focus_method(exp.focus_method)
+    validate_analysis_mode(exp.analysis_mode)
     result = db.execute(
-        text("INSERT INTO experiments (name) VALUES (:name) RETURNING id"),
-        {"name": exp.name}
+        text("""
+            INSERT INTO experiments (name, focus_method, analysis_mode)
+            VALUES (:name, :method, :mode) RETURNING id
+        """),
+        {"name": exp.name, "method": exp.focus_method, "mode": exp.analysis_mode}
     )
     exp_id = result.scalar()
+    ensure_default_profile(db, exp_id, exp.focus_method)
+    db.commit()
+    return {
+        "id": exp_id, "name": exp.name,
+        "focus_method": exp.focus_method, "analysis_mode": exp.analysis_mode
+    }
+
+@router.patch("/{exp_id}")
+def update_experiment(exp_id: int, update: ExperimentUpdate, db: Session = Depends(get_db)):
+    """Change experiment settings; applies to images uploaded afterwards.
+
+    The focus method can only change while the experiment has no images:
+    scores of different measures are on different scales and cannot be
+    compared against one profile threshold.
+    """
+    if update.focus_method is not None:
+        validate_focus_method(update.focus_method)
+    if update.analysis_mode is not None:
+        validate_analysis_mode(update.analysis_mode)
+    current = db.execute(
+        text("SELECT focus_method FROM experiments WHERE id = :id"), {"id": exp_id}
+    ).first()
+    if not current:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+
+    if update.focus_method is not None and update.focus_method != current.focus_method:
+        has_images = db.execute(
+            text("SELECT 1 FROM images WHERE experiment_id = :id LIMIT 1"), {"id": exp_id}
+        ).scalar()
+        if has_images:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Cannot change the focus method of an experiment that has images; "
+                       "create a new experiment for the other focus measure"
+            )
+        # Profiles still at the old measure's default follow the new measure
+        db.execute(
+            text("""
+                UPDATE threshold_profiles SET focus_threshold = :new, updated_at = CURRENT_TIMESTAMP
+                WHERE experiment_id = :id AND focus_threshold = :old
+            """),
+            {
+                "id": exp_id,
+                "old": default_focus_threshold(current.focus_method),
+                "new": default_focus_threshold(update.focus_method),
+            }
+        )
+
+    db.execute(
+        text("""
+            UPDATE experiments
+            SET focus_method = COALESCE(:method, focus_method),
+                analysis_mode = COALESCE(:mode, analysis_mode)
+            WHERE id = :id
+        """),
+        {"method": update.focus_method, "mode": update.analysis_mode, "id": exp_id}
+    )
     db.commit()
-    return {"id": exp_id, "name": exp.name}
+
+    exp = db.execute(
+        text("SELECT id, name, focus_method, analysis_mode FROM experiments WHERE id = :id"),
+        {"id": exp_id}
+    ).first()
+    return {
+        "id": exp.id, "name": exp.name,
+        "focus_method": exp.focus_method, "analysis_mode": exp.analysis_mode
+    }
 
 @router.get("")
 def list_experiments(db: Session = Depends(get_db)):
     """List all experiments"""
     experiments = db.execute(
-        text("SELECT id, name, created_at FROM experiments ORDER BY created_at DESC")
+        text("""
+            SELECT id, name, focus_method, analysis_mode, created_at
+            FROM experiments ORDER BY created_at DESC
+        """)
     ).fetchall()
     return [
-        {"id": e.id, "name": e.name, "created_at": e.created_at}
+        {
+            "id": e.id, "name": e.name, "focus_method": e.focus_method,
+            "analysis_mode": e.analysis_mode, "created_at": e.created_at
+        }
         for e in experiments
     ]
 
-@router.delete("/{exp_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_experiment(exp_id: int, db: Session = Depends(get_db)):
-    """Delete experiment and associated images"""
-    db.execute(text("DELETE FROM images WHERE experiment_id = :id"), {"id": exp_id})
-    db.execute(text("DELETE FROM experiments WHERE id = :id"), {"id": exp_id})
-    db.commit()
\ No newline at end of file
+@router.delete("/{exp_id}", status_code=status.HTTP_202_ACCEPTED)
+def delete_experiment(
+    exp_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
+    """Delete experiment; images and files are removed in the background"""
+    result = db.execute(text("DELETE FROM experiments WHERE id = :id"), {"id": exp_id})
+    db.commit()
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+
+    bus.publish(exp_id, "experiment_deleted", {"id": exp_id})
+    background_tasks.add_task(delete_experiment_data, exp_id)
+    return {"id": exp_id, "status": "deletion_scheduled"}
+
+@router.post("/{exp_id}/reanalyze", status_code=status.HTTP_202_ACCEPTED)
+def reanalyze(
+    exp_id: int,
+    background_tasks: BackgroundTasks,
+    mode: str = "full",
+    db: Session = Depends(get_db)
+):
+    """Upgrade images analysed in a coarser mode (reduced/triage) to mode, in the background"""
+    validate_analysis_mode(mode)
+    exists = db.execute(text("SELECT id FROM experiments WHERE id = :id"), {"id": exp_id}).scalar()
+    if not exists:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+
+    pending = count_upgradable(db, exp_id, mode)
+    if pending:
+        background_tasks.add_task(reanalyze_experiment, exp_id, mode)
+    return {"id": exp_id, "mode": mode, "images": pending, "status": "scheduled" if pending else "up_to_date"}
@@ -1,7 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from database import get_db
+from config import DUPLICATE_MAX_DISTANCE
+from services.dedup import find_duplicate_groups
+from services.analysis import determine_ml_readiness
+from services.profiles import get_profile
+from typing import Optional
 from datetime import datetime
 import csv
 from io import StringIO
@@ -9,23 +14,44 @@ from io import StringIO
 router = APIRouter(prefix="/experiments", tags=["exports"])
 
 @router.get("/{exp_id}/export-ml-ready")
-def export_ml_ready(exp_id: int, db: Session = Depends(get_db)):
-    """Export metadata for ML-ready images"""
+def export_ml_ready(
+    exp_id: int,
+    profile: Optional[str] = None,
+    dedupe: bool = False,
+    max_distance: int = Query(DUPLICATE_MAX_DISTANCE, ge=0, le=32),
+    db: Session = Depends(get_db)
+):
+    """Export metadata for images passing a profile (active by default), optionally dropping near-duplicates"""
+    selected = get_profile(db, exp_id, profile)
+    if not selected:
+        raise HTTPException(status_code=404, detail="Experiment or profile not found")
+
     images = db.execute(
         text("""
-            SELECT id, filename, focus_score, contrast_level, exposure_level,
-                   organoid_diameter, organoid_shape_regularity,
-                   imaging_session_id, microscope_id
-            FROM images
-            WHERE experiment_id = :id AND is_ml_ready = 1
-            ORDER BY focus_score DESC
+            SELECT i.id, i.filename, i.focus_score, i.contrast_level, i.exposure_level,
+                   i.organoid_diameter, i.organoid_shape_regularity,
+                   i.imaging_session_id, i.microscope_id, i.phash
+            FROM images i
+            JOIN image_evaluations e ON e.image_id = i.id AND e.profile_id = :pid
+            WHERE i.experiment_id = :id AND e.is_ml_ready = 1
+            ORDER BY i.focus_score DESC
         """),
-        {"id": exp_id}
+        {"id": exp_id, "pid": selected.id}
     ).fetchall()
 
     if not images:
         raise HTTPException(status_code=404, detail="No ML-ready images")
 
+    removed_duplicates = 0
+    if dedupe:
+        redundant = {
+            member.id
+            for members in find_duplicate_groups(images, max_distance)
+            for member in members[1:]
+        }
+        images = [img for img in images if img.id not in redundant]
+        removed_duplicates = len(redundant)
+
     output = StringIO()
     writer = csv.writer(output)
     writer.writerow([
@@ -44,6 +70,8 @@ def export_ml_ready(exp_id: int, db: Session = Depends(get_db)):
     return {
         "csv": output.getvalue(),
         "ml_ready_count": len(images),
+        "profile": selected.name,
+        "removed_duplicates": removed_duplicates,
         "filename": f"ml_ready_images_{exp_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
     }
 
@@ -93,32 +121,44 @@ def export_all(exp_id: int, db: Session = Depends(get_db)):
 @router.get("/{exp_id}/generate-copy-script")
 def generate_copy_script(
     exp_id: int,
-    focus_threshold: float = 150,
-    contrast_threshold: float = 20,
-    exposure_min: float = 30,
-    exposure_max: float = 225,
+    focus_threshold: Optional[float] = None,
+    contrast_threshold: Optional[float] = None,
+    exposure_min: Optional[float] = None,
+    exposure_max: Optional[float] = None,
+    profile: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
     """Generate Python script to organize ML-ready images locally"""
+    selected = get_profile(db, exp_id, profile)
+    if not selected:
+        raise HTTPException(status_code=404, detail="Experiment or profile not found")
+
+    adhoc = any(v is not None for v in (focus_threshold, contrast_threshold, exposure_min, exposure_max))
+    focus_threshold = selected.focus_threshold if focus_threshold is None else focus_threshold
+    contrast_threshold = selected.contrast_threshold if contrast_threshold is None else contrast_threshold
+    exposure_min = selected.exposure_min if exposure_min is None else exposure_min
+    exposure_max = selected.exposure_max if exposure_max is None else exposure_max
+
     images = db.execute(text("""
-        SELECT filename, focus_score, contrast_level, exposure_level
-        FROM images 
-        WHERE experiment_id = :id
-        ORDER BY focus_score DESC
-    """), {"id": exp_id}).fetchall()
+        SELECT i.filename, i.focus_score, i.contrast_level, i.exposure_level, e.is_ml_ready
+        FROM images i
+        LEFT JOIN image_evaluations e ON e.image_id = i.id AND e.profile_id = :pid
+        WHERE i.experiment_id = :id
+        ORDER BY i.focus_score DESC
+    """), {"id": exp_id, "pid": selected.id}).fetchall()
     
-    # Filter ML-ready
+    # Filter ML-ready (cached profile evaluations unless thresholds were overridden)
     ml_ready_files = []
     for img in images:
-        issues = []
-        if img.focus_score < focus_threshold:
-            issues.append("focus_too_low")
-        if img.contrast_level < contrast_threshold:
-            issues.append("contrast_too_low")
-        if img.exposure_level < exposure_min or img.exposure_level > exposure_max:
-            issues.append("exposure_problem")
+        if adhoc:
+            is_ready, _ = determine_ml_readiness(
+                img.focus_score, img.contrast_level, img.exposure_level,
+                focus_threshold, contrast_threshold, exposure_min, exposure_max
+            )
+        else:
+            is_ready = bool(img.is_ml_ready)
         
-        if not issues:
+        if is_ready:
             ml_ready_files.append(img.filename)
     
     script = f"""#!/usr/bin/env python3
@@ -1,17 +1,16 @@
-from fastapi import APIRouter, File, UploadFile, Depends, HTTPException, status, Form
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, File, UploadFile, Depends, HTTPException, status, Form, Header
+from fastapi.responses import FileResponse, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from datetime import datetime
 from pathlib import Path
 from database import get_db
-from config import ALLOWED_FORMATS
-from services.image_processing import (
-    compute_focus_score, compute_contrast_level, compute_exposure_level,
-    estimate_organoid_properties, get_image_dimensions, create_thumbnail
+from services.image_processing import FOCUS_METHODS, default_focus_threshold
+from services.storage import thumbnail_media_type, content_digest
+from services.archive import archived_original
+from services.ingest import (
+    ingest_image, check_upload_format, check_well_id, get_upload_experiment,
+    claim_idempotency_key, release_idempotency_key
 )
-from services.storage import save_image_file, save_thumbnail_file
-from services.analysis import determine_ml_readiness
 
 router = APIRouter(tags=["images"])
 
@@ -22,102 +21,85 @@ async def upload_img(
     imaging_session_id: str = Form(...),  
     microscope_id: str = Form(...),       
     operator_id: str = Form(None),       
+    plate_id: str = Form(None),
+    well_id: str = Form(None),
+    field_index: int = Form(None),
+    z_index: int = Form(None),
+    analysis_mode: str = Form(None),
+    idempotency_key: str = Header(None),
     db: Session = Depends(get_db)
 ):
-    """Upload and process microscopy image"""
+    """Upload and process microscopy image.
+
+    analysis_mode (full, reduced, triage) overrides the experiment's mode
+    for this upload; reduced modes can be upgraded later via reanalyze.
+    A retry with the same Idempotency-Key header returns the first
+    response instead of analysing and inserting the image again.
+    """
     print(f"📨 Received file: {file.filename}")  
     print(f"   Size: {file.size if file.size else 'unknown'}")
     print(f"   Content-type: {file.content_type}")
     
-    if not file.filename.lower().endswith(ALLOWED_FORMATS):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Supported formats: {', '.join(ALLOWED_FORMATS)}"
-        )
-    
-    exp_check = db.execute(
-        text("SELECT id FROM experiments WHERE id = :id"),
-        {"id": experiment_id}
-    ).scalar()
-    if not exp_check:
-        raise HTTPException(status_code=404, detail="Experiment not found")
+    check_upload_format(file.filename)
+    check_well_id(well_id)
+    experiment = get_upload_experiment(db, experiment_id)
 
     contents = await file.read()
-    
-    # Compute metrics
-    focus = compute_focus_score(contents)
-    contrast = compute_contrast_level(contents)
-    exposure = compute_exposure_level(contents)
-    width, height = get_image_dimensions(contents)
-    diameter, circularity = estimate_organoid_properties(contents)
-    is_ml_ready, quality_reason = determine_ml_readiness(focus, contrast, exposure)
+    metadata = {
+        "imaging_session_id": imaging_session_id,
+        "microscope_id": microscope_id,
+        "operator_id": operator_id,
+        "plate_id": plate_id,
+        "well_id": well_id,
+        "field_index": field_index,
+        "z_index": z_index,
+        "analysis_mode": analysis_mode,
+    }
 
-    # Save files
-    original_path = save_image_file(experiment_id, file.filename, contents)
-    thumb_bytes = create_thumbnail(contents)
-    thumb_path = save_thumbnail_file(experiment_id, file.filename, thumb_bytes)
+    digest = content_digest(contents)
+    if idempotency_key:
+        request = f"upload:{experiment_id}:{file.filename}:{digest}"
+        stored = claim_idempotency_key(db, idempotency_key, request)
+        if stored is not None:
+            print(f"↩️ Idempotent replay of image {stored['id']}")
+            return stored
+    try:
+        return await ingest_image(
+            db, experiment, file.filename, contents, metadata, idempotency_key, digest=digest
+        )
+    except BaseException:
+        if idempotency_key:
+            release_idempotency_key(db, idempotency_key)
+        raise
 
-    # Save to database
-    result = db.execute(
-        text("""
-            INSERT INTO images (
-                experiment_id, filename, focus_score, contrast_level,
-                exposure_level, is_ml_ready, quality_reason, organoid_diameter,
-                organoid_shape_regularity, imaging_session_id, microscope_id,
-                operator_id, acquisition_time, width, height, file_path, thumbnail_path
-            )
-            VALUES (
-                :exp_id, :fname, :focus, :contrast, :exposure, :ml_ready,
-                :reason, :diameter, :circularity, :session_id, :micro_id,
-                :op_id, :acq_time, :width, :height, :file_path, :thumb_path
-            )
-            RETURNING id
-        """),
-        {
-            "exp_id": experiment_id,
-            "fname": file.filename,
-            "focus": focus,
-            "contrast": contrast,
-            "exposure": exposure,
-            "ml_ready": is_ml_ready,
-            "reason": quality_reason,
-            "diameter": diameter,
-            "circularity": circularity,
-            "session_id": imaging_session_id,
-            "micro_id": microscope_id,
-            "op_id": operator_id,
-            "acq_time": datetime.now(),
-            "width": width,
-            "height": height,
-            "file_path": str(original_path),
-            "thumb_path": str(thumb_path) if thumb_path else None
-        }
-    )
-    
-    image_id = result.scalar()
-    db.commit()
+@router.get("/focus-methods")
+def list_focus_methods():
+    """List selectable focus measures with the default focus threshold of each"""
+    return [
+        {"name": name, "description": func.__doc__, "default_threshold": default_focus_threshold(name)}
+        for name, func in FOCUS_METHODS.items()
+    ]
 
-    return {
-        "id": image_id,
-        "focus_score": round(focus, 2),
-        "contrast_level": round(contrast, 2),
-        "exposure_level": round(exposure, 2),
-        "is_ml_ready": is_ml_ready,
-        "quality_reason": quality_reason,
-        "organoid_diameter": round(diameter, 2) if diameter else None,
-        "organoid_circularity": round(circularity, 2) if circularity else None,
-        "dimensions": {"width": width, "height": height}
-    }
 @router.get("/images/{image_id}")
 def get_image(image_id: int, db: Session = Depends(get_db)):
-    """Get full image as file"""
+    """Get full image as file (archived originals are streamed or inflated on demand)"""
     print(f"\n🔍 GET /images/{image_id} called") 
     try:
         image = db.execute(
-            text("SELECT file_path FROM images WHERE id = :id"),
+            text("SELECT id, filename, file_path, content_hash FROM images WHERE id = :id"),
             {"id": image_id}
         ).first()
-        
+
+        if image and not image.file_path and image.content_hash:
+            try:
+                kind, source, media_type = archived_original(db, image)
+            except FileNotFoundError:
+                raise HTTPException(status_code=404, detail="Archived original not found")
+            print(f"✓ Serving archived original ({kind})\n")
+            if kind == "file":
+                return FileResponse(str(source), media_type=media_type)
+            return Response(content=source, media_type=media_type or "application/octet-stream")
+
         if not image or not image.file_path:
             print(f"❌ Image {image_id} not found in DB")  
             raise HTTPException(status_code=404, detail="Image not found")
@@ -165,4 +147,4 @@ def get_thumbnail(image_id: int, db: Session = Depends(get_db)):
     if not thumb_path.exists():
         raise HTTPException(status_code=404, detail="File not found")
     
-    return FileResponse(str(thumb_path), media_type="image/jpeg")
\ No newline at end of file
+    return FileResponse(str(thumb_path), media_type=thumbnail_media_type(thumb_path))
\ No newline at end of file
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, BackgroundTasks, Depends, status
+from sqlalchemy.orm import Session
+from typing import Optional
+from database import get_db
+from services.cleanup import collect_orphan_files
+from services.archive import compact_originals, archive_report
+
+router = APIRouter(prefix="/maintenance", tags=["maintenance"])
+
+@router.post("/collect-orphans")
+def collect_orphans(dry_run: bool = False):
+    """Delete upload files no image references and report reclaimed bytes"""
+    return collect_orphan_files(dry_run=dry_run)
+
+@router.post("/compact-originals", status_code=status.HTTP_202_ACCEPTED)
+def compact(
+    background_tasks: BackgroundTasks,
+    min_age_days: Optional[float] = None,
+    dry_run: bool = False
+):
+    """Archive originals older than min_age_days (default from settings).
+
+    dry_run computes the encodings and returns the estimated savings
+    without writing; otherwise compaction runs in the background.
+    """
+    if dry_run:
+        return compact_originals(min_age_days, dry_run=True)
+    background_tasks.add_task(compact_originals, min_age_days)
+    return {"status": "scheduled", "min_age_days": min_age_days}
+
+@router.get("/archive-report")
+def get_archive_report(db: Session = Depends(get_db)):
+    """Bytes saved by the archive tier, decode latency per codec and hot-cache stats"""
+    return archive_report(db)
@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from typing import Optional
+from database import get_db
+from config import settings
+from services.columnar import (
+    METRIC_COLUMNS, DEFAULT_COLUMNS, read_metric_columns, encode_raw, encode_arrow
+)
+
+router = APIRouter(prefix="/experiments", tags=["metrics"])
+
+@router.get("/{exp_id}/metrics")
+def get_metric_columns(
+    exp_id: int,
+    columns: Optional[str] = None,
+    format: str = Query("raw", pattern="^(raw|arrow)$"),
+    db: Session = Depends(get_db)
+):
+    """Metric columns for client-side analytics as typed arrays.
+
+    format=raw: uint32 header length, JSON header (count, column offsets and
+    dtypes, session names), then little-endian column buffers aligned to 8 bytes.
+    format=arrow: Arrow IPC stream (requires pyarrow on the server).
+    """
+    selected = tuple(c.strip() for c in columns.split(",")) if columns else DEFAULT_COLUMNS
+    unknown = [c for c in selected if c not in METRIC_COLUMNS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown columns: {', '.join(unknown)}. Available: {', '.join(METRIC_COLUMNS)}"
+        )
+
+    exists = db.execute(
+        text("SELECT id FROM experiments WHERE id = :id"), {"id": exp_id}
+    ).scalar()
+    if not exists:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+
+    arrays, sessions = read_metric_columns(db, exp_id, selected, settings.export_batch_size)
+
+    if format == "arrow":
+        try:
+            content = encode_arrow(arrays, sessions)
+        except ImportError:
+            raise HTTPException(status_code=406, detail="Arrow output requires pyarrow on the server")
+        media_type = "application/vnd.apache.arrow.stream"
+    else:
+        content = encode_raw(arrays, sessions)
+        media_type = "application/octet-stream"
+
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={"X-Row-Count": str(len(arrays[selected[0]]))}
+    )
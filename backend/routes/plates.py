@@ -0,0 +1,101 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from typing import Optional
+from database import get_db
+from services.plate import PLATE_LAYOUTS, layout_for, row_index_to_label
+from services.lazy_imports import np
+
+router = APIRouter(prefix="/experiments", tags=["plates"])
+
+# Aggregates computed per well in SQL; keys are the allowed `metric` values
+PLATE_METRICS = {
+    "focus_score": "AVG(focus_score)",
+    "contrast_level": "AVG(contrast_level)",
+    "exposure_level": "AVG(exposure_level)",
+    "organoid_diameter": "AVG(organoid_diameter)",
+    "organoid_shape_regularity": "AVG(organoid_shape_regularity)",
+    "pass_rate": "100.0 * AVG(is_ml_ready)",
+    "count": "COUNT(*)",
+}
+
+@router.get("/{exp_id}/plate-map")
+def plate_map(
+    exp_id: int,
+    plate: Optional[str] = None,
+    metric: str = Query("focus_score", pattern=f"^({'|'.join(PLATE_METRICS)})$"),
+    layout: Optional[int] = None,
+    format: str = Query("json", pattern="^(json|binary)$"),
+    db: Session = Depends(get_db)
+):
+    """Per-well aggregate of one metric as a dense row-major array.
+
+    format=binary returns little-endian float32 values (NaN = empty well)
+    followed by uint32 image counts, rows x cols each.
+    """
+    if layout is not None and layout not in PLATE_LAYOUTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported layout. Available: {', '.join(map(str, PLATE_LAYOUTS))}"
+        )
+
+    if plate == "":
+        # ?plate= selects images without a plate id
+        plate = None
+    elif plate is None:
+        plates = db.execute(text("""
+            SELECT DISTINCT plate_id FROM images
+            WHERE experiment_id = :id AND well_row IS NOT NULL
+        """), {"id": exp_id}).scalars().all()
+        if len(plates) > 1:
+            names = ", ".join(p if p else "(empty)" for p in plates)
+            raise HTTPException(
+                status_code=400,
+                detail=f"Experiment has several plates, pass ?plate= one of: {names}"
+            )
+        plate = plates[0] if plates else None
+
+    wells = db.execute(text(f"""
+        SELECT well_row, well_col, COUNT(*) AS n, {PLATE_METRICS[metric]} AS value
+        FROM images
+        WHERE experiment_id = :id AND plate_id IS :plate AND well_row IS NOT NULL
+        GROUP BY well_row, well_col
+    """), {"id": exp_id, "plate": plate}).fetchall()
+
+    if not wells:
+        raise HTTPException(status_code=404, detail="No images with well positions")
+
+    if layout is not None:
+        rows, cols = PLATE_LAYOUTS[layout]
+    else:
+        rows, cols = layout_for(max(w.well_row for w in wells), max(w.well_col for w in wells))
+
+    values = np.full(rows * cols, np.nan, dtype="<f4")
+    counts = np.zeros(rows * cols, dtype="<u4")
+    for w in wells:
+        if 0 <= w.well_row < rows and 0 <= w.well_col < cols:
+            idx = w.well_row * cols + w.well_col
+            values[idx] = w.value if w.value is not None else np.nan
+            counts[idx] = w.n
+
+    if format == "binary":
+        return Response(
+            content=values.tobytes() + counts.tobytes(),
+            media_type="application/octet-stream",
+            headers={
+                "X-Plate-Rows": str(rows),
+                "X-Plate-Cols": str(cols),
+                "X-Plate-Id": str(plate) if plate is not None else "",
+                "X-Metric": metric,
+            }
+        )
+
+    return {
+        "plate_id": plate,
+        "metric": metric,
+        "rows": rows,
+        "cols": cols,
+        "row_labels": [row_index_to_label(r) for r in range(rows)],
+        "values": [None if np.isnan(v) else round(float(v), 2) for v in values],
+        "counts": counts.tolist(),
+    }
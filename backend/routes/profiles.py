@@ -0,0 +1,100 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from pydantic import BaseModel
+from typing import Optional
+from database import get_db
+from config import DEFAULT_CONTRAST_THRESHOLD, DEFAULT_EXPOSURE_MIN, DEFAULT_EXPOSURE_MAX
+from services.events import bus
+from services.image_processing import default_focus_threshold
+from services.profiles import (
+    list_profiles, get_profile, create_profile, update_profile,
+    activate_profile, delete_profile
+)
+
+router = APIRouter(prefix="/experiments", tags=["profiles"])
+
+class ProfileCreate(BaseModel):
+    name: str
+    focus_threshold: Optional[float] = None  # default depends on the experiment's focus method
+    contrast_threshold: float = DEFAULT_CONTRAST_THRESHOLD
+    exposure_min: float = DEFAULT_EXPOSURE_MIN
+    exposure_max: float = DEFAULT_EXPOSURE_MAX
+    activate: bool = False
+
+class ProfileUpdate(BaseModel):
+    focus_threshold: Optional[float] = None
+    contrast_threshold: Optional[float] = None
+    exposure_min: Optional[float] = None
+    exposure_max: Optional[float] = None
+
+def _serialize(profile) -> dict:
+    return {
+        "id": profile.id,
+        "name": profile.name,
+        "focus_threshold": profile.focus_threshold,
+        "contrast_threshold": profile.contrast_threshold,
+        "exposure_min": profile.exposure_min,
+        "exposure_max": profile.exposure_max,
+        "is_active": bool(profile.is_active),
+        "updated_at": profile.updated_at
+    }
+
+def _require_experiment(db: Session, exp_id: int):
+    experiment = db.execute(
+        text("SELECT id, focus_method FROM experiments WHERE id = :id"), {"id": exp_id}
+    ).first()
+    if not experiment:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+    return experiment
+
+def _require_profile(db: Session, exp_id: int, name: str):
+    profile = get_profile(db, exp_id, name)
+    if not profile:
+        raise HTTPException(status_code=404, detail=f"Profile '{name}' not found")
+    return profile
+
+@router.get("/{exp_id}/profiles")
+def get_profiles(exp_id: int, db: Session = Depends(get_db)):
+    """List threshold profiles"""
+    _require_experiment(db, exp_id)
+    return [_serialize(p) for p in list_profiles(db, exp_id)]
+
+@router.post("/{exp_id}/profiles", status_code=status.HTTP_201_CREATED)
+def add_profile(exp_id: int, body: ProfileCreate, db: Session = Depends(get_db)):
+    """Create a named threshold profile"""
+    experiment = _require_experiment(db, exp_id)
+    if get_profile(db, exp_id, body.name):
+        raise HTTPException(status_code=409, detail=f"Profile '{body.name}' already exists")
+
+    thresholds = body.model_dump(exclude={"name", "activate"})
+    if thresholds["focus_threshold"] is None:
+        thresholds["focus_threshold"] = default_focus_threshold(experiment.focus_method)
+    profile = create_profile(db, exp_id, body.name, thresholds, body.activate)
+    bus.publish(exp_id, "profile_changed", {"profile": profile.name, "is_active": bool(profile.is_active)})
+    return _serialize(profile)
+
+@router.put("/{exp_id}/profiles/{name}")
+def edit_profile(exp_id: int, name: str, body: ProfileUpdate, db: Session = Depends(get_db)):
+    """Update thresholds; only images near the changed bounds are re-evaluated"""
+    profile = _require_profile(db, exp_id, name)
+    recomputed = update_profile(db, profile, body.model_dump(exclude_none=True))
+    bus.publish(exp_id, "profile_changed", {"profile": name, "is_active": bool(profile.is_active)})
+    return {**_serialize(_require_profile(db, exp_id, name)), "recomputed_images": recomputed}
+
+@router.post("/{exp_id}/profiles/{name}/activate")
+def set_active_profile(exp_id: int, name: str, db: Session = Depends(get_db)):
+    """Use this profile for ingest, exports and stored is_ml_ready"""
+    profile = _require_profile(db, exp_id, name)
+    changed = activate_profile(db, exp_id, profile.id)
+    db.commit()
+    bus.publish(exp_id, "profile_changed", {"profile": name, "is_active": True})
+    return {**_serialize(_require_profile(db, exp_id, name)), "changed_images": changed}
+
+@router.delete("/{exp_id}/profiles/{name}", status_code=status.HTTP_204_NO_CONTENT)
+def remove_profile(exp_id: int, name: str, db: Session = Depends(get_db)):
+    """Delete a profile (the active profile cannot be deleted)"""
+    profile = _require_profile(db, exp_id, name)
+    if profile.is_active:
+        raise HTTPException(status_code=409, detail="Cannot delete the active profile")
+    delete_profile(db, profile)
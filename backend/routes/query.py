@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from database import get_db
+from services.query import parse_query, run_query, query_cache
+
+router = APIRouter(prefix="/query", tags=["query"])
+
+@router.get("/images")
+def query_images(
+    group_by: Optional[str] = None,
+    metrics: Optional[str] = None,
+    experiment: Optional[str] = None,
+    operator: Optional[str] = None,
+    microscope: Optional[str] = None,
+    session: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    filter: List[str] = Query([]),
+    order_by: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db)
+):
+    """Aggregate QC metrics over the images of all experiments.
+
+    group_by: comma-separated experiment, operator, microscope, session,
+    day, week, month, plate, analysis_mode, focus_method.
+    metrics: count, ready, pass_rate, avg_focus, avg_contrast, avg_exposure.
+    experiment/operator/microscope/session: comma-separated values to keep.
+    since/until: inclusive upload dates (YYYY-MM-DD).
+    filter: repeatable per-image condition, e.g. filter=focus>=150.
+    """
+    spec = parse_query(
+        group_by=group_by,
+        metrics=metrics,
+        filters={"experiment": experiment, "operator": operator,
+                 "microscope": microscope, "session": session},
+        metric_filters=filter,
+        since=since,
+        until=until,
+        order_by=order_by,
+        limit=limit,
+    )
+    return run_query(db, spec)
+
+@router.get("/cache")
+def query_cache_stats():
+    """Result cache occupancy and hit counts"""
+    return query_cache.stats()
@@ -0,0 +1,9 @@
+from fastapi import APIRouter
+from config import settings
+
+router = APIRouter(tags=["config"])
+
+@router.get("/config")
+def get_config():
+    """Effective settings after defaults, config file and ORGANOIDQC_* overrides"""
+    return settings.public_dict()
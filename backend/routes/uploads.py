@@ -0,0 +1,131 @@
+from fastapi import APIRouter, Depends, HTTPException, Header, Request, Response, status
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from typing import Optional
+from database import get_db
+from config import settings
+from services.image_processing import validate_analysis_mode
+from services.ingest import (
+    UPLOAD_METADATA, check_upload_format, check_well_id, get_upload_experiment,
+    claim_idempotency_key, complete_idempotency_key, release_idempotency_key
+)
+from services.uploads import (
+    create_upload_session, get_upload_session, append_chunk, finalize_upload, abort_upload
+)
+
+router = APIRouter(tags=["uploads"])
+
+class UploadCreate(BaseModel):
+    filename: str
+    size: int
+    imaging_session_id: str
+    microscope_id: str
+    operator_id: Optional[str] = None
+    plate_id: Optional[str] = None
+    well_id: Optional[str] = None
+    field_index: Optional[int] = None
+    z_index: Optional[int] = None
+    analysis_mode: Optional[str] = None
+    sha256: Optional[str] = None
+
+def _offset_headers(session) -> dict:
+    return {
+        "Upload-Offset": str(session.received),
+        "Upload-Length": str(session.size),
+        "Cache-Control": "no-store",
+    }
+
+@router.post("/experiments/{exp_id}/uploads", status_code=status.HTTP_201_CREATED)
+def create_upload(
+    exp_id: int,
+    upload: UploadCreate,
+    response: Response,
+    idempotency_key: str = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Start a resumable upload; send the bytes with PATCH /uploads/{id}.
+
+    Metadata fields are the same as for POST /upload/{exp_id}. sha256, if
+    given, is checked against the assembled file at finalize.
+    """
+    check_upload_format(upload.filename)
+    get_upload_experiment(db, exp_id)
+    if not 0 < upload.size <= settings.upload_max_size_mb * 1024 * 1024:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Upload size must be between 1 byte and {settings.upload_max_size_mb} MB"
+        )
+    if upload.analysis_mode:
+        validate_analysis_mode(upload.analysis_mode)
+    check_well_id(upload.well_id)
+
+    if idempotency_key:
+        checksum = (upload.sha256 or "").lower()
+        request = f"create-upload:{exp_id}:{upload.filename}:{upload.size}:{checksum}"
+        stored = claim_idempotency_key(db, idempotency_key, request)
+        if stored is not None:
+            response.headers["Location"] = f"/uploads/{stored['upload_id']}"
+            return stored
+
+    try:
+        metadata = {field: getattr(upload, field) for field in UPLOAD_METADATA}
+        upload_id = create_upload_session(db, exp_id, upload.filename, upload.size, metadata, upload.sha256)
+        result = {
+            "upload_id": upload_id,
+            "offset": 0,
+            "size": upload.size,
+            "max_chunk_bytes": settings.upload_chunk_max_mb * 1024 * 1024,
+        }
+        if idempotency_key:
+            complete_idempotency_key(db, idempotency_key, result)
+        db.commit()
+    except BaseException:
+        if idempotency_key:
+            release_idempotency_key(db, idempotency_key)
+        raise
+
+    print(f"📨 Upload session {upload_id}: {upload.filename}, {upload.size} bytes")
+    response.headers["Location"] = f"/uploads/{upload_id}"
+    return result
+
+@router.head("/uploads/{upload_id}")
+def upload_offset(upload_id: str, db: Session = Depends(get_db)):
+    """Bytes received so far, in the Upload-Offset header"""
+    session = get_upload_session(db, upload_id)
+    return Response(status_code=status.HTTP_200_OK, headers=_offset_headers(session))
+
+@router.get("/uploads/{upload_id}")
+def upload_status(upload_id: str, db: Session = Depends(get_db)):
+    """Progress of an upload session"""
+    session = get_upload_session(db, upload_id)
+    return {
+        "upload_id": session.id,
+        "experiment_id": session.experiment_id,
+        "filename": session.filename,
+        "offset": session.received,
+        "size": session.size,
+        "image_id": session.image_id,
+        "status": "finalized" if session.image_id is not None
+                  else "complete" if session.received == session.size else "uploading",
+    }
+
+@router.patch("/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(...),
+    db: Session = Depends(get_db)
+):
+    """Append the request body at Upload-Offset (must equal the server's offset)"""
+    received = await append_chunk(db, upload_id, upload_offset, request.stream())
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers={"Upload-Offset": str(received)})
+
+@router.post("/uploads/{upload_id}/finalize", status_code=status.HTTP_201_CREATED)
+async def finalize(upload_id: str, db: Session = Depends(get_db)):
+    """Analyse the assembled upload; retries return the original result"""
+    return await finalize_upload(db, upload_id)
+
+@router.delete("/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+def cancel_upload(upload_id: str, db: Session = Depends(get_db)):
+    """Abandon an upload session and delete its partial data"""
+    abort_upload(db, upload_id)
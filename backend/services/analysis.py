@@ -1,11 +1,16 @@
+from config import (
+    DEFAULT_FOCUS_THRESHOLD, DEFAULT_CONTRAST_THRESHOLD,
+    DEFAULT_EXPOSURE_MIN, DEFAULT_EXPOSURE_MAX
+)
+
 def determine_ml_readiness(
     focus: float,
     contrast: float,
     exposure: float,
-    focus_threshold: float = 80,
-    contrast_threshold: float = 20,
-    exposure_min: float = 30,
-    exposure_max: float = 225
+    focus_threshold: float = DEFAULT_FOCUS_THRESHOLD,
+    contrast_threshold: float = DEFAULT_CONTRAST_THRESHOLD,
+    exposure_min: float = DEFAULT_EXPOSURE_MIN,
+    exposure_max: float = DEFAULT_EXPOSURE_MAX
 ) -> tuple:
     """Determine if image is suitable for ML inference"""
     issues = []
@@ -0,0 +1,383 @@
+import asyncio
+import io
+import mimetypes
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from sqlalchemy import text
+from database import SessionLocal
+from config import settings
+from services.storage import store, BACKEND_ROOT, content_digest, _shard
+from services.lazy_imports import Image
+
+# Archived originals live under uploads/archive/, keyed by the SHA-256 of the
+# uploaded bytes, so identical files uploaded to several experiments share
+# one blob. images.content_hash points at archive_blobs once file_path is
+# cleared by compaction.
+#
+# codec -> (file extension, media type it is served as; None = the original's)
+ARCHIVE_CODECS = {
+    "tiff_deflate": (".tif", "image/tiff"),   # pixel-exact, TIFF tags kept
+    "png": (".png", "image/png"),             # pixel-exact (BMP originals)
+    "zlib": (".zz", None),                    # byte-exact, inflated on read
+    "verbatim": ("", None),                   # stored as uploaded
+}
+# Codecs whose blob is a regular image file that can be streamed as is
+_STREAMABLE = ("tiff_deflate", "png", "verbatim")
+
+
+def archive_key(digest: str, codec: str) -> str:
+    return f"archive/{_shard(digest)}/{digest}{ARCHIVE_CODECS[codec][0]}"
+
+
+def _decode_frames(data: bytes) -> list:
+    """Mode, size and raw pixels of every frame, for lossless verification"""
+    img = Image.open(io.BytesIO(data))
+    frames = []
+    for index in range(getattr(img, "n_frames", 1)):
+        img.seek(index)
+        frames.append((img.mode, img.size, img.tobytes()))
+    return frames
+
+
+def _timed_decode(data: bytes) -> tuple:
+    start = time.perf_counter()
+    frames = _decode_frames(data)
+    return frames, (time.perf_counter() - start) * 1000
+
+
+def _reencode(data: bytes, filename: str):
+    """Pixel-lossless re-encoding for formats that benefit, or None"""
+    suffix = Path(filename).suffix.lower()
+    img = Image.open(io.BytesIO(data))
+    if getattr(img, "n_frames", 1) > 1:
+        # Stacks keep per-page tags that a re-save would drop; zlib instead
+        return None
+    out = io.BytesIO()
+    if suffix in (".tif", ".tiff"):
+        img.save(out, format="TIFF", compression="tiff_adobe_deflate", tiffinfo=img.tag_v2)
+        return "tiff_deflate", out.getvalue()
+    if suffix == ".bmp":
+        img.save(out, format="PNG", optimize=True)
+        return "png", out.getvalue()
+    return None
+
+
+def encode_for_archive(data: bytes, filename: str) -> tuple:
+    """Smallest verified lossless encoding of an original.
+
+    Returns (codec, payload, decode_ms_original, decode_ms_archived). Image
+    re-encodes are kept only if they decode to the same pixels and save at
+    least settings.archive_min_saving; otherwise zlib, otherwise verbatim.
+    """
+    max_size = len(data) * (1 - settings.archive_min_saving)
+    try:
+        original_frames, original_ms = _timed_decode(data)
+    except Exception:
+        original_frames, original_ms = None, None
+
+    if original_frames is not None:
+        try:
+            candidate = _reencode(data, filename)
+        except Exception as e:
+            print(f"⚠️ Re-encode of {filename} failed: {e}")
+            candidate = None
+        if candidate and len(candidate[1]) <= max_size:
+            frames, archived_ms = _timed_decode(candidate[1])
+            if frames == original_frames:
+                return candidate[0], candidate[1], original_ms, archived_ms
+
+    compressed = zlib.compress(data, 6)
+    if len(compressed) <= max_size:
+        # Reading a zlib blob costs an inflate on top of the usual decode
+        start = time.perf_counter()
+        zlib.decompress(compressed)
+        inflate_ms = (time.perf_counter() - start) * 1000
+        return "zlib", compressed, original_ms, inflate_ms + (original_ms or 0)
+    return "verbatim", data, original_ms, original_ms
+
+
+class HotCache:
+    """Byte-budgeted LRU of inflated originals, with per-source read latency"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._latency = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes):
+        # Objects larger than a quarter of the budget would evict everything else
+        if len(data) > self.max_bytes // 4:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = data
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def record(self, source: str, elapsed_ms: float):
+        with self._lock:
+            count, total = self._latency.get(source, (0, 0.0))
+            self._latency[source] = (count + 1, total + elapsed_ms)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "read_latency_ms": {
+                    source: {"reads": count, "mean_ms": round(total / count, 3)}
+                    for source, (count, total) in self._latency.items()
+                },
+            }
+
+
+hot_cache = HotCache(settings.archive_cache_mb * 1024 * 1024)
+
+
+def _blob_for(db, content_hash: str):
+    return db.execute(
+        text("SELECT * FROM archive_blobs WHERE content_hash = :h"), {"h": content_hash}
+    ).first()
+
+
+def _resolve(stored: str) -> Path:
+    path = Path(stored)
+    return path if path.is_absolute() else BACKEND_ROOT / path
+
+
+def read_original(db, image) -> bytes:
+    """Original bytes of an image row (file_path, content_hash), hot or archived.
+
+    Pixel-lossless codecs return the archived encoding, which decodes to the
+    same pixels; zlib blobs are inflated and kept in the hot cache.
+    """
+    start = time.perf_counter()
+    if image.file_path:
+        data = _resolve(image.file_path).read_bytes()
+        hot_cache.record("hot_file", (time.perf_counter() - start) * 1000)
+        return data
+
+    blob = _blob_for(db, image.content_hash) if image.content_hash else None
+    if not blob:
+        raise FileNotFoundError(f"No original stored for image {image.id}")
+    if blob.codec == "zlib":
+        cached = hot_cache.get(image.content_hash)
+        if cached is not None:
+            hot_cache.record("cache_hit", (time.perf_counter() - start) * 1000)
+            return cached
+
+    data = store.get(blob.object_key)
+    if blob.codec == "zlib":
+        data = zlib.decompress(data)
+        hot_cache.put(image.content_hash, data)
+    hot_cache.record(f"archive_{blob.codec}", (time.perf_counter() - start) * 1000)
+    return data
+
+
+def archived_original(db, image) -> tuple:
+    """How to serve an archived original: ("file", path, media_type) or ("bytes", data, media_type)"""
+    blob = _blob_for(db, image.content_hash)
+    if not blob:
+        raise FileNotFoundError(f"No original stored for image {image.id}")
+    media_type = ARCHIVE_CODECS[blob.codec][1] or mimetypes.guess_type(image.filename)[0]
+    if blob.codec in _STREAMABLE:
+        return "file", store.path_for(blob.object_key), media_type
+    return "bytes", read_original(db, image), media_type
+
+
+def compact_originals(min_age_days: float = None, dry_run: bool = False, chunk_size: int = None) -> dict:
+    """Move originals older than min_age_days into the deduplicated archive.
+
+    Each chunk commits before its hot files are unlinked, so a crash leaves
+    at worst an unreferenced hot file for the orphan GC. An image is only
+    pointed at a blob that still exists in the same statement, so a blob
+    dropped by delete_unreferenced_blobs after the dedup lookup leaves the
+    image hot for the next run instead of dangling. With dry_run the
+    encodings are computed (to estimate savings) but nothing is written.
+    """
+    min_age_days = settings.archive_after_days if min_age_days is None else min_age_days
+    chunk_size = chunk_size or settings.reanalyze_chunk_size
+    stats = {
+        "archived_images": 0, "new_blobs": 0, "deduplicated": 0, "missing": 0,
+        "original_bytes": 0, "stored_bytes": 0, "codecs": {}, "dry_run": dry_run,
+    }
+    seen = set()
+    db = SessionLocal()
+    try:
+        last_id = 0
+        while True:
+            rows = db.execute(text("""
+                SELECT id, filename, file_path, content_hash FROM images
+                WHERE file_path IS NOT NULL AND id > :last_id
+                  AND created_at <= datetime('now', :age)
+                ORDER BY id LIMIT :limit
+            """), {"last_id": last_id, "age": f"-{float(min_age_days)} days", "limit": chunk_size}).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            released = set()
+            for row in rows:
+                path = _resolve(row.file_path)
+                try:
+                    data = path.read_bytes()
+                except OSError:
+                    stats["missing"] += 1
+                    continue
+                digest = row.content_hash or content_digest(data)
+                stats["original_bytes"] += len(data)
+
+                if digest not in seen and _blob_for(db, digest) is None:
+                    codec, payload, original_ms, archived_ms = encode_for_archive(data, row.filename)
+                    key = archive_key(digest, codec)
+                    if not dry_run:
+                        store.put(key, payload)
+                        db.execute(text("""
+                            INSERT OR IGNORE INTO archive_blobs (
+                                content_hash, object_key, codec, original_size, stored_size,
+                                decode_ms_original, decode_ms_archived
+                            )
+                            VALUES (:h, :key, :codec, :original, :stored, :original_ms, :archived_ms)
+                        """), {
+                            "h": digest, "key": key, "codec": codec, "original": len(data),
+                            "stored": len(payload), "original_ms": original_ms, "archived_ms": archived_ms
+                        })
+                    seen.add(digest)
+                    stats["new_blobs"] += 1
+                    stats["stored_bytes"] += len(payload)
+                    stats["codecs"][codec] = stats["codecs"].get(codec, 0) + 1
+                else:
+                    stats["deduplicated"] += 1
+
+                if not dry_run:
+                    updated = db.execute(text("""
+                        UPDATE images
+                        SET file_path = NULL, content_hash = :h, archived_at = CURRENT_TIMESTAMP
+                        WHERE id = :id AND file_path = :old
+                          AND EXISTS (SELECT 1 FROM archive_blobs WHERE content_hash = :h)
+                    """), {"h": digest, "id": row.id, "old": row.file_path}).rowcount
+                    if not updated:
+                        continue
+                    released.add(row.file_path)
+                stats["archived_images"] += 1
+
+            if dry_run:
+                continue
+            db.commit()
+            for stored in released:
+                still_used = db.execute(
+                    text("SELECT 1 FROM images WHERE file_path = :p LIMIT 1"), {"p": stored}
+                ).first()
+                if not still_used:
+                    _resolve(stored).unlink(missing_ok=True)
+    finally:
+        db.close()
+
+    stats["saved_bytes"] = stats["original_bytes"] - stats["stored_bytes"]
+    print(
+        f"🗄 Archive compaction: {stats['archived_images']} images, {stats['new_blobs']} new blobs, "
+        f"{stats['deduplicated']} deduplicated, saved {stats['saved_bytes']} bytes"
+        f"{' (dry run)' if dry_run else ''}"
+    )
+    return stats
+
+
+async def compaction_loop(interval_hours: float):
+    """Run compaction every interval_hours; started from app lifespan when enabled"""
+    while True:
+        try:
+            await asyncio.to_thread(compact_originals)
+        except Exception as e:
+            print(f"⚠️ Archive compaction failed: {e}")
+        await asyncio.sleep(interval_hours * 3600)
+
+
+def archive_report(db) -> dict:
+    """Bytes saved by the archive tier and decode latency before/after, plus live read stats"""
+    images = db.execute(text("""
+        SELECT
+            COUNT(*) AS total,
+            SUM(file_path IS NULL AND content_hash IS NOT NULL) AS archived
+        FROM images
+    """)).first()
+    logical = db.execute(text("""
+        SELECT COALESCE(SUM(b.original_size), 0) AS original_bytes
+        FROM images i JOIN archive_blobs b ON b.content_hash = i.content_hash
+        WHERE i.file_path IS NULL
+    """)).scalar()
+    codecs = db.execute(text("""
+        SELECT codec, COUNT(*) AS blobs,
+               SUM(original_size) AS original_bytes, SUM(stored_size) AS stored_bytes,
+               AVG(decode_ms_original) AS decode_ms_original,
+               AVG(decode_ms_archived) AS decode_ms_archived
+        FROM archive_blobs GROUP BY codec ORDER BY codec
+    """)).fetchall()
+
+    unique_bytes = sum(c.original_bytes for c in codecs)
+    stored_bytes = sum(c.stored_bytes for c in codecs)
+    return {
+        "images": images.total,
+        "archived_images": images.archived or 0,
+        "blobs": sum(c.blobs for c in codecs),
+        "logical_bytes": logical,
+        "stored_bytes": stored_bytes,
+        "saved_bytes": logical - stored_bytes,
+        "saved_by_dedup": logical - unique_bytes,
+        "saved_by_compression": unique_bytes - stored_bytes,
+        "by_codec": [
+            {
+                "codec": c.codec,
+                "blobs": c.blobs,
+                "original_bytes": c.original_bytes,
+                "stored_bytes": c.stored_bytes,
+                "ratio": round(c.stored_bytes / c.original_bytes, 3) if c.original_bytes else None,
+                "decode_ms_original": round(c.decode_ms_original, 2) if c.decode_ms_original is not None else None,
+                "decode_ms_archived": round(c.decode_ms_archived, 2) if c.decode_ms_archived is not None else None,
+            }
+            for c in codecs
+        ],
+        "hot_cache": hot_cache.stats(),
+    }
+
+
+def delete_unreferenced_blobs(db, grace_seconds: int = None) -> list:
+    """Drop archive rows no image points at; returns their object keys.
+
+    Blobs younger than grace_seconds are kept: a running compaction may be
+    about to point images at a blob it has just created or deduplicated
+    against. The check and delete are one statement, so an image archived
+    onto a blob in between is never left dangling.
+    """
+    grace_seconds = settings.orphan_grace_seconds if grace_seconds is None else grace_seconds
+    keys = db.execute(text("""
+        DELETE FROM archive_blobs
+        WHERE created_at <= datetime('now', :age)
+          AND NOT EXISTS (
+              SELECT 1 FROM images i WHERE i.content_hash = archive_blobs.content_hash AND i.file_path IS NULL
+          )
+        RETURNING object_key
+    """), {"age": f"-{int(grace_seconds)} seconds"}).scalars().all()
+    db.commit()
+    return keys
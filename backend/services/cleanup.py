@@ -0,0 +1,195 @@
+import os
+import shutil
+import time
+from pathlib import Path
+from sqlalchemy import text, bindparam
+from database import SessionLocal
+from config import DELETE_CHUNK_SIZE, ORPHAN_GRACE_SECONDS
+from services.storage import store, BACKEND_ROOT
+from services.profiles import delete_experiment_profiles
+from services.archive import delete_unreferenced_blobs
+from services.uploads import open_partial_paths, expire_upload_sessions
+
+
+def _delete_rows_in_chunks(db, where: str, params: dict, chunk_size: int) -> int:
+    """Delete matching images in small transactions so the SQLite write lock is released between chunks"""
+    deleted = 0
+    while True:
+        ids = db.execute(
+            text(f"SELECT id FROM images WHERE {where} LIMIT :chunk"),
+            {**params, "chunk": chunk_size}
+        ).scalars().all()
+        if not ids:
+            return deleted
+        db.execute(
+            text("DELETE FROM image_evaluations WHERE image_id IN :ids").bindparams(
+                bindparam("ids", expanding=True)
+            ),
+            {"ids": ids}
+        )
+        db.execute(
+            text("DELETE FROM images WHERE id IN :ids").bindparams(
+                bindparam("ids", expanding=True)
+            ),
+            {"ids": ids}
+        )
+        db.commit()
+        deleted += len(ids)
+
+
+def _tree_size(path: Path) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+def _remove_tree(path: Path) -> int:
+    """Remove directory tree, return bytes reclaimed"""
+    if not path.exists():
+        return 0
+    size = _tree_size(path)
+    shutil.rmtree(path, ignore_errors=True)
+    return size
+
+
+def delete_experiment_data(exp_id: int, chunk_size: int = DELETE_CHUNK_SIZE) -> dict:
+    """Background task: remove an experiment's image rows and its upload tree"""
+    db = SessionLocal()
+    try:
+        deleted = _delete_rows_in_chunks(db, "experiment_id = :id", {"id": exp_id}, chunk_size)
+        delete_experiment_profiles(db, exp_id)
+    finally:
+        db.close()
+
+    reclaimed = _remove_tree(store.path_for(f"experiment_{exp_id}"))
+    print(f"🗑 Experiment {exp_id}: deleted {deleted} images, reclaimed {reclaimed} bytes")
+    return {"experiment_id": exp_id, "deleted_images": deleted, "reclaimed_bytes": reclaimed}
+
+
+def clear_all_images(chunk_size: int = DELETE_CHUNK_SIZE) -> dict:
+    """Background task: remove every image row and every experiment upload tree"""
+    db = SessionLocal()
+    try:
+        deleted = _delete_rows_in_chunks(db, "1 = 1", {}, chunk_size)
+    finally:
+        db.close()
+
+    reclaimed = 0
+    if store.root.exists():
+        for exp_dir in store.root.glob("experiment_*"):
+            reclaimed += _remove_tree(exp_dir)
+    print(f"🗑 Cleared {deleted} images, reclaimed {reclaimed} bytes")
+    return {"deleted_images": deleted, "reclaimed_bytes": reclaimed}
+
+
+def delete_orphaned_images(db, chunk_size: int = DELETE_CHUNK_SIZE) -> int:
+    """Remove image rows and profiles whose experiment no longer exists.
+
+    The experiment row is deleted before its images (in a background
+    task); if the process dies in between, the rows are left behind and
+    would keep their files referenced forever.
+    """
+    deleted = _delete_rows_in_chunks(
+        db, "experiment_id NOT IN (SELECT id FROM experiments)", {}, chunk_size
+    )
+    db.execute(text("""
+        DELETE FROM image_evaluations WHERE profile_id IN (
+            SELECT id FROM threshold_profiles WHERE experiment_id NOT IN (SELECT id FROM experiments)
+        )
+    """))
+    db.execute(text("DELETE FROM threshold_profiles WHERE experiment_id NOT IN (SELECT id FROM experiments)"))
+    db.commit()
+    if deleted:
+        print(f"🗑 Deleted {deleted} images of deleted experiments")
+    return deleted
+
+
+def _referenced_paths(db) -> set:
+    """Absolute paths of every file referenced by images, archive_blobs or open upload sessions"""
+    referenced = set()
+    rows = db.execute(text("SELECT file_path, thumbnail_path FROM images"))
+    for row in rows:
+        for stored in (row.file_path, row.thumbnail_path):
+            if not stored:
+                continue
+            path = Path(stored)
+            if not path.is_absolute():
+                path = BACKEND_ROOT / path
+            referenced.add(os.path.normpath(path))
+    blobs = db.execute(text("""
+        SELECT object_key FROM archive_blobs b
+        WHERE EXISTS (SELECT 1 FROM images i WHERE i.content_hash = b.content_hash AND i.file_path IS NULL)
+    """)).scalars()
+    for key in blobs:
+        referenced.add(os.path.normpath(store.path_for(key)))
+    for path in open_partial_paths(db):
+        referenced.add(os.path.normpath(path))
+    return referenced
+
+
+def collect_orphan_files(dry_run: bool = False, grace_seconds: int = ORPHAN_GRACE_SECONDS) -> dict:
+    """Delete files under uploads/ that no image row references.
+
+    Files younger than grace_seconds are kept: uploads write to disk
+    before their row is committed. Image rows of deleted experiments are
+    removed first, so their files are collected in the same pass.
+    """
+    db = SessionLocal()
+    try:
+        # Archive blobs whose images were all deleted, and uploads abandoned
+        # past their TTL, become orphans too
+        if dry_run:
+            orphaned_images = db.execute(text(
+                "SELECT COUNT(*) FROM images WHERE experiment_id NOT IN (SELECT id FROM experiments)"
+            )).scalar()
+        else:
+            orphaned_images = delete_orphaned_images(db)
+            delete_unreferenced_blobs(db, grace_seconds)
+            expire_upload_sessions(db)
+        referenced = _referenced_paths(db)
+    finally:
+        db.close()
+
+    cutoff = time.time() - grace_seconds
+    scanned = orphaned = reclaimed = 0
+    if not store.root.exists():
+        return {
+            "orphaned_images": orphaned_images,
+            "scanned_files": 0, "orphaned_files": 0, "reclaimed_bytes": 0, "dry_run": dry_run
+        }
+
+    for dirpath, _, filenames in os.walk(store.root, topdown=False):
+        for name in filenames:
+            full = os.path.normpath(os.path.join(dirpath, name))
+            scanned += 1
+            if full in referenced:
+                continue
+            try:
+                stat = os.stat(full)
+            except OSError:
+                continue
+            if stat.st_mtime > cutoff:
+                continue
+            orphaned += 1
+            reclaimed += stat.st_size
+            if not dry_run:
+                os.unlink(full)
+        if not dry_run and dirpath != str(store.root):
+            try:
+                os.rmdir(dirpath)
+            except OSError:
+                pass
+
+    print(f"🧹 Orphan GC: {orphaned}/{scanned} files, {reclaimed} bytes{' (dry run)' if dry_run else ''}")
+    return {
+        "orphaned_images": orphaned_images,
+        "scanned_files": scanned,
+        "orphaned_files": orphaned,
+        "reclaimed_bytes": reclaimed,
+        "dry_run": dry_run
+    }
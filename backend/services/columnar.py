@@ -0,0 +1,125 @@
+import json
+import struct
+from sqlalchemy import text
+from services.lazy_imports import np
+
+# Exportable columns: name -> (SQL expression, little-endian numpy dtype).
+# Floats use NaN for missing values; session_index refers into the
+# "sessions" list returned alongside the columns.
+METRIC_COLUMNS = {
+    "id": ("id", "<i8"),
+    "focus_score": ("focus_score", "<f4"),
+    "contrast_level": ("contrast_level", "<f4"),
+    "exposure_level": ("exposure_level", "<f4"),
+    "organoid_diameter": ("organoid_diameter", "<f4"),
+    "organoid_shape_regularity": ("organoid_shape_regularity", "<f4"),
+    "is_ml_ready": ("is_ml_ready", "<u1"),
+    # Coded in Python while streaming; a window function here would make
+    # SQLite materialise the whole result before the first row
+    "session_index": ("COALESCE(imaging_session_id, 'unknown')", "<i4"),
+}
+
+DEFAULT_COLUMNS = (
+    "id", "focus_score", "contrast_level", "exposure_level",
+    "organoid_diameter", "organoid_shape_regularity", "session_index",
+)
+
+_ALIGNMENT = 8
+
+
+def read_metric_columns(db, exp_id: int, columns, batch_size: int = 50_000) -> tuple:
+    """Read metric columns into preallocated numpy arrays, batch by batch.
+
+    Returns ({name: array}, sessions). Each column is converted straight to
+    its own dtype, so 64-bit ids stay exact.
+    """
+    count, max_id = db.execute(
+        text("SELECT COUNT(*), MAX(id) FROM images WHERE experiment_id = :id"), {"id": exp_id}
+    ).one()
+    arrays = {name: np.empty(count, dtype=METRIC_COLUMNS[name][1]) for name in columns}
+
+    select = ", ".join(
+        f"{METRIC_COLUMNS[name][0]} AS {name}" for name in columns
+    )
+    # Rows inserted after the COUNT are left out, so the arrays cannot overflow
+    result = db.execute(
+        text(f"SELECT {select} FROM images WHERE experiment_id = :id AND id <= :max_id ORDER BY id"),
+        {"id": exp_id, "max_id": max_id or 0},
+        execution_options={"yield_per": batch_size}
+    )
+
+    codes = {}
+    offset = 0
+    for batch in result.partitions(batch_size):
+        end = offset + len(batch)
+        for i, name in enumerate(columns):
+            target = arrays[name]
+            values = [row[i] for row in batch]
+            if name == "session_index":
+                values = [codes.setdefault(v, len(codes)) for v in values]
+            elif target.dtype.kind in "iu":
+                values = [0 if v is None else v for v in values]
+            else:
+                values = [np.nan if v is None else v for v in values]
+            target[offset:end] = values
+        offset = end
+
+    # Rows deleted after the COUNT leave the tail unused
+    if offset < count:
+        arrays = {name: arr[:offset] for name, arr in arrays.items()}
+
+    # Sessions are listed by name; renumber the first-seen codes to match
+    sessions = sorted(codes)
+    if "session_index" in arrays and codes:
+        order = np.empty(len(codes), dtype="<i4")
+        for index, session in enumerate(sessions):
+            order[codes[session]] = index
+        arrays["session_index"] = order[arrays["session_index"]]
+    return arrays, sessions
+
+
+def encode_raw(arrays: dict, sessions: list) -> bytes:
+    """Pack columns as: uint32 header length, JSON header, 8-byte aligned column buffers.
+
+    The header lists each column's name, dtype, byte offset and length, so
+    a browser can wrap them with Float32Array/Int32Array without copying.
+    """
+    count = len(next(iter(arrays.values()))) if arrays else 0
+    layout = []
+    offset = 0
+    for name, arr in arrays.items():
+        layout.append({"name": name, "dtype": arr.dtype.str, "offset": offset, "length": arr.nbytes})
+        offset += -(-arr.nbytes // _ALIGNMENT) * _ALIGNMENT
+
+    header = json.dumps({"count": count, "columns": layout, "sessions": sessions}).encode()
+    # Column offsets are relative to the first 8-byte boundary after the header
+    body_start = -(-(4 + len(header)) // _ALIGNMENT) * _ALIGNMENT
+    header += b" " * (body_start - 4 - len(header))
+
+    buffer = bytearray(body_start + offset)
+    buffer[0:4] = struct.pack("<I", len(header))
+    buffer[4:body_start] = header
+    for column, arr in zip(layout, arrays.values()):
+        start = body_start + column["offset"]
+        buffer[start:start + arr.nbytes] = arr.tobytes()
+    return bytes(buffer)
+
+
+def encode_arrow(arrays: dict, sessions: list) -> bytes:
+    """Arrow IPC stream; session_index becomes a dictionary-encoded session column"""
+    import pyarrow as pa
+
+    fields, data = [], []
+    for name, arr in arrays.items():
+        if name == "session_index":
+            data.append(pa.DictionaryArray.from_arrays(pa.array(arr), pa.array(sessions)))
+            fields.append("session")
+        else:
+            data.append(pa.array(arr, from_pandas=True))
+            fields.append(name)
+    table = pa.Table.from_arrays(data, names=fields)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,146 @@
+from itertools import combinations
+from sqlalchemy import text
+
+HASH_BITS = 64
+NUM_BANDS = 4
+BAND_BITS = HASH_BITS // NUM_BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+# Band lookups enumerate every band value within this radius; wider searches fall back to a scan
+MAX_BAND_RADIUS = 2
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two 64-bit hashes"""
+    return bin((a ^ b) & ((1 << HASH_BITS) - 1)).count("1")
+
+
+def hash_bands(phash: int) -> tuple:
+    """Split a (signed) 64-bit hash into NUM_BANDS unsigned bands"""
+    unsigned = phash & ((1 << HASH_BITS) - 1)
+    return tuple(
+        (unsigned >> (BAND_BITS * (NUM_BANDS - 1 - i))) & BAND_MASK
+        for i in range(NUM_BANDS)
+    )
+
+
+def _band_neighbours(band: int, radius: int) -> list:
+    """All band values within `radius` bits of `band`"""
+    values = [band]
+    for r in range(1, radius + 1):
+        for bits in combinations(range(BAND_BITS), r):
+            flipped = band
+            for bit in bits:
+                flipped ^= 1 << bit
+            values.append(flipped)
+    return values
+
+
+class BKTree:
+    """Burkhard-Keller tree over hamming distance for sub-linear radius search"""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, phash: int, item):
+        node = (phash, item, {})
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming_distance(phash, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, phash: int, max_distance: int) -> list:
+        """Return (distance, item) for every entry within max_distance"""
+        if self.root is None:
+            return []
+        found = []
+        stack = [self.root]
+        while stack:
+            node_hash, item, children = stack.pop()
+            distance = hamming_distance(phash, node_hash)
+            if distance <= max_distance:
+                found.append((distance, item))
+            low, high = distance - max_distance, distance + max_distance
+            stack.extend(child for d, child in children.items() if low <= d <= high)
+        return found
+
+
+def find_duplicate_groups(rows, max_distance: int) -> list:
+    """Cluster rows (with id, phash, focus_score) into near-duplicate groups.
+
+    Each group lists its members best-focus first, so the first id is the one to keep.
+    """
+    rows = [row for row in rows if row.phash is not None]
+    tree = BKTree()
+    for row in rows:
+        tree.add(row.phash, row.id)
+
+    parent = {row.id: row.id for row in rows}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for row in rows:
+        for _, other_id in tree.search(row.phash, max_distance):
+            a, b = find(row.id), find(other_id)
+            if a != b:
+                parent[b] = a
+
+    groups = {}
+    for row in rows:
+        groups.setdefault(find(row.id), []).append(row)
+
+    return [
+        sorted(members, key=lambda r: r.focus_score or 0, reverse=True)
+        for members in groups.values()
+        if len(members) > 1
+    ]
+
+
+def find_similar_images(db, phash: int, max_distance: int, experiment_id: int = None) -> list:
+    """Find images within max_distance of phash.
+
+    Uses multi-index hashing: by pigeonhole, a match within max_distance
+    differs by at most max_distance // NUM_BANDS bits in some band, so
+    indexed band lookups produce every candidate without a table scan.
+    """
+    scope = "AND experiment_id = :exp_id" if experiment_id is not None else ""
+    params = {"exp_id": experiment_id}
+    band_radius = max_distance // NUM_BANDS
+
+    if band_radius <= MAX_BAND_RADIUS:
+        clauses = []
+        for i, band in enumerate(hash_bands(phash)):
+            values = _band_neighbours(band, band_radius)
+            names = []
+            for j, value in enumerate(values):
+                params[f"b{i}_{j}"] = value
+                names.append(f":b{i}_{j}")
+            clauses.append(f"phash_b{i} IN ({', '.join(names)})")
+        where = " OR ".join(clauses)
+    else:
+        where = "phash IS NOT NULL"
+
+    candidates = db.execute(text(f"""
+        SELECT id, experiment_id, filename, phash, focus_score
+        FROM images
+        WHERE ({where}) {scope}
+    """), params).fetchall()
+
+    matches = []
+    for row in candidates:
+        distance = hamming_distance(phash, row.phash)
+        if distance <= max_distance:
+            matches.append((distance, row))
+    matches.sort(key=lambda m: m[0])
+    return matches
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import threading
+import uuid
+from collections import deque
+from config import EVENT_BUFFER_SIZE, EVENT_KEEPALIVE_SECONDS
+
+# Last event of an experiment's stream; its log is dropped once every
+# subscriber has received it
+FINAL_EVENTS = ("experiment_deleted",)
+
+
+class EventBus:
+    """In-process, per-experiment event log that clients can tail and resume.
+
+    Event ids look like "<boot>:<seq>". A client reconnecting with the last id
+    it saw receives only newer events, or a single "resync" event if those
+    events were evicted from the buffer or the server restarted in between.
+    Events exist only in this process, so the event stream needs the API to
+    run as a single worker.
+    """
+
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.boot = uuid.uuid4().hex
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._logs = {}
+        self._evicted_upto = {}
+        self._subscribers = {}
+        self._closing = set()
+
+    def _drop(self, exp_id: int):
+        """Forget an experiment's log (caller holds the lock)"""
+        self._logs.pop(exp_id, None)
+        self._evicted_upto.pop(exp_id, None)
+        self._subscribers.pop(exp_id, None)
+        self._closing.discard(exp_id)
+
+    def publish(self, exp_id: int, event_type: str, data: dict) -> str:
+        """Record an event and wake subscribers; safe to call from any thread"""
+        with self._lock:
+            self._seq += 1
+            event = {"seq": self._seq, "type": event_type, "data": data}
+            log = self._logs.setdefault(exp_id, deque(maxlen=self.buffer_size))
+            if len(log) == log.maxlen:
+                self._evicted_upto[exp_id] = log[0]["seq"]
+            log.append(event)
+            waiters = list(self._subscribers.get(exp_id, ()))
+            if event_type in FINAL_EVENTS:
+                if waiters:
+                    self._closing.add(exp_id)
+                else:
+                    self._drop(exp_id)
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(waiter.set)
+        return f"{self.boot}:{event['seq']}"
+
+    def _parse_token(self, token: str):
+        """Sequence number from a resume token, or None if it is from another boot"""
+        try:
+            boot, seq = token.split(":")
+            return int(seq) if boot == self.boot else None
+        except (AttributeError, ValueError):
+            return None
+
+    def _events_after(self, exp_id: int, seq: int) -> list:
+        with self._lock:
+            return [e for e in self._logs.get(exp_id, ()) if e["seq"] > seq]
+
+    def _format(self, event: dict) -> str:
+        return (
+            f"id: {self.boot}:{event['seq']}\n"
+            f"event: {event['type']}\n"
+            f"data: {json.dumps(event['data'], default=str)}\n\n"
+        )
+
+    async def stream(self, exp_id: int, last_event_id: str = None):
+        """Async generator of server-sent-event frames for one experiment"""
+        loop = asyncio.get_running_loop()
+        waiter = asyncio.Event()
+        subscriber = (loop, waiter)
+        with self._lock:
+            self._subscribers.setdefault(exp_id, set()).add(subscriber)
+            current = self._seq
+
+        try:
+            if last_event_id is None:
+                seq = current
+            else:
+                seq = self._parse_token(last_event_id)
+                if seq is None or seq < self._evicted_upto.get(exp_id, 0):
+                    yield self._format({"seq": current, "type": "resync", "data": {}})
+                    seq = current
+
+            while True:
+                waiter.clear()
+                events = self._events_after(exp_id, seq)
+                for event in events:
+                    yield self._format(event)
+                    seq = event["seq"]
+                    if event["type"] in FINAL_EVENTS:
+                        return
+                if events:
+                    continue
+                try:
+                    await asyncio.wait_for(waiter.wait(), timeout=EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(exp_id, set())
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    self._subscribers.pop(exp_id, None)
+                    if exp_id in self._closing:
+                        self._drop(exp_id)
+
+
+bus = EventBus()
@@ -0,0 +1,201 @@
+import math
+from fastapi import HTTPException
+from sqlalchemy import text, bindparam
+from config import DEFAULT_FOCUS_METHOD
+
+# Fixed-bin histograms of the per-image metrics, one per (experiment,
+# session, microscope). Bins are the same everywhere, so histograms merge
+# by adding counts: an experiment's distribution is the sum over its
+# sessions, a microscope's the sum over every experiment. Focus scores are
+# additionally kept per focus method, whose scales differ by orders of
+# magnitude, and are only merged within one method; reduced analysis modes
+# are scale-corrected to full resolution and share their method's bins. Triggers in
+# database.init_db keep metric_histograms in step with the images table,
+# so reads cost O(bins x sessions) however many images there are.
+#
+# "log" bins have equal width in log2(1 + value), i.e. constant relative
+# resolution for heavy-tailed measures (focus scores of every method,
+# diameters in pixels); "linear" bins have equal width. Values beyond the
+# range land in the first or last bin.
+
+# metric -> (images column, scale, bin width, number of bins)
+HISTOGRAM_METRICS = {
+    "focus": ("focus_score", "log", 0.125, 200),               # 1/8 octave, up to 2^25
+    "contrast": ("contrast_level", "linear", 0.5, 256),        # 0-128
+    "exposure": ("exposure_level", "linear", 1.0, 256),        # 0-256
+    "diameter": ("organoid_diameter", "log", 0.0625, 256),     # 1/16 octave, up to 2^16 px
+    "circularity": ("organoid_shape_regularity", "linear", 0.01, 101),
+}
+
+DEFAULT_PERCENTILES = (1, 5, 10, 25, 50, 75, 90, 95, 99)
+
+
+def bin_sql(metric: str, row: str) -> str:
+    """SQL expression for the bin of row's metric value (row is NEW or OLD in triggers)"""
+    column, scale, width, bins = HISTOGRAM_METRICS[metric]
+    value = f"MAX({row}.{column}, 0)"
+    if scale == "log":
+        value = f"log2(1 + {value})"
+    return f"MIN(CAST({value} / {width} AS INTEGER), {bins - 1})"
+
+
+def bin_index(metric: str, value: float) -> int:
+    """Python twin of bin_sql"""
+    _, scale, width, bins = HISTOGRAM_METRICS[metric]
+    value = max(value, 0)
+    if scale == "log":
+        value = math.log2(1 + value)
+    return min(int(value / width), bins - 1)
+
+
+def bin_edges(metric: str, index: int) -> tuple:
+    """(low, high) metric values covered by a bin (fractional index for positions inside)"""
+    _, scale, width, _ = HISTOGRAM_METRICS[metric]
+    low, high = index * width, (index + 1) * width
+    if scale == "log":
+        return 2 ** low - 1, 2 ** high - 1
+    return low, high
+
+
+def validate_metrics(names) -> list:
+    unknown = [n for n in names if n not in HISTOGRAM_METRICS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown metrics: {', '.join(unknown)}. Available: {', '.join(HISTOGRAM_METRICS)}"
+        )
+    return list(names)
+
+
+def read_histograms(db, metrics=None, experiment_id: int = None, session: str = None,
+                    microscope: str = None, focus_method: str = DEFAULT_FOCUS_METHOD) -> dict:
+    """Merged histograms {metric: {bin: count}} over the matching sessions.
+
+    The focus histogram only counts scores measured with focus_method.
+    """
+    metrics = list(metrics or HISTOGRAM_METRICS)
+    where = ["metric IN :metrics", "(metric != 'focus' OR focus_method = :focus_method)"]
+    params = {"metrics": metrics, "focus_method": focus_method}
+    if experiment_id is not None:
+        where.append("experiment_id = :exp_id")
+        params["exp_id"] = experiment_id
+    if session is not None:
+        where.append("imaging_session_id = :session")
+        params["session"] = session
+    if microscope is not None:
+        where.append("microscope_id = :microscope")
+        params["microscope"] = microscope
+
+    histograms = {metric: {} for metric in metrics}
+    rows = db.execute(text(f"""
+        SELECT metric, bin, SUM(n) AS n FROM metric_histograms
+        WHERE {' AND '.join(where)}
+        GROUP BY metric, bin
+    """).bindparams(bindparam("metrics", expanding=True)), params)
+    for row in rows:
+        if row.n:
+            histograms[row.metric][row.bin] = row.n
+    return histograms
+
+
+def percentile(metric: str, counts: dict, q: float):
+    """Value below which q percent of the observations fall, interpolated within the bin"""
+    total = sum(counts.values())
+    if not total:
+        return None
+    rank = q / 100 * total
+    seen = 0
+    for index in sorted(counts):
+        n = counts[index]
+        if seen + n >= rank:
+            low, high = bin_edges(metric, index)
+            return low + (high - low) * (rank - seen) / n
+        seen += n
+    return bin_edges(metric, max(counts))[1]
+
+
+def otsu_threshold(metric: str, counts: dict) -> tuple:
+    """Split maximizing between-class variance (on the bin scale); returns (threshold, separation).
+
+    separation is between-class over total variance: near 1 for two
+    well-separated populations, low for a single mode.
+    """
+    indices = sorted(counts)
+    total = sum(counts.values())
+    if len(indices) < 2:
+        return None, 0.0
+    mean = sum(i * counts[i] for i in indices) / total
+    variance = sum(counts[i] * (i - mean) ** 2 for i in indices) / total
+    best, best_split, upper = -1.0, None, None
+    weight = first_moment = 0.0
+    for index, following in zip(indices, indices[1:]):
+        weight += counts[index]
+        first_moment += index * counts[index]
+        w0, w1 = weight / total, 1 - weight / total
+        m0 = first_moment / weight
+        m1 = (mean * total - first_moment) / (total - weight)
+        between = w0 * w1 * (m0 - m1) ** 2
+        if between > best:
+            best, best_split, upper = between, index, following
+    # Threshold in the middle of any empty gap between the two classes
+    threshold = bin_edges(metric, (best_split + 1 + upper) / 2)[0]
+    return threshold, (best / variance if variance else 0.0)
+
+
+def summarize(metric: str, counts: dict, percentiles=DEFAULT_PERCENTILES, histogram: bool = True) -> dict:
+    """Count, percentiles and (non-empty) bins of one merged histogram"""
+    summary = {
+        "count": sum(counts.values()),
+        "percentiles": {
+            f"p{q:g}": _round(percentile(metric, counts, q)) for q in percentiles
+        },
+    }
+    if histogram:
+        summary["bins"] = [
+            {"low": _round(low), "high": _round(high), "count": counts[index]}
+            for index in sorted(counts)
+            for low, high in [bin_edges(metric, index)]
+        ]
+    return summary
+
+
+def suggest_thresholds(histograms: dict) -> dict:
+    """Data-driven starting points for a threshold profile.
+
+    Focus: Otsu split between the blurred and sharp populations, or the
+    5th percentile when the distribution has a single mode. Contrast and
+    exposure: Tukey fences (quartiles -/+ 1.5 x IQR).
+    """
+    def fences(metric):
+        counts = histograms[metric]
+        q1, q3 = percentile(metric, counts, 25), percentile(metric, counts, 75)
+        if q1 is None:
+            return None, None
+        return q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+
+    focus = histograms["focus"]
+    threshold, separation = otsu_threshold("focus", focus)
+    if threshold is not None and separation >= 0.5:
+        focus_threshold, focus_method = threshold, "otsu"
+    else:
+        focus_threshold, focus_method = percentile("focus", focus, 5), "p5"
+
+    contrast_low, _ = fences("contrast")
+    exposure_low, exposure_high = fences("exposure")
+    return {
+        "focus_threshold": _round(focus_threshold),
+        "contrast_threshold": _round(max(contrast_low, 0)) if contrast_low is not None else None,
+        "exposure_min": _round(max(exposure_low, 0)) if exposure_low is not None else None,
+        "exposure_max": _round(min(exposure_high, 255)) if exposure_high is not None else None,
+        "methods": {
+            "focus": focus_method,
+            "focus_separation": round(separation, 3),
+            "contrast": "tukey_lower_fence",
+            "exposure": "tukey_fences",
+        },
+        "sample_size": sum(focus.values()),
+    }
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
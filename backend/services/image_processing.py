@@ -1,17 +1,187 @@
-import cv2
-import numpy as np
-from PIL import Image
 import io
+import mmap
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import HTTPException, status
+from config import settings, ANALYSIS_MODES, DEFAULT_FOCUS_METHOD, DEFAULT_FOCUS_THRESHOLD
+from services.lazy_imports import cv2, np, Image
 
-def compute_focus_score(image_bytes: bytes) -> float:
-    """Laplacian variance for focus detection"""
+# cv2, numpy and PIL load on first use (services.lazy_imports), so importing
+# this module (and hence the API app) stays cheap.
+#
+# Focus measures operate on decoded 8-bit grayscale images. Derivatives are
+# taken into int16 and reduced with cv2.meanStdDev, which accumulates in
+# double precision without allocating a float64 image.
+
+def _variance(arr) -> float:
+    _, std = cv2.meanStdDev(arr)
+    return float(std[0, 0]) ** 2
+
+def _mean_square(arr) -> float:
+    mean, std = cv2.meanStdDev(arr)
+    return float(mean[0, 0]) ** 2 + float(std[0, 0]) ** 2
+
+def focus_laplacian(img) -> float:
+    """Variance of the Laplacian (reference measure)"""
+    return _variance(cv2.Laplacian(img, cv2.CV_16S))
+
+def focus_laplacian_pyr2(img) -> float:
+    """Laplacian variance on pyramid level 1 (half resolution)"""
+    return focus_laplacian(cv2.pyrDown(img))
+
+def focus_laplacian_pyr4(img) -> float:
+    """Laplacian variance on pyramid level 2 (quarter resolution)"""
+    return focus_laplacian(cv2.pyrDown(cv2.pyrDown(img)))
+
+def focus_tenengrad(img) -> float:
+    """Mean squared Sobel gradient magnitude"""
+    gx = cv2.Sobel(img, cv2.CV_16S, 1, 0, ksize=3)
+    gy = cv2.Sobel(img, cv2.CV_16S, 0, 1, ksize=3)
+    return _mean_square(gx) + _mean_square(gy)
+
+def focus_normalized_variance(img) -> float:
+    """Intensity variance divided by mean intensity"""
+    mean, std = cv2.meanStdDev(img)
+    return float(std[0, 0]) ** 2 / (float(mean[0, 0]) + 1e-5)
+
+def focus_brenner(img) -> float:
+    """Mean squared difference between pixels two columns apart"""
+    return _mean_square(cv2.absdiff(img[:, 2:], img[:, :-2]))
+
+def focus_fft_high_freq(img, max_side: int = 512, cutoff: float = 0.25) -> float:
+    """Share of spectral energy (excluding DC) above cutoff x Nyquist, in per-mille"""
+    scale = max_side / max(img.shape)
+    if scale < 1:
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    power = np.abs(np.fft.rfft2(img.astype(np.float32))) ** 2
+    power[0, 0] = 0
+    fy = np.abs(np.fft.fftfreq(img.shape[0]))[:, None]
+    fx = np.fft.rfftfreq(img.shape[1])[None, :]
+    high = np.sqrt(fx ** 2 + fy ** 2) > cutoff * 0.5
+    total = power.sum()
+    return float(1000 * power[high].sum() / total) if total > 0 else 0.0
+
+FOCUS_METHODS = {
+    "laplacian": focus_laplacian,
+    "laplacian_pyr2": focus_laplacian_pyr2,
+    "laplacian_pyr4": focus_laplacian_pyr4,
+    "tenengrad": focus_tenengrad,
+    "normalized_variance": focus_normalized_variance,
+    "brenner": focus_brenner,
+    "fft_high_freq": focus_fft_high_freq,
+}
+
+# Multiplier that maps a focus score measured on a 1/factor-resolution decode
+# onto the full-resolution scale, refit with
+# benchmarks/bench_analysis_modes.py --fit on a synthetic defocus series.
+# No single factor fits the whole series: the full-resolution Laplacian
+# levels off at the sensor-noise floor once an image is blurred, which
+# reduced decodes average away. So where a method's default threshold falls
+# inside the series, the factor is the one that reproduces the
+# full-resolution verdicts at that threshold (held-out agreement is tested
+# in tests/test_image_processing.py); elsewhere it is the median ratio.
+# Rankings are preserved; absolute values far from the threshold are
+# approximate.
+# Contrast and exposure are used as measured: the mean is unchanged by
+# area downsampling and the pixel std drops by only ~0.3% at 1/4 resolution
+# (contrast err column of the same benchmark), well inside profile margins.
+FOCUS_SCALE_CORRECTION = {
+    "laplacian": {2: 1.42, 4: 0.99},
+    "laplacian_pyr2": {2: 0.51, 4: 0.21},
+    "laplacian_pyr4": {2: 0.46, 4: 0.22},
+    "tenengrad": {2: 0.61, 4: 0.25},
+    "normalized_variance": {2: 1.00, 4: 1.01},
+    "brenner": {2: 0.74, 4: 0.33},
+    "fft_high_freq": {2: 1.00, 4: 1.00},
+}
+
+# Default focus_threshold of new profiles per method. The measures differ in
+# scale by orders of magnitude (fft_high_freq is in per-mille), so each gets
+# its score at the defocus where the Laplacian falls to
+# DEFAULT_FOCUS_THRESHOLD (benchmarks/bench_focus.py --thresholds).
+# normalized_variance barely responds to defocus (about 18 sharp, 15 at
+# sigma 5 on the synthetic field); its default only rejects featureless fields.
+FOCUS_DEFAULT_THRESHOLDS = {
+    "laplacian": DEFAULT_FOCUS_THRESHOLD,
+    "laplacian_pyr2": 110,
+    "laplacian_pyr4": 200,
+    "tenengrad": 2600,
+    "normalized_variance": 12,
+    "brenner": 95,
+    "fft_high_freq": 26,
+}
+
+def default_focus_threshold(method: str) -> float:
+    return FOCUS_DEFAULT_THRESHOLDS.get(method or DEFAULT_FOCUS_METHOD, DEFAULT_FOCUS_THRESHOLD)
+
+def validate_focus_method(method: str):
+    if method not in FOCUS_METHODS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown focus method '{method}'. Available: {', '.join(FOCUS_METHODS)}"
+        )
+
+def validate_analysis_mode(mode: str):
+    if mode not in ANALYSIS_MODES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown analysis mode '{mode}'. Available: {', '.join(ANALYSIS_MODES)}"
+        )
+
+def decode_grayscale(image_bytes: bytes, factor: int = 1):
+    """Decode to 8-bit grayscale at 1/factor resolution (1, 2, 4 or 8).
+
+    JPEG is scaled in the DCT domain by libjpeg, so reduced decodes are
+    faster as well as smaller; other formats decode fully and are shrunk.
+    """
+    flags = {
+        1: cv2.IMREAD_GRAYSCALE,
+        2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+        4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+        8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+    }
+    return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flags[factor])
+
+def focus_from_array(img, method: str = DEFAULT_FOCUS_METHOD, factor: int = 1) -> float:
+    """Focus score of a decoded image, scaled to full resolution if it was reduced"""
+    score = FOCUS_METHODS[method](img)
+    return score * FOCUS_SCALE_CORRECTION[method][factor] if factor > 1 else score
+
+def organoid_properties_from_array(img, factor: int = 1) -> tuple:
+    """Diameter (in full-resolution pixels) and circularity of the largest organoid"""
+    _, thresh = cv2.threshold(img, settings.binarization_threshold, 255, cv2.THRESH_BINARY)
+    contours, _ = cv2.findContours(
+        thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+    )
+
+    if not contours:
+        return None, None
+
+    contour = max(contours, key=cv2.contourArea)
+    area = cv2.contourArea(contour)
+    perimeter = cv2.arcLength(contour, True)
+
+    diameter = 2 * np.sqrt(area / np.pi) * factor
+    circularity = (4 * np.pi * area) / (perimeter ** 2 + 1e-5)
+
+    return float(diameter), float(circularity)
+
+def perceptual_hash_from_array(img) -> int:
+    """64-bit DCT perceptual hash (pHash), signed so it fits an SQLite INTEGER"""
+    small = cv2.resize(img, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low_freq = cv2.dct(small)[:8, :8].flatten()
+    bits = low_freq > np.median(low_freq[1:])
+    value = int.from_bytes(np.packbits(bits).tobytes(), "big")
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def compute_focus_score(image_bytes: bytes, method: str = DEFAULT_FOCUS_METHOD) -> float:
+    """Focus score using a registered focus measure (Laplacian variance by default)"""
+    validate_focus_method(method)
     try:
-        arr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(arr, cv2.IMREAD_GRAYSCALE)
+        img = decode_grayscale(image_bytes)
         if img is None:
             raise ValueError("Invalid image format")
-        return float(cv2.Laplacian(img, cv2.CV_64F).var())
+        return focus_from_array(img, method)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -21,8 +191,7 @@ def compute_focus_score(image_bytes: bytes) -> float:
 def compute_contrast_level(image_bytes: bytes) -> float:
     """Calculate contrast using standard deviation"""
     try:
-        arr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(arr, cv2.IMREAD_GRAYSCALE)
+        img = decode_grayscale(image_bytes)
         if img is None:
             return 0.0
         return float(img.std())
@@ -32,8 +201,7 @@ def compute_contrast_level(image_bytes: bytes) -> float:
 def compute_exposure_level(image_bytes: bytes) -> float:
     """Calculate exposure using mean pixel intensity"""
     try:
-        arr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(arr, cv2.IMREAD_GRAYSCALE)
+        img = decode_grayscale(image_bytes)
         if img is None:
             return 0.0
         return float(img.mean())
@@ -43,48 +211,117 @@ def compute_exposure_level(image_bytes: bytes) -> float:
 def estimate_organoid_properties(image_bytes: bytes) -> tuple:
     """Estimate organoid diameter and circularity"""
     try:
-        arr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(arr, cv2.IMREAD_GRAYSCALE)
+        img = decode_grayscale(image_bytes)
         if img is None:
             return None, None
-        
-        _, thresh = cv2.threshold(img, 50, 255, cv2.THRESH_BINARY)
-        contours, _ = cv2.findContours(
-            thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
-        )
-        
-        if not contours:
-            return None, None
-        
-        contour = max(contours, key=cv2.contourArea)
-        area = cv2.contourArea(contour)
-        perimeter = cv2.arcLength(contour, True)
-        
-        diameter = 2 * np.sqrt(area / np.pi)
-        circularity = (4 * np.pi * area) / (perimeter ** 2 + 1e-5)
-        
-        return float(diameter), float(circularity)
+        return organoid_properties_from_array(img)
     except:
         return None, None
 
+def _image_file(image_bytes):
+    """File object for PIL; a memory-mapped file is read in place rather than copied"""
+    if isinstance(image_bytes, mmap.mmap):
+        image_bytes.seek(0)
+        return image_bytes
+    return io.BytesIO(image_bytes)
+
 def get_image_dimensions(image_bytes: bytes) -> tuple:
-    """Get image width and height"""
-    arr = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-    if img is None:
-        return None, None
-    return img.shape[1], img.shape[0]
+    """Get image width and height from the header, without decoding pixels"""
+    try:
+        return Image.open(_image_file(image_bytes)).size
+    except Exception:
+        img = decode_grayscale(image_bytes)
+        if img is None:
+            return None, None
+        return img.shape[1], img.shape[0]
 
-def create_thumbnail(image_bytes: bytes, size=(200, 200)) -> bytes:
-    """Create thumbnail from image bytes"""
+def create_thumbnail(image_bytes: bytes, size=None, quality=None, format=None) -> bytes:
+    """Create thumbnail from image bytes (size/quality/format default to settings)"""
+    size = size or settings.thumbnail_size
+    quality = quality or settings.thumbnail_quality
+    format = (format or settings.thumbnail_format).upper()
     try:
-        img = Image.open(io.BytesIO(image_bytes))
+        img = Image.open(_image_file(image_bytes))
+        if settings.thumbnail_draft:
+            # JPEG only: decode directly at the smallest DCT scale >= size
+            img.draft(img.mode, size)
         img.thumbnail(size, Image.Resampling.LANCZOS)
         
         thumb_io = io.BytesIO()
-        img.save(thumb_io, format='JPEG', quality=70)
+        img.save(thumb_io, format=format, quality=quality)
         thumb_io.seek(0)
         return thumb_io.getvalue()
     except Exception as e:
         print(f"Thumbnail creation failed: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def compute_perceptual_hash(image_bytes: bytes) -> int:
+    """64-bit DCT perceptual hash (pHash), signed so it fits an SQLite INTEGER"""
+    try:
+        img = decode_grayscale(image_bytes)
+        if img is None:
+            return None
+        return perceptual_hash_from_array(img)
+    except:
+        return None
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def analysis_executor() -> ThreadPoolExecutor:
+    """Shared pool for CPU-bound analysis, sized by settings.analysis_workers.
+
+    OpenCV releases the GIL, so threads run decodes and filters in parallel.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.analysis_workers, thread_name_prefix="analysis"
+            )
+    return _executor
+
+def analyze_image(
+    image_bytes: bytes,
+    focus_method: str = DEFAULT_FOCUS_METHOD,
+    mode: str = "full",
+    thumbnail: bool = True
+) -> dict:
+    """All per-image metrics, the perceptual hash and (optionally) the thumbnail.
+
+    The image is decoded once, at the resolution the analysis mode asks for.
+    image_bytes may also be a read-only mmap of the file (chunked uploads).
+    """
+    validate_focus_method(focus_method)
+    validate_analysis_mode(mode)
+    factor = ANALYSIS_MODES[mode]
+    try:
+        img = decode_grayscale(image_bytes, factor)
+        if img is None:
+            raise ValueError("Invalid image format")
+        focus = focus_from_array(img, focus_method, factor)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Image processing failed: {str(e)}"
+        )
+
+    width, height = get_image_dimensions(image_bytes)
+    mean, std = cv2.meanStdDev(img)
+    try:
+        diameter, circularity = organoid_properties_from_array(img, factor)
+    except Exception:
+        diameter, circularity = None, None
+    return {
+        "analysis_mode": mode,
+        "focus": focus,
+        "contrast": float(std[0, 0]),
+        "exposure": float(mean[0, 0]),
+        "width": width,
+        "height": height,
+        "diameter": diameter,
+        "circularity": circularity,
+        "phash": perceptual_hash_from_array(img),
+        "thumbnail": create_thumbnail(image_bytes) if thumbnail else None,
+    }
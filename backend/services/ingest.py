@@ -0,0 +1,332 @@
+import asyncio
+import json
+from datetime import datetime
+from pathlib import Path
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from config import ALLOWED_FORMATS, DEFAULT_FOCUS_METHOD, DEFAULT_ANALYSIS_MODE
+from services.image_processing import analyze_image, analysis_executor
+from services.storage import save_upload_files, content_digest
+from services.analysis import determine_ml_readiness
+from services.dedup import hash_bands
+from services.profiles import get_profile, ensure_default_profile, evaluate_new_image
+from services.plate import parse_well_metadata, parse_well_id, format_well_id
+from services.events import bus
+
+# Shared by POST /upload/{exp_id} (single request) and POST
+# /uploads/{id}/finalize (assembled chunked upload).
+
+# Form fields an upload may carry besides the file
+UPLOAD_METADATA = (
+    "imaging_session_id", "microscope_id", "operator_id",
+    "plate_id", "well_id", "field_index", "z_index", "analysis_mode",
+)
+
+# An idempotency key claimed by a request that never finished (crashed
+# worker) can be reclaimed after this long
+IDEMPOTENCY_IN_PROGRESS_TIMEOUT_SECONDS = 600
+
+
+def check_upload_format(filename: str):
+    if not filename.lower().endswith(ALLOWED_FORMATS):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Supported formats: {', '.join(ALLOWED_FORMATS)}"
+        )
+
+
+def check_well_id(well_id: str):
+    """Reject an explicit well id that is not one, before any work is done on the upload"""
+    if well_id and parse_well_id(well_id)[0] is None:
+        raise HTTPException(status_code=400, detail=f"Invalid well id '{well_id}'")
+
+
+def get_upload_experiment(db, experiment_id: int):
+    experiment = db.execute(
+        text("SELECT id, focus_method, analysis_mode FROM experiments WHERE id = :id"),
+        {"id": experiment_id}
+    ).first()
+    if not experiment:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+    return experiment
+
+
+def claim_idempotency_key(db, key: str, request: str):
+    """Reserve key for request; returns the stored response if it already completed.
+
+    request fingerprints what the key was first used for, so reusing a key
+    for a different upload is rejected instead of returning the wrong image.
+    """
+    row = db.execute(text("""
+        SELECT request, response,
+               created_at < datetime('now', :timeout) AS abandoned
+        FROM idempotency_keys WHERE key = :key
+    """), {"key": key, "timeout": f"-{IDEMPOTENCY_IN_PROGRESS_TIMEOUT_SECONDS} seconds"}).first()
+
+    if row:
+        if row.request != request:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency key was already used for a different request"
+            )
+        if row.response is not None:
+            return json.loads(row.response)
+        if not row.abandoned:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with this idempotency key is still in progress"
+            )
+        db.execute(
+            text("UPDATE idempotency_keys SET created_at = CURRENT_TIMESTAMP WHERE key = :key"),
+            {"key": key}
+        )
+    else:
+        db.execute(
+            text("INSERT INTO idempotency_keys (key, request) VALUES (:key, :request)"),
+            {"key": key, "request": request}
+        )
+    db.commit()
+    return None
+
+
+def complete_idempotency_key(db, key: str, response: dict):
+    """Record the response of a claimed key (committed by the caller with its work)"""
+    db.execute(
+        text("UPDATE idempotency_keys SET response = :response WHERE key = :key"),
+        {"key": key, "response": json.dumps(response)}
+    )
+
+
+def release_idempotency_key(db, key: str):
+    """Forget an unfinished claim so the client can retry"""
+    db.rollback()
+    db.execute(
+        text("DELETE FROM idempotency_keys WHERE key = :key AND response IS NULL"),
+        {"key": key}
+    )
+    db.commit()
+
+
+def _existing_upload_response(db, experiment_id: int, filename: str, digest: str) -> dict:
+    """Upload response of an identical file already ingested under the same name, if any.
+
+    Covers retries that carry no Idempotency-Key: the same bytes under the
+    same name in the same experiment map to the image stored first.
+    """
+    row = db.execute(text("""
+        SELECT i.*, p.name AS profile FROM images i
+        LEFT JOIN threshold_profiles p ON p.experiment_id = i.experiment_id AND p.is_active = 1
+        WHERE i.experiment_id = :exp_id AND i.filename = :fname AND i.content_hash = :digest
+        ORDER BY i.id LIMIT 1
+    """), {"exp_id": experiment_id, "fname": filename, "digest": digest}).first()
+    if not row:
+        return None
+    return {
+        "id": row.id,
+        "focus_score": round(row.focus_score, 2),
+        "focus_method": row.focus_method,
+        "analysis_mode": row.analysis_mode,
+        "contrast_level": round(row.contrast_level, 2),
+        "exposure_level": round(row.exposure_level, 2),
+        "is_ml_ready": bool(row.is_ml_ready),
+        "quality_reason": row.quality_reason,
+        "profile": row.profile,
+        "organoid_diameter": round(row.organoid_diameter, 2) if row.organoid_diameter else None,
+        "organoid_circularity": round(row.organoid_shape_regularity, 2) if row.organoid_shape_regularity else None,
+        "dimensions": {"width": row.width, "height": row.height},
+        "plate_id": row.plate_id,
+        "well_id": row.target_well_id,
+        "field_index": row.field_index,
+        "z_index": row.z_index
+    }
+
+
+def _replay_existing(db, response: dict, idempotency_key: str, source_path: Path) -> dict:
+    print(f"↩️ Identical upload already stored as image {response['id']}")
+    if idempotency_key:
+        complete_idempotency_key(db, idempotency_key, response)
+    db.commit()
+    if source_path:
+        source_path.unlink(missing_ok=True)
+    return response
+
+
+async def ingest_image(
+    db,
+    experiment,
+    filename: str,
+    contents: bytes,
+    metadata: dict,
+    idempotency_key: str = None,
+    source_path: Path = None,
+    digest: str = None
+) -> dict:
+    """Analyse, store and insert one image; returns the upload response.
+
+    With idempotency_key (claimed beforehand) the response is stored in the
+    same transaction as the image row. With source_path the original is
+    linked into place from that file instead of written from contents, and
+    source_path is removed only once the row is committed, so a failed
+    insert leaves it for a retry. digest is the SHA-256 of contents, if the
+    caller already has it. Re-sending a file already stored under the same
+    name returns that image instead of inserting a second row.
+    """
+    digest = digest or content_digest(contents)
+    existing = _existing_upload_response(db, experiment.id, filename, digest)
+    if existing is not None:
+        return _replay_existing(db, existing, idempotency_key, source_path)
+
+    # Plate position: explicit form fields win over what the filename encodes
+    well = parse_well_metadata(filename)
+    well_id = metadata.get("well_id")
+    if well_id:
+        check_well_id(well_id)
+        well["well_row"], well["well_col"] = parse_well_id(well_id)
+    well["plate_id"] = metadata.get("plate_id") or well["plate_id"]
+    for field in ("field_index", "z_index"):
+        if metadata.get(field) is not None:
+            well[field] = metadata[field]
+
+    # Compute metrics off the event loop, in the shared analysis pool
+    focus_method = experiment.focus_method or DEFAULT_FOCUS_METHOD
+    analysis_mode = metadata.get("analysis_mode") or experiment.analysis_mode or DEFAULT_ANALYSIS_MODE
+    metrics = await asyncio.get_running_loop().run_in_executor(
+        analysis_executor(), analyze_image, contents, focus_method, analysis_mode
+    )
+    focus, contrast, exposure = metrics["focus"], metrics["contrast"], metrics["exposure"]
+    width, height = metrics["width"], metrics["height"]
+    diameter, circularity = metrics["diameter"], metrics["circularity"]
+    profile = get_profile(db, experiment.id) or ensure_default_profile(db, experiment.id, focus_method)
+    is_ml_ready, quality_reason = determine_ml_readiness(
+        focus, contrast, exposure,
+        profile.focus_threshold, profile.contrast_threshold,
+        profile.exposure_min, profile.exposure_max
+    )
+    phash = metrics["phash"]
+    target_well_id = (
+        format_well_id(well["well_row"], well["well_col"])
+        if well["well_row"] is not None else None
+    )
+    bands = hash_bands(phash) if phash is not None else (None,) * 4
+    imaging_session_id = metadata.get("imaging_session_id")
+    microscope_id = metadata.get("microscope_id")
+    operator_id = metadata.get("operator_id")
+
+    # Save files (keyed by digest, so a concurrent identical upload writes the same objects)
+    original_path, thumb_path = await save_upload_files(
+        experiment.id, filename, contents, metrics["thumbnail"], digest, source_path
+    )
+
+    # Save to database, unless a concurrent identical upload got there first
+    result = db.execute(
+        text("""
+            INSERT INTO images (
+                experiment_id, filename, focus_score, contrast_level,
+                exposure_level, is_ml_ready, quality_reason, organoid_diameter,
+                organoid_shape_regularity, imaging_session_id, microscope_id,
+                operator_id, acquisition_time, width, height, file_path, thumbnail_path,
+                phash, phash_b0, phash_b1, phash_b2, phash_b3, focus_method, analysis_mode,
+                plate_id, well_row, well_col, field_index, z_index, target_well_id, content_hash
+            )
+            SELECT
+                :exp_id, :fname, :focus, :contrast, :exposure, :ml_ready,
+                :reason, :diameter, :circularity, :session_id, :micro_id,
+                :op_id, :acq_time, :width, :height, :file_path, :thumb_path,
+                :phash, :b0, :b1, :b2, :b3, :focus_method, :analysis_mode,
+                :plate_id, :well_row, :well_col, :field_index, :z_index, :target_well_id, :content_hash
+            WHERE NOT EXISTS (
+                SELECT 1 FROM images
+                WHERE experiment_id = :exp_id AND filename = :fname AND content_hash = :content_hash
+            )
+            RETURNING id
+        """),
+        {
+            "exp_id": experiment.id,
+            "fname": filename,
+            "focus": focus,
+            "contrast": contrast,
+            "exposure": exposure,
+            "ml_ready": is_ml_ready,
+            "reason": quality_reason,
+            "diameter": diameter,
+            "circularity": circularity,
+            "session_id": imaging_session_id,
+            "micro_id": microscope_id,
+            "op_id": operator_id,
+            "acq_time": datetime.now(),
+            "width": width,
+            "height": height,
+            "file_path": str(original_path),
+            "thumb_path": str(thumb_path) if thumb_path else None,
+            "phash": phash,
+            "b0": bands[0], "b1": bands[1], "b2": bands[2], "b3": bands[3],
+            "focus_method": focus_method,
+            "analysis_mode": analysis_mode,
+            **well,
+            "target_well_id": target_well_id,
+            "content_hash": digest
+        }
+    )
+
+    image_id = result.scalar()
+    if image_id is None:
+        existing = _existing_upload_response(db, experiment.id, filename, digest)
+        return _replay_existing(db, existing, idempotency_key, source_path)
+    evaluate_new_image(db, image_id)
+
+    response = {
+        "id": image_id,
+        "focus_score": round(focus, 2),
+        "focus_method": focus_method,
+        "analysis_mode": analysis_mode,
+        "contrast_level": round(contrast, 2),
+        "exposure_level": round(exposure, 2),
+        "is_ml_ready": is_ml_ready,
+        "quality_reason": quality_reason,
+        "profile": profile.name,
+        "organoid_diameter": round(diameter, 2) if diameter else None,
+        "organoid_circularity": round(circularity, 2) if circularity else None,
+        "dimensions": {"width": width, "height": height},
+        "plate_id": well["plate_id"],
+        "well_id": target_well_id,
+        "field_index": well["field_index"],
+        "z_index": well["z_index"]
+    }
+    if idempotency_key:
+        complete_idempotency_key(db, idempotency_key, response)
+    db.commit()
+    if source_path:
+        source_path.unlink(missing_ok=True)
+
+    # Same shape as GET /experiments/{id}/images rows, plus what a client
+    # needs to patch its batch report without refetching
+    bus.publish(experiment.id, "image_analyzed", {
+        "image": {
+            "id": image_id,
+            "filename": filename,
+            "focus_score": round(focus, 2),
+            "contrast_level": round(contrast, 2),
+            "exposure_level": round(exposure, 2),
+            "is_ml_ready": is_ml_ready,
+            "quality_reason": quality_reason,
+            "organoid_diameter": round(diameter, 2) if diameter else None,
+            "organoid_shape_regularity": round(circularity, 2) if circularity else None,
+            "imaging_session_id": imaging_session_id,
+            "microscope_id": microscope_id,
+            "operator_id": operator_id,
+            "plate_id": well["plate_id"],
+            "well_id": target_well_id,
+            "analysis_mode": analysis_mode,
+        },
+        "delta": {
+            "total_images": 1,
+            "ml_ready_images": int(is_ml_ready),
+            "sum_focus": focus,
+            "sum_contrast": contrast,
+            "sum_exposure": exposure,
+            "session": imaging_session_id or "unknown",
+            "profile": profile.name
+        }
+    })
+
+    return response
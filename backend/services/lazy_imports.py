@@ -0,0 +1,34 @@
+import importlib
+import threading
+
+# cv2, numpy and PIL dominate the API's cold start, and most requests never
+# touch them. Modules that need them import these stand-ins instead; the
+# real module is imported on first attribute access (cv2.Laplacian, ...)
+# and cached, so only the code paths that use a library pay for loading it.
+
+
+class LazyModule:
+    """Module proxy that imports the named module when first used"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._module or self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+Image = LazyModule("PIL.Image")
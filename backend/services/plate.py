@@ -0,0 +1,110 @@
+import re
+from pathlib import Path
+
+# Standard microplate formats: wells -> (rows, cols)
+PLATE_LAYOUTS = {
+    6: (2, 3),
+    12: (3, 4),
+    24: (4, 6),
+    48: (6, 8),
+    96: (8, 12),
+    384: (16, 24),
+    1536: (32, 48),
+}
+
+# Opera/Operetta (Harmony) export names, e.g. r02c03f01p01-ch1sk1fk1fl1.tiff
+_HARMONY_RE = re.compile(r"r(\d{1,2})c(\d{1,2})f(\d{1,3})p(\d{1,3})", re.IGNORECASE)
+# Well ids such as B03, b3 or AF48 (1536-well rows run A..Z, AA..AF)
+_WELL_RE = re.compile(r"^([A-Z]|A[A-F])(\d{1,2})$", re.IGNORECASE)
+# In filenames only the conventional two-digit column counts as a well, so
+# channel, timepoint and day tokens like c1, t1 or d3 are not taken for one
+_FILENAME_WELL_RE = re.compile(r"^([A-Z]|A[A-F])(\d{2})$", re.IGNORECASE)
+# Lower-case timepoint, channel, day and wavelength tokens (t01, c02, d03,
+# w01) are never wells; upper-case T01, C02, D03 and W01 are wells only when
+# no other well-like token is present
+_ACQUISITION_RE = re.compile(r"^[tcdw]\d+$")
+_AMBIGUOUS_ROWS = ("T", "C", "D", "W")
+_FIELD_RE = re.compile(r"^(?:f|s|fld|site|field)(\d{1,4})$", re.IGNORECASE)
+_Z_RE = re.compile(r"^(?:z|p|plane)(\d{1,4})$", re.IGNORECASE)
+_PLATE_RE = re.compile(r"^plate([A-Za-z0-9]*)$", re.IGNORECASE)
+_TOKEN_SPLIT_RE = re.compile(r"[_\-\s.]+")
+
+
+def row_label_to_index(label: str) -> int:
+    """'A' -> 0, 'Z' -> 25, 'AA' -> 26, 'AF' -> 31"""
+    label = label.upper()
+    if len(label) == 1:
+        return ord(label) - ord("A")
+    return 26 * (ord(label[0]) - ord("A") + 1) + ord(label[1]) - ord("A")
+
+
+def row_index_to_label(index: int) -> str:
+    if index < 26:
+        return chr(ord("A") + index)
+    return chr(ord("A") + index // 26 - 1) + chr(ord("A") + index % 26)
+
+
+def format_well_id(row: int, col: int) -> str:
+    """Zero-based (row, col) -> canonical well id such as 'B03'"""
+    return f"{row_index_to_label(row)}{col + 1:02d}"
+
+
+def parse_well_id(well_id: str) -> tuple:
+    """'B03' -> (1, 2); returns (None, None) if it is not a well id"""
+    match = _WELL_RE.match(well_id.strip()) if well_id else None
+    if not match or not 1 <= int(match.group(2)) <= 48:
+        return None, None
+    return row_label_to_index(match.group(1)), int(match.group(2)) - 1
+
+
+def parse_well_metadata(filename: str) -> dict:
+    """Extract plate, well, field and z-plane from common acquisition filenames.
+
+    Missing parts are None. Rows/cols are zero-based; field and z are as written.
+    """
+    stem = Path(filename.replace("\\", "/")).stem
+    meta = {"plate_id": None, "well_row": None, "well_col": None, "field_index": None, "z_index": None}
+
+    harmony = _HARMONY_RE.search(stem)
+    # Harmony rows and columns count from 1; r00/c00 is not a well
+    if harmony and int(harmony.group(1)) > 0 and int(harmony.group(2)) > 0:
+        meta.update(
+            well_row=int(harmony.group(1)) - 1,
+            well_col=int(harmony.group(2)) - 1,
+            field_index=int(harmony.group(3)),
+            z_index=int(harmony.group(4)),
+        )
+
+    tokens = [t for t in _TOKEN_SPLIT_RE.split(stem) if t]
+    wells = []
+    for i, token in enumerate(tokens):
+        plate = _PLATE_RE.match(token)
+        if plate:
+            # "Plate01" or "Plate_01"
+            if meta["plate_id"] is None:
+                meta["plate_id"] = plate.group(1) or (tokens[i + 1] if i + 1 < len(tokens) else None)
+            continue
+        field = _FIELD_RE.match(token)
+        z = _Z_RE.match(token)
+        # s2/f01/p01 also look like wells; treat them as field/plane tokens
+        if field:
+            if meta["field_index"] is None:
+                meta["field_index"] = int(field.group(1))
+        elif z:
+            if meta["z_index"] is None:
+                meta["z_index"] = int(z.group(1))
+        elif _FILENAME_WELL_RE.match(token) and not _ACQUISITION_RE.match(token):
+            wells.append(token)
+
+    if meta["well_row"] is None and wells:
+        clear = [w for w in wells if w[0].upper() not in _AMBIGUOUS_ROWS]
+        meta["well_row"], meta["well_col"] = parse_well_id(clear[0] if clear else wells[-1])
+    return meta
+
+
+def layout_for(max_row: int, max_col: int) -> tuple:
+    """Smallest standard plate layout containing the given zero-based well"""
+    for rows, cols in sorted(PLATE_LAYOUTS.values()):
+        if max_row < rows and max_col < cols:
+            return rows, cols
+    return max_row + 1, max_col + 1
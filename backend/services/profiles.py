@@ -0,0 +1,209 @@
+import json
+from sqlalchemy import text
+from config import DEFAULT_CONTRAST_THRESHOLD, DEFAULT_EXPOSURE_MIN, DEFAULT_EXPOSURE_MAX
+from services.image_processing import default_focus_threshold
+
+DEFAULT_PROFILE_NAME = "default"
+THRESHOLD_FIELDS = ("focus_threshold", "contrast_threshold", "exposure_min", "exposure_max")
+
+
+def default_thresholds(focus_method: str) -> dict:
+    """Thresholds of a new profile; the focus cutoff depends on the focus measure's scale"""
+    return {
+        "focus_threshold": default_focus_threshold(focus_method),
+        "contrast_threshold": DEFAULT_CONTRAST_THRESHOLD,
+        "exposure_min": DEFAULT_EXPOSURE_MIN,
+        "exposure_max": DEFAULT_EXPOSURE_MAX,
+    }
+
+
+# SQL equivalent of determine_ml_readiness, evaluated for image i under profile p.
+# A missing (NULL) metric fails its check.
+_FOCUS_OK = "COALESCE(i.focus_score >= p.focus_threshold, 0)"
+_CONTRAST_OK = "COALESCE(i.contrast_level >= p.contrast_threshold, 0)"
+_EXPOSURE_OK = "COALESCE(i.exposure_level BETWEEN p.exposure_min AND p.exposure_max, 0)"
+_READY_SQL = f"({_FOCUS_OK} AND {_CONTRAST_OK} AND {_EXPOSURE_OK})"
+_REASON_SQL = f"""COALESCE(NULLIF(RTRIM(
+    (CASE WHEN NOT {_FOCUS_OK} THEN 'focus_too_low, ' ELSE '' END) ||
+    (CASE WHEN NOT {_CONTRAST_OK} THEN 'contrast_too_low, ' ELSE '' END) ||
+    (CASE WHEN NOT {_EXPOSURE_OK} THEN 'exposure_problem, ' ELSE '' END),
+    ', '), ''), 'passed_all_checks')"""
+
+
+def _evaluate(db, where: str, params: dict) -> int:
+    """(Re)compute cached evaluations for image/profile pairs matching where"""
+    result = db.execute(text(f"""
+        INSERT OR REPLACE INTO image_evaluations (profile_id, image_id, is_ml_ready, quality_reason)
+        SELECT p.id, i.id, {_READY_SQL}, {_REASON_SQL}
+        FROM images i
+        JOIN threshold_profiles p ON p.experiment_id = i.experiment_id
+        WHERE {where}
+    """), params)
+    return result.rowcount
+
+
+def _sync_images(db, profile_id: int, where: str = "1 = 1", params: dict = None) -> int:
+    """Mirror the active profile's evaluations onto images.is_ml_ready/quality_reason"""
+    result = db.execute(text(f"""
+        UPDATE images
+        SET is_ml_ready = e.is_ml_ready, quality_reason = e.quality_reason
+        FROM image_evaluations e
+        WHERE e.profile_id = :pid AND e.image_id = images.id
+          AND (images.is_ml_ready IS NOT e.is_ml_ready OR images.quality_reason IS NOT e.quality_reason)
+          AND {where}
+    """), {**(params or {}), "pid": profile_id})
+    return result.rowcount
+
+
+def list_profiles(db, exp_id: int) -> list:
+    return db.execute(text("""
+        SELECT * FROM threshold_profiles WHERE experiment_id = :id ORDER BY id
+    """), {"id": exp_id}).fetchall()
+
+
+def get_profile(db, exp_id: int, name: str = None):
+    """Profile by name, or the experiment's active profile when name is None"""
+    if name is None:
+        return db.execute(text("""
+            SELECT * FROM threshold_profiles WHERE experiment_id = :id AND is_active = 1
+        """), {"id": exp_id}).first()
+    return db.execute(text("""
+        SELECT * FROM threshold_profiles WHERE experiment_id = :id AND name = :name
+    """), {"id": exp_id, "name": name}).first()
+
+
+def ensure_default_profile(db, exp_id: int, focus_method: str = None):
+    """Create and activate the default profile of an experiment without an active one.
+
+    Called when the experiment is created (and by the init_db backfill for
+    older experiments), so reads never write. Safe to repeat: an existing
+    default profile is re-activated rather than inserted twice. The
+    caller commits.
+    """
+    profile_id = db.execute(text("""
+        INSERT INTO threshold_profiles (
+            experiment_id, name, focus_threshold, contrast_threshold, exposure_min, exposure_max
+        )
+        VALUES (:exp_id, :name, :focus_threshold, :contrast_threshold, :exposure_min, :exposure_max)
+        ON CONFLICT (experiment_id, name) DO UPDATE SET is_active = is_active
+        RETURNING id
+    """), {"exp_id": exp_id, "name": DEFAULT_PROFILE_NAME, **default_thresholds(focus_method)}).scalar()
+    _evaluate(db, "p.id = :pid", {"pid": profile_id})
+    activate_profile(db, exp_id, profile_id)
+    return db.execute(
+        text("SELECT * FROM threshold_profiles WHERE id = :id"), {"id": profile_id}
+    ).first()
+
+
+def backfill_default_profiles(conn) -> int:
+    """Give experiments created before profiles existed their default profile"""
+    missing = conn.execute(text("""
+        SELECT id, focus_method FROM experiments e
+        WHERE NOT EXISTS (
+            SELECT 1 FROM threshold_profiles p WHERE p.experiment_id = e.id AND p.is_active = 1
+        )
+    """)).fetchall()
+    for experiment in missing:
+        ensure_default_profile(conn, experiment.id, experiment.focus_method)
+    return len(missing)
+
+
+def create_profile(db, exp_id: int, name: str, thresholds: dict, activate: bool = False):
+    profile_id = db.execute(text("""
+        INSERT INTO threshold_profiles (
+            experiment_id, name, focus_threshold, contrast_threshold, exposure_min, exposure_max
+        )
+        VALUES (:exp_id, :name, :focus_threshold, :contrast_threshold, :exposure_min, :exposure_max)
+        RETURNING id
+    """), {"exp_id": exp_id, "name": name, **thresholds}).scalar()
+    _evaluate(db, "p.id = :pid", {"pid": profile_id})
+    if activate:
+        activate_profile(db, exp_id, profile_id)
+    db.commit()
+    return db.execute(
+        text("SELECT * FROM threshold_profiles WHERE id = :id"), {"id": profile_id}
+    ).first()
+
+
+def activate_profile(db, exp_id: int, profile_id: int) -> int:
+    """Make a profile active and update the stored is_ml_ready of rows whose verdict changes"""
+    db.execute(text("""
+        UPDATE threshold_profiles SET is_active = (id = :pid) WHERE experiment_id = :exp_id
+    """), {"pid": profile_id, "exp_id": exp_id})
+    return _sync_images(db, profile_id, "images.experiment_id = :exp_id", {"exp_id": exp_id})
+
+
+def update_profile(db, profile, thresholds: dict) -> int:
+    """Change a profile's thresholds, re-evaluating only images between old and new bounds"""
+    old = {field: getattr(profile, field) for field in THRESHOLD_FIELDS}
+    new = {field: thresholds.get(field, old[field]) for field in THRESHOLD_FIELDS}
+
+    db.execute(text("""
+        UPDATE threshold_profiles
+        SET focus_threshold = :focus_threshold, contrast_threshold = :contrast_threshold,
+            exposure_min = :exposure_min, exposure_max = :exposure_max,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = :pid
+    """), {**new, "pid": profile.id})
+
+    # An image's verdict can only flip if a metric lies between the old and new bound
+    affected = """p.id = :pid AND (
+        (i.focus_score >= :f_lo AND i.focus_score < :f_hi)
+        OR (i.contrast_level >= :c_lo AND i.contrast_level < :c_hi)
+        OR (i.exposure_level >= :emin_lo AND i.exposure_level < :emin_hi)
+        OR (i.exposure_level > :emax_lo AND i.exposure_level <= :emax_hi)
+    )"""
+    params = {
+        "pid": profile.id,
+        "f_lo": min(old["focus_threshold"], new["focus_threshold"]),
+        "f_hi": max(old["focus_threshold"], new["focus_threshold"]),
+        "c_lo": min(old["contrast_threshold"], new["contrast_threshold"]),
+        "c_hi": max(old["contrast_threshold"], new["contrast_threshold"]),
+        "emin_lo": min(old["exposure_min"], new["exposure_min"]),
+        "emin_hi": max(old["exposure_min"], new["exposure_min"]),
+        "emax_lo": min(old["exposure_max"], new["exposure_max"]),
+        "emax_hi": max(old["exposure_max"], new["exposure_max"]),
+    }
+    recomputed = _evaluate(db, affected, params)
+    if profile.is_active:
+        _sync_images(db, profile.id, "images.experiment_id = :exp_id", {"exp_id": profile.experiment_id})
+    db.commit()
+    return recomputed
+
+
+def delete_profile(db, profile):
+    db.execute(text("DELETE FROM image_evaluations WHERE profile_id = :id"), {"id": profile.id})
+    db.execute(text("DELETE FROM threshold_profiles WHERE id = :id"), {"id": profile.id})
+    db.commit()
+
+
+def evaluate_new_image(db, image_id: int):
+    """Cache evaluations of a freshly inserted image under all its experiment's profiles"""
+    _evaluate(db, "i.id = :image_id", {"image_id": image_id})
+
+
+def reevaluate_experiment(db, exp_id: int, image_ids=None) -> int:
+    """Recompute cached evaluations after images' metrics changed (all images if ids is None)"""
+    where, params = "i.experiment_id = :exp_id", {"exp_id": exp_id}
+    sync_where = "images.experiment_id = :exp_id"
+    if image_ids is not None:
+        ids_sql = " AND {}.id IN (SELECT value FROM json_each(:ids))"
+        where += ids_sql.format("i")
+        sync_where += ids_sql.format("images")
+        params["ids"] = json.dumps(list(image_ids))
+    recomputed = _evaluate(db, where, params)
+    active = get_profile(db, exp_id)
+    if active:
+        _sync_images(db, active.id, sync_where, params)
+    db.commit()
+    return recomputed
+
+
+def delete_experiment_profiles(db, exp_id: int):
+    db.execute(text("""
+        DELETE FROM image_evaluations WHERE profile_id IN (
+            SELECT id FROM threshold_profiles WHERE experiment_id = :id
+        )
+    """), {"id": exp_id})
+    db.execute(text("DELETE FROM threshold_profiles WHERE experiment_id = :id"), {"id": exp_id})
+    db.commit()
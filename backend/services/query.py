@@ -0,0 +1,319 @@
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from fastapi import HTTPException, status
+from sqlalchemy import text, bindparam
+from config import settings
+
+# Facility-wide aggregation over the images of every experiment.
+#
+# Queries that only group and filter by experiment, operator, microscope,
+# session and date are answered from image_summary (one row per day and
+# metadata combination, maintained by triggers in database.init_db); the
+# rest scan images through its date/equipment indexes. Results are cached
+# per normalized query and data version, so a cached result is never stale.
+#
+# The same triggers keep one version counter per experiment, and a query
+# filtered by experiment is keyed by the sum over just those experiments:
+# ingest into one experiment leaves cached queries on the others valid.
+# Unfiltered facility-wide queries are keyed by the sum over all
+# experiments and still miss after every insert anywhere; a debounced
+# global counter would avoid that, but only by serving results up to the
+# debounce interval old, which this cache promises never to do.
+
+def _iso_week(day: str) -> str:
+    """ISO 8601 week ('2026-W01') of a date expression.
+
+    SQLite before 3.46 has no %G/%V, so this goes through the Thursday of
+    the week, whose calendar year is the ISO year by definition.
+    """
+    thursday = f"date({day}, '-3 days', 'weekday 4')"
+    return (f"printf('%s-W%02d', strftime('%Y', {thursday}), "
+            f"(CAST(strftime('%j', {thursday}) AS INTEGER) - 1) / 7 + 1)")
+
+# Dimension -> (image_summary expression, images expression)
+DIMENSIONS = {
+    "experiment": ("s.experiment_id", "i.experiment_id"),
+    "operator": ("NULLIF(s.operator_id, '')", "i.operator_id"),
+    "microscope": ("NULLIF(s.microscope_id, '')", "i.microscope_id"),
+    "session": ("NULLIF(s.imaging_session_id, '')", "i.imaging_session_id"),
+    "day": ("NULLIF(s.day, '')", "date(i.created_at)"),
+    "week": (_iso_week("NULLIF(s.day, '')"), _iso_week("i.created_at")),
+    "month": ("strftime('%Y-%m', s.day)", "strftime('%Y-%m', i.created_at)"),
+    "plate": (None, "i.plate_id"),
+    "analysis_mode": (None, "i.analysis_mode"),
+    "focus_method": (None, "i.focus_method"),
+}
+
+# Equality filters (comma-separated values) -> (summary column, images column)
+FILTER_DIMENSIONS = {
+    "experiment": ("s.experiment_id", "i.experiment_id"),
+    "operator": ("s.operator_id", "i.operator_id"),
+    "microscope": ("s.microscope_id", "i.microscope_id"),
+    "session": ("s.imaging_session_id", "i.imaging_session_id"),
+}
+
+# Aggregate -> (image_summary expression, images expression)
+METRICS = {
+    "count": ("SUM(s.n)", "COUNT(*)"),
+    "ready": ("SUM(s.ready)", "SUM(i.is_ml_ready)"),
+    "pass_rate": ("100.0 * SUM(s.ready) / SUM(s.n)", "100.0 * SUM(i.is_ml_ready) / COUNT(*)"),
+    # Like AVG(), the summary averages skip images without the metric
+    "avg_focus": ("SUM(s.sum_focus) / NULLIF(SUM(s.n_focus), 0)", "AVG(i.focus_score)"),
+    "avg_contrast": ("SUM(s.sum_contrast) / NULLIF(SUM(s.n_contrast), 0)", "AVG(i.contrast_level)"),
+    "avg_exposure": ("SUM(s.sum_exposure) / NULLIF(SUM(s.n_exposure), 0)", "AVG(i.exposure_level)"),
+}
+
+# Per-image metric filters, e.g. "focus>=150" (forces the images scan)
+FILTER_METRICS = {
+    "focus": "i.focus_score",
+    "contrast": "i.contrast_level",
+    "exposure": "i.exposure_level",
+    "diameter": "i.organoid_diameter",
+    "circularity": "i.organoid_shape_regularity",
+    "ml_ready": "i.is_ml_ready",
+}
+FILTER_OPERATORS = (">=", "<=", "!=", "=", ">", "<")
+_FILTER_PATTERN = re.compile(
+    r"^\s*(\w+)\s*(" + "|".join(re.escape(op) for op in FILTER_OPERATORS) + r")\s*(\S+)\s*$"
+)
+
+
+@dataclass(frozen=True)
+class QuerySpec:
+    """Normalized query; equal specs share a cache entry"""
+    group_by: tuple
+    metrics: tuple
+    filters: tuple          # ((dimension, (values...)), ...)
+    metric_filters: tuple   # ((metric, operator, value), ...)
+    since: str = None
+    until: str = None
+    order_by: str = None
+    limit: int = None
+
+    @property
+    def uses_summary(self) -> bool:
+        return not self.metric_filters and all(DIMENSIONS[d][0] for d in self.group_by)
+
+
+def _bad_request(detail: str):
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+def _split(value) -> list:
+    return [v.strip() for v in value.split(",") if v.strip()] if value else []
+
+def _check(kind: str, names, allowed):
+    unknown = [n for n in names if n not in allowed]
+    if unknown:
+        _bad_request(f"Unknown {kind}: {', '.join(unknown)}. Available: {', '.join(allowed)}")
+
+def _iso_date(name: str, value):
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        _bad_request(f"{name} must be a date (YYYY-MM-DD)")
+
+def parse_query(
+    group_by: str = None,
+    metrics: str = None,
+    filters: dict = None,
+    metric_filters: list = None,
+    since: str = None,
+    until: str = None,
+    order_by: str = None,
+    limit: int = None
+) -> QuerySpec:
+    """Validate request parameters against the whitelists and normalize them"""
+    dimensions = _split(group_by)
+    _check("dimensions", dimensions, DIMENSIONS)
+    selected = _split(metrics) or list(METRICS)
+    _check("metrics", selected, METRICS)
+
+    equality = []
+    for dimension, value in sorted((filters or {}).items()):
+        values = _split(value)
+        if not values:
+            continue
+        if dimension == "experiment":
+            try:
+                values = [int(v) for v in values]
+            except ValueError:
+                _bad_request("experiment filter takes experiment ids")
+        equality.append((dimension, tuple(sorted(set(values)))))
+
+    conditions = []
+    for expression in metric_filters or []:
+        match = _FILTER_PATTERN.match(expression)
+        if not match:
+            _bad_request(f"Bad filter '{expression}'. Use <metric><op><number>, e.g. focus>=150")
+        metric, op, value = match.groups()
+        _check("filter metrics", [metric], FILTER_METRICS)
+        try:
+            conditions.append((metric, op, float(value)))
+        except ValueError:
+            _bad_request(f"Bad filter '{expression}': {value!r} is not a number")
+
+    if order_by and order_by.lstrip("-") not in dimensions + selected:
+        _bad_request("order_by must be one of the selected dimensions or metrics (prefix - for descending)")
+
+    max_rows = settings.query_max_rows
+    return QuerySpec(
+        group_by=tuple(dimensions),
+        metrics=tuple(selected),
+        filters=tuple(equality),
+        metric_filters=tuple(sorted(set(conditions))),
+        since=_iso_date("since", since),
+        until=_iso_date("until", until),
+        order_by=order_by,
+        limit=min(limit or max_rows, max_rows),
+    )
+
+
+def build_sql(spec: QuerySpec) -> tuple:
+    """SELECT statement and parameters for a spec"""
+    side = 0 if spec.uses_summary else 1
+    params = {}
+    where = []
+
+    for dimension, values in spec.filters:
+        name = f"f_{dimension}"
+        where.append(f"{FILTER_DIMENSIONS[dimension][side]} IN :{name}")
+        params[name] = list(values)
+
+    if spec.uses_summary:
+        source = "image_summary s"
+        if spec.since:
+            where.append("s.day >= :since")
+        if spec.until:
+            where.append("s.day <= :until")
+    else:
+        source = "images i"
+        if spec.since:
+            where.append("i.created_at >= :since")
+        if spec.until:
+            where.append("i.created_at < date(:until, '+1 day')")
+        for index, (metric, op, value) in enumerate(spec.metric_filters):
+            where.append(f"{FILTER_METRICS[metric]} {op} :m{index}")
+            params[f"m{index}"] = value
+    if spec.since:
+        params["since"] = spec.since
+    if spec.until:
+        params["until"] = spec.until
+
+    columns = [f"{DIMENSIONS[d][side]} AS {d}" for d in spec.group_by]
+    columns += [f"{METRICS[m][side]} AS {m}" for m in spec.metrics]
+    sql = f"SELECT {', '.join(columns)} FROM {source}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    # Result columns are referenced by position; aliases like "day" would
+    # otherwise be ambiguous with source columns
+    positions = [str(n) for n in range(1, len(spec.group_by) + 1)]
+    if spec.group_by:
+        sql += " GROUP BY " + ", ".join(positions)
+    if spec.order_by:
+        name = spec.order_by.lstrip("-")
+        position = (spec.group_by + spec.metrics).index(name) + 1
+        sql += f" ORDER BY {position}{' DESC' if spec.order_by.startswith('-') else ''}"
+    elif spec.group_by:
+        sql += " ORDER BY " + ", ".join(positions)
+    # One extra row tells the caller the result was truncated
+    sql += f" LIMIT {spec.limit + 1}"
+
+    statement = text(sql)
+    for dimension, _ in spec.filters:
+        statement = statement.bindparams(bindparam(f"f_{dimension}", expanding=True))
+    return statement, params
+
+
+class QueryCache:
+    """LRU of query results keyed by (spec, data_version)"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, result):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+query_cache = QueryCache(settings.query_cache_entries)
+
+
+def data_version(db, experiment_ids=None) -> int:
+    """Sum of the per-experiment counters the images triggers bump on every change
+    that affects queries (over all experiments when experiment_ids is None)"""
+    if experiment_ids is None:
+        return db.execute(text("SELECT SUM(version) FROM data_versions")).scalar() or 0
+    return db.execute(
+        text("SELECT SUM(version) FROM data_versions WHERE experiment_id IN :ids").bindparams(
+            bindparam("ids", expanding=True)
+        ),
+        {"ids": list(experiment_ids)}
+    ).scalar() or 0
+
+
+def run_query(db, spec: QuerySpec, cache: QueryCache = query_cache) -> dict:
+    """Execute a spec, serving repeated queries from the cache until the data changes"""
+    version = data_version(db, dict(spec.filters).get("experiment"))
+    key = (spec, version)
+    result = cache.get(key)
+    if result is not None:
+        return {**result, "cached": True}
+
+    statement, params = build_sql(spec)
+    rows = db.execute(statement, params).mappings().fetchall()
+    truncated = len(rows) > spec.limit
+    rows = [
+        {k: round(v, 2) if isinstance(v, float) else v for k, v in row.items()}
+        for row in rows[:spec.limit]
+    ]
+
+    if "experiment" in spec.group_by and rows:
+        ids = sorted({row["experiment"] for row in rows})
+        names = dict(db.execute(
+            text("SELECT id, name FROM experiments WHERE id IN :ids").bindparams(
+                bindparam("ids", expanding=True)
+            ),
+            {"ids": ids}
+        ).fetchall())
+        for row in rows:
+            row["experiment_name"] = names.get(row["experiment"])
+
+    result = {
+        "source": "image_summary" if spec.uses_summary else "images",
+        "data_version": version,
+        "group_by": list(spec.group_by),
+        "metrics": list(spec.metrics),
+        "rows": rows,
+        "truncated": truncated,
+    }
+    cache.put(key, result)
+    return {**result, "cached": False}
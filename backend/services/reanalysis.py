@@ -0,0 +1,89 @@
+from fastapi import HTTPException
+from sqlalchemy import text, bindparam
+from database import SessionLocal
+from config import settings, ANALYSIS_MODES, DEFAULT_FOCUS_METHOD
+from services.image_processing import analyze_image
+from services.dedup import hash_bands
+from services.profiles import reevaluate_experiment
+from services.archive import read_original
+from services.events import bus
+
+
+def coarser_modes(mode: str) -> list:
+    """Analysis modes that decode at lower resolution than mode"""
+    return [m for m, factor in ANALYSIS_MODES.items() if factor > ANALYSIS_MODES[mode]]
+
+
+def count_upgradable(db, exp_id: int, mode: str) -> int:
+    """Images of an experiment analysed at lower resolution than mode"""
+    return db.execute(
+        text("""
+            SELECT COUNT(*) FROM images
+            WHERE experiment_id = :id AND analysis_mode IN :modes
+        """).bindparams(bindparam("modes", expanding=True)),
+        {"id": exp_id, "modes": coarser_modes(mode) or [""]}
+    ).scalar()
+
+
+def _reanalyze_row(db, row, mode: str) -> bool:
+    try:
+        contents = read_original(db, row)
+        metrics = analyze_image(contents, row.focus_method or DEFAULT_FOCUS_METHOD, mode, thumbnail=False)
+    except (OSError, HTTPException) as e:
+        print(f"⚠️ Reanalysis of image {row.id} failed: {e}")
+        return False
+
+    bands = hash_bands(metrics["phash"]) if metrics["phash"] is not None else (None,) * 4
+    db.execute(text("""
+        UPDATE images
+        SET focus_score = :focus, contrast_level = :contrast, exposure_level = :exposure,
+            organoid_diameter = :diameter, organoid_shape_regularity = :circularity,
+            width = :width, height = :height,
+            phash = :phash, phash_b0 = :b0, phash_b1 = :b1, phash_b2 = :b2, phash_b3 = :b3,
+            analysis_mode = :mode
+        WHERE id = :id
+    """), {
+        "id": row.id, "mode": mode,
+        "focus": metrics["focus"], "contrast": metrics["contrast"], "exposure": metrics["exposure"],
+        "diameter": metrics["diameter"], "circularity": metrics["circularity"],
+        "width": metrics["width"], "height": metrics["height"],
+        "phash": metrics["phash"], "b0": bands[0], "b1": bands[1], "b2": bands[2], "b3": bands[3],
+    })
+    return True
+
+
+def reanalyze_experiment(exp_id: int, mode: str = "full", chunk_size: int = None) -> dict:
+    """Background task: recompute metrics of images analysed below mode's resolution.
+
+    Works through the images in chunks, committing each chunk with the
+    profile evaluations of its images, so readers see upgraded rows as
+    they land and an interrupted run can simply be started again.
+    """
+    chunk_size = chunk_size or settings.reanalyze_chunk_size
+    db = SessionLocal()
+    upgraded = failed = 0
+    try:
+        last_id = 0
+        while True:
+            rows = db.execute(
+                text("""
+                    SELECT id, file_path, content_hash, focus_method FROM images
+                    WHERE experiment_id = :id AND analysis_mode IN :modes AND id > :last_id
+                    ORDER BY id LIMIT :limit
+                """).bindparams(bindparam("modes", expanding=True)),
+                {"id": exp_id, "modes": coarser_modes(mode) or [""], "last_id": last_id, "limit": chunk_size}
+            ).fetchall()
+            if not rows:
+                break
+
+            done = [row.id for row in rows if _reanalyze_row(db, row, mode)]
+            upgraded += len(done)
+            failed += len(rows) - len(done)
+            reevaluate_experiment(db, exp_id, done)
+            last_id = rows[-1].id
+    finally:
+        db.close()
+
+    print(f"🔬 Experiment {exp_id}: reanalysed {upgraded} images at '{mode}' ({failed} failed)")
+    bus.publish(exp_id, "images_reanalyzed", {"mode": mode, "upgraded": upgraded, "failed": failed})
+    return {"experiment_id": exp_id, "mode": mode, "upgraded": upgraded, "failed": failed}
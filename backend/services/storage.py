@@ -1,39 +1,225 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import uuid
 from pathlib import Path
-from utils.paths import get_experiment_upload_dir
-
-def save_image_file(exp_id: int, filename: str, contents: bytes) -> Path:
-    """Save original image to disk"""
-    exp_dir = get_experiment_upload_dir(exp_id)
-    safe_filename = filename.replace("../", "").replace("..\\", "")
-    original_path = exp_dir / "originals" / safe_filename
-    
-    with open(original_path, "wb") as f:
-        f.write(contents)
-    
-    # Store relative path (from backend root)
-    abs_original_path = original_path.resolve()
-    backend_root = Path(__file__).parent.parent.resolve()
-    relative_path = abs_original_path.relative_to(backend_root)
-    print(f"✓ Saved original: {original_path}")
-    print(f"  Relative path: {relative_path}")
+from config import settings
+
+BACKEND_ROOT = Path(__file__).parent.parent.resolve()
+
+# Thumbnail format -> (file extension, media type)
+THUMBNAIL_TYPES = {
+    "JPEG": (".jpg", "image/jpeg"),
+    "WEBP": (".webp", "image/webp"),
+    "PNG": (".png", "image/png"),
+}
+
+
+class LocalObjectStore:
+    """Object-store style interface (put/get/delete by key) over a local directory.
+
+    Keys are '/'-separated like S3 object keys, so a bucket-backed store can
+    replace this one without touching callers.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root).resolve()
+        self._known_dirs = set()
+        try:
+            self._relative_root = self.root.relative_to(BACKEND_ROOT)
+        except ValueError:
+            self._relative_root = self.root
+
+    def path_for(self, key: str) -> Path:
+        """Absolute filesystem path of a key"""
+        return self.root / key
+
+    def relative_path(self, key: str) -> Path:
+        """Path of a key as stored in the database (relative to backend root)"""
+        return self._relative_root / key
+
+    def _ensure_dir(self, directory: Path):
+        """Create directory once per process instead of on every write"""
+        if directory in self._known_dirs:
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+        self._known_dirs.add(directory)
+
+    def put(self, key: str, data: bytes, durable: bool = False) -> Path:
+        """Write object atomically (temp file + rename), return relative path.
+
+        durable fsyncs the data before the rename, for writes that are
+        acknowledged to a client before anything else references them.
+        """
+        target = self.path_for(key)
+        self._ensure_dir(target.parent)
+        try:
+            fd, tmp_name = tempfile.mkstemp(dir=target.parent, prefix=".tmp-")
+        except FileNotFoundError:
+            # Directory removed since it was cached (experiment deletion, orphan GC)
+            self._known_dirs.discard(target.parent)
+            self._ensure_dir(target.parent)
+            fd, tmp_name = tempfile.mkstemp(dir=target.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                if durable:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_name, target)
+        except BaseException:
+            try:
+                os.unlink(tmp_name)
+            except FileNotFoundError:
+                pass
+            raise
+        return self.relative_path(key)
+
+    def put_file(self, key: str, source: Path) -> Path:
+        """Hard-link an existing file (on the same filesystem) at key, return relative path.
+
+        source is left in place for the caller to remove once the object is
+        referenced, so a failure in between loses nothing.
+        """
+        target = self.path_for(key)
+        self._ensure_dir(target.parent)
+        tmp_name = target.parent / f".tmp-{uuid.uuid4().hex}"
+        os.link(source, tmp_name)
+        try:
+            os.replace(tmp_name, target)
+        except BaseException:
+            tmp_name.unlink(missing_ok=True)
+            raise
+        return self.relative_path(key)
+
+    def move(self, source_key: str, key: str):
+        """Rename an object, replacing any object at key"""
+        os.replace(self.path_for(source_key), self.path_for(key))
+
+    def keys(self, prefix: str) -> list:
+        """Sorted keys in prefix's directory whose name starts with the rest of prefix"""
+        directory, _, start = prefix.rpartition("/")
+        try:
+            names = os.listdir(self.path_for(directory))
+        except FileNotFoundError:
+            return []
+        return sorted(f"{directory}/{name}" if directory else name
+                      for name in names if name.startswith(start) and not name.startswith(".tmp-"))
+
+    async def put_async(self, key: str, data: bytes) -> Path:
+        """Non-blocking put, runs the write in a worker thread"""
+        return await asyncio.to_thread(self.put, key, data)
+
+    async def put_many(self, items) -> list:
+        """Write several (key, data) pairs concurrently"""
+        return list(await asyncio.gather(
+            *(self.put_async(key, data) for key, data in items)
+        ))
+
+    def get(self, key: str) -> bytes:
+        return self.path_for(key).read_bytes()
+
+    def exists(self, key: str) -> bool:
+        return self.path_for(key).exists()
+
+    def delete(self, key: str):
+        try:
+            self.path_for(key).unlink()
+        except FileNotFoundError:
+            pass
+
+
+store = LocalObjectStore(settings.upload_dir)
+
+
+def init_storage():
+    """Create the upload root; called from app startup rather than at import"""
+    store._ensure_dir(store.root)
+
+
+def content_digest(contents: bytes) -> str:
+    """SHA-256 hex digest of file contents"""
+    return hashlib.sha256(contents).hexdigest()
+
+
+def _safe_filename(filename: str) -> str:
+    return Path(filename.replace("\\", "/")).name
+
+
+def _shard(digest: str) -> str:
+    # Two levels of 256 directories keep each directory small on large experiments
+    return f"{digest[:2]}/{digest[2:4]}"
+
+
+def original_key(exp_id: int, filename: str, digest: str) -> str:
+    """Object key of an original; digest prefix prevents same-name overwrites"""
+    return f"experiment_{exp_id}/originals/{_shard(digest)}/{digest[:16]}_{_safe_filename(filename)}"
+
+
+def thumbnail_key(exp_id: int, filename: str, digest: str) -> str:
+    """Object key of a thumbnail, sharded by the original's digest"""
+    stem = _safe_filename(filename).rsplit(".", 1)[0]
+    extension = THUMBNAIL_TYPES[settings.thumbnail_format.upper()][0]
+    return f"experiment_{exp_id}/thumbnails/{_shard(digest)}/{digest[:16]}_{stem}_thumb{extension}"
+
+
+def thumbnail_media_type(path: Path) -> str:
+    """Media type of a stored thumbnail, from its extension"""
+    for extension, media_type in THUMBNAIL_TYPES.values():
+        if path.suffix.lower() == extension:
+            return media_type
+    return "image/jpeg"
+
+
+async def save_image_file(
+    exp_id: int, filename: str, contents: bytes, digest: str = None, source_path: Path = None
+) -> Path:
+    """Save original image to disk (linked from source_path when given)"""
+    digest = digest or content_digest(contents)
+    key = original_key(exp_id, filename, digest)
+    if source_path:
+        relative_path = await asyncio.to_thread(store.put_file, key, source_path)
+    else:
+        relative_path = await store.put_async(key, contents)
+    print(f"✓ Saved original: {relative_path}")
     return relative_path
-def save_thumbnail_file(exp_id: int, filename: str, thumb_bytes: bytes) -> Path:
+
+
+async def save_thumbnail_file(exp_id: int, filename: str, thumb_bytes: bytes, digest: str) -> Path:
     """Save thumbnail to disk"""
     if not thumb_bytes:
         return None
-    
-    exp_dir = get_experiment_upload_dir(exp_id)
-    safe_filename = filename.replace("../", "").replace("..\\", "")
-    thumb_filename = safe_filename.rsplit(".", 1)[0] + "_thumb.jpg"
-    thumb_path = exp_dir / "thumbnails" / thumb_filename
-    
-    with open(thumb_path, "wb") as f:
-        f.write(thumb_bytes)
-    
-    # Store relative path (from backend root)
-    abs_thumb_path = thumb_path.resolve()
-    backend_root = Path(__file__).parent.parent.resolve()
-    relative_path = abs_thumb_path.relative_to(backend_root)
+
+    relative_path = await store.put_async(thumbnail_key(exp_id, filename, digest), thumb_bytes)
+    print(f"✓ Saved thumbnail: {relative_path}")
+    return relative_path
+
+
+async def save_upload_files(
+    exp_id: int, filename: str, contents: bytes, thumb_bytes: bytes,
+    digest: str = None, source_path: Path = None
+) -> tuple:
+    """Save original and thumbnail in one concurrent batch.
+
+    source_path is an assembled chunked upload holding contents; it is
+    linked into place rather than rewritten, and left for the caller to
+    delete.
+    """
+    digest = digest or content_digest(contents)
+    if source_path:
+        original_path, thumb_path = await asyncio.gather(
+            save_image_file(exp_id, filename, contents, digest, source_path),
+            save_thumbnail_file(exp_id, filename, thumb_bytes, digest)
+        )
+        return original_path, thumb_path
+    if not thumb_bytes:
+        return await save_image_file(exp_id, filename, contents, digest), None
+
+    original_path, thumb_path = await store.put_many([
+        (original_key(exp_id, filename, digest), contents),
+        (thumbnail_key(exp_id, filename, digest), thumb_bytes),
+    ])
+    print(f"✓ Saved original: {original_path}")
     print(f"✓ Saved thumbnail: {thumb_path}")
-    print(f"  Relative path: {relative_path}")
-    return relative_path
\ No newline at end of file
+    return original_path, thumb_path
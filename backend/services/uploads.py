@@ -0,0 +1,271 @@
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import uuid
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from config import settings
+from services.storage import store
+from services.ingest import (
+    ingest_image, get_upload_experiment, claim_idempotency_key, release_idempotency_key
+)
+
+# Resumable (tus-style) uploads: a session is created with the final size,
+# chunks are appended at the offset the server reports, and finalize runs
+# the normal ingest on the assembled file. upload_sessions.received is the
+# source of truth for the offset. Each chunk is staged in a file of its own
+# and renamed to partial/<id>.<offset>.chunk only after the conditional
+# update of received has accepted it, so a writer that loses the race (or
+# is interrupted) never touches accepted bytes. Finalize concatenates the
+# chunks into partial/<id>.part, hashing as it copies, and analyses that
+# file through a read-only memory map.
+
+# Read size when assembling and hashing part files
+COPY_BLOCK_BYTES = 1024 * 1024
+
+_locks = {}
+
+
+def partial_key(upload_id: str) -> str:
+    return f"partial/{upload_id}.part"
+
+
+def chunk_key(upload_id: str, offset: int) -> str:
+    return f"partial/{upload_id}.{offset:020d}.chunk"
+
+
+def _chunk_keys(upload_id: str) -> list:
+    """Accepted chunks of an upload in offset order (the zero-padded offset sorts)"""
+    return [key for key in store.keys(f"partial/{upload_id}.") if key.endswith(".chunk")]
+
+
+def _delete_upload_data(upload_id: str, part: bool = True):
+    for key in store.keys(f"partial/{upload_id}."):
+        if part or key != partial_key(upload_id):
+            store.delete(key)
+
+
+def upload_lock(upload_id: str) -> asyncio.Lock:
+    """Serializes chunk writes and finalize of one session within this process"""
+    lock = _locks.get(upload_id)
+    if lock is None:
+        lock = _locks[upload_id] = asyncio.Lock()
+    return lock
+
+
+def create_upload_session(db, experiment_id: int, filename: str, size: int,
+                          metadata: dict, checksum: str = None) -> str:
+    upload_id = uuid.uuid4().hex
+    db.execute(text("""
+        INSERT INTO upload_sessions (id, experiment_id, filename, size, checksum, metadata)
+        VALUES (:id, :exp_id, :filename, :size, :checksum, :metadata)
+    """), {
+        "id": upload_id, "exp_id": experiment_id, "filename": filename, "size": size,
+        "checksum": checksum.lower() if checksum else None, "metadata": json.dumps(metadata)
+    })
+    return upload_id
+
+
+def get_upload_session(db, upload_id: str):
+    session = db.execute(
+        text("SELECT * FROM upload_sessions WHERE id = :id"), {"id": upload_id}
+    ).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+
+def _offset_mismatch(offset: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail={"message": "Offset mismatch", "offset": offset},
+        headers={"Upload-Offset": str(offset)}
+    )
+
+
+async def append_chunk(db, upload_id: str, offset: int, body) -> int:
+    """Store the chunk streamed by body (async iterable of bytes) at offset; return the new offset.
+
+    A mismatched offset (lost response, parallel writer) is a 409 carrying
+    the server's offset so the client can resume from there. The body is
+    read only up to the chunk limit and the bytes the session still
+    expects. The offset advances only from the value the chunk was staged
+    for, and the chunk is kept only if that update won, so a writer in
+    another process that got there first turns this request into a 409.
+    """
+    session = get_upload_session(db, upload_id)
+    if session.image_id is not None:
+        raise HTTPException(status_code=409, detail="Upload already finalized")
+    if offset != session.received:
+        raise _offset_mismatch(session.received)
+
+    chunk_limit = settings.upload_chunk_max_mb * 1024 * 1024
+    data = bytearray()
+    async for piece in body:
+        data += piece
+        if len(data) > chunk_limit:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Chunks are limited to {settings.upload_chunk_max_mb} MB"
+            )
+        if offset + len(data) > session.size:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Chunk exceeds the declared upload size ({session.size} bytes)"
+            )
+    if not data:
+        return offset
+
+    staged = f"{chunk_key(upload_id, offset)}.{uuid.uuid4().hex}.pending"
+    await asyncio.to_thread(store.put, staged, bytes(data), True)
+    received = offset + len(data)
+    advanced = 0
+    try:
+        async with upload_lock(upload_id):
+            advanced = db.execute(text("""
+                UPDATE upload_sessions SET received = :received, updated_at = CURRENT_TIMESTAMP
+                WHERE id = :id AND received = :offset AND image_id IS NULL
+            """), {"id": upload_id, "received": received, "offset": offset}).rowcount
+            db.commit()
+            if advanced:
+                store.move(staged, chunk_key(upload_id, offset))
+    finally:
+        if not advanced:
+            store.delete(staged)
+    if not advanced:
+        raise _offset_mismatch(get_upload_session(db, upload_id).received)
+    return received
+
+
+def _assemble_part(upload_id: str, size: int) -> str:
+    """Concatenate the accepted chunks into the part file; return its SHA-256.
+
+    A part file left by an earlier finalize whose insert failed is reused.
+    Returns None if chunks are missing or the total is not size.
+    """
+    part = store.path_for(partial_key(upload_id))
+    digest = hashlib.sha256()
+    if part.exists():
+        _delete_upload_data(upload_id, part=False)
+        if part.stat().st_size != size:
+            return None
+        with open(part, "rb") as f:
+            for block in iter(lambda: f.read(COPY_BLOCK_BYTES), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    chunks = _chunk_keys(upload_id)
+    if not chunks:
+        return None
+    assembling = f"{partial_key(upload_id)}.{uuid.uuid4().hex}.pending"
+    written = 0
+    try:
+        with open(store.path_for(assembling), "wb") as out:
+            for key in chunks:
+                if int(key.rsplit(".", 2)[1]) != written:
+                    return None
+                with open(store.path_for(key), "rb") as f:
+                    for block in iter(lambda: f.read(COPY_BLOCK_BYTES), b""):
+                        digest.update(block)
+                        out.write(block)
+                        written += len(block)
+            out.flush()
+            os.fsync(out.fileno())
+        if written != size:
+            return None
+        store.move(assembling, partial_key(upload_id))
+    finally:
+        store.delete(assembling)
+    _delete_upload_data(upload_id, part=False)
+    return digest.hexdigest()
+
+
+async def finalize_upload(db, upload_id: str) -> dict:
+    """Ingest the assembled file once; repeated calls return the first response.
+
+    The session id doubles as the idempotency key, so a finalize whose
+    response was lost can be retried safely.
+    """
+    key = f"upload-session:{upload_id}"
+    async with upload_lock(upload_id):
+        session = get_upload_session(db, upload_id)
+        stored = claim_idempotency_key(db, key, f"finalize:{upload_id}")
+        if stored is not None:
+            return stored
+
+        try:
+            if session.received != session.size:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail={"message": "Upload incomplete", "offset": session.received, "size": session.size},
+                    headers={"Upload-Offset": str(session.received)}
+                )
+            experiment = get_upload_experiment(db, session.experiment_id)
+            digest = await asyncio.to_thread(_assemble_part, upload_id, session.size)
+            if digest is None:
+                raise HTTPException(status_code=410, detail="Upload data is incomplete; start a new upload")
+            if session.checksum and digest != session.checksum:
+                raise HTTPException(
+                    status_code=422,
+                    detail="SHA-256 of the assembled upload does not match the declared checksum"
+                )
+
+            # Analysed through a memory map, so the file is never copied onto the heap
+            part = store.path_for(partial_key(upload_id))
+            with open(part, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as contents:
+                response = await ingest_image(
+                    db, experiment, session.filename, contents,
+                    json.loads(session.metadata), idempotency_key=key, source_path=part, digest=digest
+                )
+        except BaseException:
+            release_idempotency_key(db, key)
+            raise
+
+        db.execute(text("""
+            UPDATE upload_sessions SET image_id = :image_id, updated_at = CURRENT_TIMESTAMP
+            WHERE id = :id
+        """), {"id": upload_id, "image_id": response["id"]})
+        db.commit()
+    _locks.pop(upload_id, None)
+    print(f"✓ Finalized chunked upload {upload_id} ({session.size} bytes) as image {response['id']}")
+    return response
+
+
+def abort_upload(db, upload_id: str):
+    get_upload_session(db, upload_id)
+    db.execute(text("DELETE FROM upload_sessions WHERE id = :id"), {"id": upload_id})
+    db.commit()
+    _delete_upload_data(upload_id)
+    _locks.pop(upload_id, None)
+
+
+def open_partial_paths(db) -> list:
+    """Chunk and part files of unfinished sessions (kept by the orphan collector)"""
+    ids = set(db.execute(text("SELECT id FROM upload_sessions WHERE image_id IS NULL")).scalars())
+    return [
+        store.path_for(key) for key in store.keys("partial/")
+        if key.split("/", 1)[1].split(".", 1)[0] in ids
+    ]
+
+
+def expire_upload_sessions(db, ttl_hours: float = None) -> int:
+    """Drop unfinished sessions and completed idempotency records older than the TTL"""
+    ttl_hours = settings.upload_session_ttl_hours if ttl_hours is None else ttl_hours
+    cutoff = f"-{ttl_hours * 3600:.0f} seconds"
+    expired = db.execute(text("""
+        DELETE FROM upload_sessions WHERE updated_at < datetime('now', :cutoff) RETURNING id, image_id
+    """), {"cutoff": cutoff}).fetchall()
+    db.execute(text("""
+        DELETE FROM idempotency_keys
+        WHERE response IS NOT NULL AND created_at < datetime('now', :cutoff)
+    """), {"cutoff": cutoff})
+    db.commit()
+    for row in expired:
+        _delete_upload_data(row.id)
+        _locks.pop(row.id, None)
+    abandoned = sum(1 for row in expired if row.image_id is None)
+    if abandoned:
+        print(f"🧹 Expired {abandoned} unfinished uploads")
+    return abandoned
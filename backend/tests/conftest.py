@@ -0,0 +1,61 @@
+import sys
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import importlib
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import database
+from database import init_db
+from services.storage import LocalObjectStore
+
+# Modules that bind SessionLocal / store at import time
+_SESSION_USERS = ("database", "services.cleanup", "services.archive", "services.reanalysis")
+_STORE_USERS = ("services.storage", "services.cleanup", "services.archive", "services.uploads")
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    """File-backed temp database wired in wherever the app opens its own sessions"""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False}
+    )
+    init_db(engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    for name in _SESSION_USERS:
+        monkeypatch.setattr(importlib.import_module(name), "SessionLocal", factory)
+    yield factory
+    engine.dispose()
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
+
+@pytest.fixture
+def object_store(tmp_path, monkeypatch):
+    """Temp upload root in place of settings.upload_dir"""
+    temp_store = LocalObjectStore(tmp_path / "uploads")
+    for name in _STORE_USERS:
+        monkeypatch.setattr(importlib.import_module(name), "store", temp_store)
+    return temp_store
+
+@pytest.fixture
+def client(session_factory, object_store):
+    """API client on the temp database and store (startup hooks are not run)"""
+    from fastapi.testclient import TestClient
+    from main import app
+
+    def get_test_db():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[database.get_db] = get_test_db
+    yield TestClient(app)
+    app.dependency_overrides.clear()
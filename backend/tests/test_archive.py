@@ -0,0 +1,137 @@
+import sys
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import io
+import zlib
+import numpy as np
+import pytest
+from PIL import Image
+from sqlalchemy import text
+from services.archive import encode_for_archive, HotCache, compact_originals, delete_unreferenced_blobs
+from services.storage import content_digest
+
+def create_tiff(dtype=np.uint16):
+    """Uncompressed single-page TIFF with a smooth background, like a microscope frame"""
+    y, x = np.mgrid[0:256, 0:256]
+    pixels = (1000 + 4 * x + 2 * y).astype(dtype)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="TIFF")
+    return buffer.getvalue(), pixels
+
+def test_tiff_reencoded_losslessly():
+    """Uncompressed TIFFs become deflate TIFFs that decode to identical pixels"""
+    data, pixels = create_tiff()
+    codec, payload, _, _ = encode_for_archive(data, "frame.tif")
+
+    assert codec == "tiff_deflate"
+    assert len(payload) < len(data)
+    assert np.array_equal(np.array(Image.open(io.BytesIO(payload))), pixels)
+
+def test_incompressible_original_kept_verbatim():
+    """Random bytes (e.g. already-compressed JPEG) are stored as uploaded"""
+    data = np.random.default_rng(0).integers(0, 256, 4096, dtype=np.uint8).tobytes()
+    codec, payload, _, _ = encode_for_archive(data, "noise.jpg")
+    assert codec == "verbatim"
+    assert payload == data
+
+def test_unknown_format_falls_back_to_zlib():
+    """Compressible files without an image re-encoder are stored byte-exact with zlib"""
+    data = b"organoid " * 1000
+    codec, payload, _, _ = encode_for_archive(data, "notes.tif")
+    assert codec == "zlib"
+    assert zlib.decompress(payload) == data
+
+def test_hot_cache_evicts_least_recently_used():
+    cache = HotCache(max_bytes=400)
+    cache.put("a", b"x" * 100)
+    cache.put("b", b"x" * 100)
+    cache.get("a")
+    cache.put("c", b"x" * 100)
+    cache.put("d", b"x" * 100)
+    cache.put("e", b"x" * 100)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.bytes <= 400
+
+@pytest.fixture
+def originals(db, object_store):
+    """One TIFF uploaded to two experiments (a, b) and again, just now, to the second (c)"""
+    data, _ = create_tiff()
+    digest = content_digest(data)
+    db.execute(text("INSERT INTO experiments (id, name) VALUES (1, 'A'), (2, 'B')"))
+    ids = {}
+    for name, exp_id, age in (("a", 1, "-30 days"), ("b", 2, "-30 days"), ("c", 2, "0 days")):
+        path = object_store.put(f"experiment_{exp_id}/originals/{digest[:16]}_frame.tif", data)
+        ids[name] = db.execute(text("""
+            INSERT INTO images (experiment_id, filename, microscope_id, file_path, content_hash, created_at)
+            VALUES (:exp, 'frame.tif', 'm1', :path, :h, datetime('now', :age)) RETURNING id
+        """), {"exp": exp_id, "path": str(path), "h": digest, "age": age}).scalar()
+    db.commit()
+    return data, ids
+
+def hot_paths(db):
+    return db.execute(text("SELECT id, file_path FROM images ORDER BY id")).fetchall()
+
+def test_compaction_dry_run_writes_nothing(db, object_store, originals):
+    before = hot_paths(db)
+    stats = compact_originals(min_age_days=1, dry_run=True)
+
+    assert (stats["archived_images"], stats["new_blobs"], stats["deduplicated"]) == (2, 1, 1)
+    assert hot_paths(db) == before
+    assert db.execute(text("SELECT COUNT(*) FROM archive_blobs")).scalar() == 0
+    assert not (object_store.root / "archive").exists()
+    assert all(Path(row.file_path).exists() for row in before)
+
+def test_compaction_dedups_across_experiments_and_keeps_shared_hot_files(client, db, object_store, originals):
+    data, ids = originals
+    paths = {row.id: row.file_path for row in hot_paths(db)}
+    stats = compact_originals(min_age_days=1)
+
+    assert (stats["archived_images"], stats["new_blobs"], stats["deduplicated"]) == (2, 1, 1)
+    assert db.execute(text("SELECT COUNT(*) FROM archive_blobs")).scalar() == 1
+    archived = {row.id: row.file_path for row in hot_paths(db)}
+    assert archived == {ids["a"]: None, ids["b"]: None, ids["c"]: paths[ids["c"]]}
+    # b's file is also c's, which is too young to archive
+    assert not Path(paths[ids["a"]]).exists()
+    assert Path(paths[ids["c"]]).exists()
+
+    response = client.get(f"/images/{ids['b']}")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/tiff"
+    assert np.array_equal(np.array(Image.open(io.BytesIO(response.content))),
+                          np.array(Image.open(io.BytesIO(data))))
+
+def test_blob_gc_skips_blobs_inside_grace_period(db, object_store, originals):
+    compact_originals(min_age_days=1)
+    db.execute(text("DELETE FROM images WHERE file_path IS NULL"))
+    db.commit()
+
+    assert delete_unreferenced_blobs(db, grace_seconds=600) == []
+    assert len(delete_unreferenced_blobs(db, grace_seconds=0)) == 1
+
+def test_compaction_leaves_image_hot_when_blob_disappears(session_factory, db, object_store, originals, monkeypatch):
+    """A blob dropped by the GC between dedup lookup and update is not pointed at"""
+    import services.archive as archive
+    _, ids = originals
+    compact_originals(min_age_days=1)
+    shared = hot_paths(db)[-1].file_path
+    db.execute(text("UPDATE images SET file_path = :p WHERE id = :id"), {"p": shared, "id": ids["b"]})
+    db.commit()
+
+    def lookup_then_gc(session, content_hash):
+        blob = session.execute(text("SELECT * FROM archive_blobs")).first()
+        with session_factory() as gc:
+            gc.execute(text("UPDATE images SET file_path = 'gone' WHERE id = :id"), {"id": ids["a"]})
+            assert delete_unreferenced_blobs(gc, grace_seconds=0)
+        return blob
+    monkeypatch.setattr(archive, "_blob_for", lookup_then_gc)
+
+    assert compact_originals(min_age_days=1)["archived_images"] == 0
+    assert dict(hot_paths(db))[ids["b"]] == shared
+    assert Path(shared).exists()
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,82 @@
+import sys
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import os
+import time
+import pytest
+from sqlalchemy import text
+from services.cleanup import delete_experiment_data, clear_all_images, collect_orphan_files
+
+def add_image(db, store, exp_id, name, age_seconds=3600):
+    """Image row whose original exists on disk, last modified age_seconds ago"""
+    key = f"experiment_{exp_id}/originals/{name}"
+    path = store.put(key, name.encode())
+    past = time.time() - age_seconds
+    os.utime(store.path_for(key), (past, past))
+    db.execute(text("""
+        INSERT INTO images (experiment_id, filename, microscope_id, file_path)
+        VALUES (:exp, :name, 'm1', :path)
+    """), {"exp": exp_id, "name": name, "path": str(path)})
+    return store.path_for(key)
+
+def image_count(db, exp_id=None):
+    where = "" if exp_id is None else f" WHERE experiment_id = {exp_id}"
+    return db.execute(text(f"SELECT COUNT(*) FROM images{where}")).scalar()
+
+@pytest.fixture
+def two_experiments(db, object_store):
+    db.execute(text("INSERT INTO experiments (name) VALUES ('A'), ('B')"))
+    files = {exp: [add_image(db, object_store, exp, f"{exp}_{n}.png") for n in range(5)] for exp in (1, 2)}
+    db.commit()
+    return files
+
+def test_experiment_deleted_in_chunks(db, object_store, two_experiments):
+    db.execute(text("DELETE FROM experiments WHERE id = 1"))
+    db.commit()
+    result = delete_experiment_data(1, chunk_size=2)
+
+    assert result["deleted_images"] == 5
+    assert result["reclaimed_bytes"] > 0
+    assert image_count(db, 1) == 0 and image_count(db, 2) == 5
+    assert not object_store.path_for("experiment_1").exists()
+    assert all(path.exists() for path in two_experiments[2])
+
+def test_clear_all_images(db, object_store, two_experiments):
+    result = clear_all_images(chunk_size=3)
+    assert result["deleted_images"] == 10
+    assert image_count(db) == 0
+    assert not list(object_store.root.glob("experiment_*"))
+
+def test_orphan_gc_respects_grace_period_and_dry_run(db, object_store, two_experiments):
+    stale = object_store.path_for("experiment_1/originals/stale.png")
+    fresh = object_store.path_for("experiment_1/originals/fresh.png")
+    for path, age in ((stale, 7200), (fresh, 10)):
+        object_store.put(str(path.relative_to(object_store.root)), b"orphan")
+        os.utime(path, (time.time() - age,) * 2)
+
+    preview = collect_orphan_files(dry_run=True, grace_seconds=600)
+    assert preview["orphaned_files"] == 1
+    assert stale.exists()
+
+    result = collect_orphan_files(grace_seconds=600)
+    assert result["orphaned_files"] == 1
+    assert not stale.exists() and fresh.exists()
+    assert all(path.exists() for paths in two_experiments.values() for path in paths)
+
+def test_orphan_gc_finishes_interrupted_experiment_deletion(db, object_store, two_experiments):
+    """Experiment row gone but the background delete never ran (process died)"""
+    db.execute(text("DELETE FROM experiments WHERE id = 2"))
+    db.commit()
+
+    assert collect_orphan_files(dry_run=True)["orphaned_images"] == 5
+    result = collect_orphan_files(grace_seconds=600)
+    assert result["orphaned_images"] == 5
+    assert result["orphaned_files"] == 5
+    assert image_count(db) == 5
+    assert not any(path.exists() for path in two_experiments[2])
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,67 @@
+import sys
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import json
+import struct
+import numpy as np
+import pytest
+from sqlalchemy import text
+from services.columnar import encode_raw, read_metric_columns
+
+def decode_raw(payload):
+    header_len = struct.unpack("<I", payload[:4])[0]
+    header = json.loads(payload[4:4 + header_len])
+    body = 4 + header_len
+    columns = {
+        c["name"]: np.frombuffer(payload, c["dtype"], header["count"], body + c["offset"])
+        for c in header["columns"]
+    }
+    return header, body, columns
+
+def test_raw_encoding_round_trips_and_aligns():
+    """Columns decode back unchanged and start on 8-byte boundaries"""
+    arrays = {
+        "id": np.arange(3, dtype="<i8"),
+        "focus_score": np.array([1.5, np.nan, 300.0], dtype="<f4"),
+        "session_index": np.array([0, 1, 0], dtype="<i4"),
+    }
+    header, body, columns = decode_raw(encode_raw(arrays, ["a", "b"]))
+
+    assert body % 8 == 0
+    assert all(c["offset"] % 8 == 0 for c in header["columns"])
+    assert header["sessions"] == ["a", "b"]
+    np.testing.assert_array_equal(columns["id"], arrays["id"])
+    np.testing.assert_array_equal(columns["focus_score"], arrays["focus_score"])
+    np.testing.assert_array_equal(columns["session_index"], arrays["session_index"])
+
+def test_read_metric_columns_keeps_dtypes_and_session_codes(db):
+    db.execute(text("INSERT INTO experiments (name) VALUES ('A'), ('B')"))
+    big = 2 ** 53 + 1
+    rows = [
+        (big, 1, 120.5, "s2", 1),
+        (big + 2, 1, None, None, 0),
+        (big + 4, 2, 99.0, "s9", 1),
+        (big + 6, 1, 80.25, "s1", None),
+    ]
+    for image_id, exp, focus, session, ready in rows:
+        db.execute(text("""
+            INSERT INTO images (id, experiment_id, filename, microscope_id, focus_score,
+                                imaging_session_id, is_ml_ready)
+            VALUES (:id, :exp, 'x.png', 'm1', :focus, :session, :ready)
+        """), {"id": image_id, "exp": exp, "focus": focus, "session": session, "ready": ready})
+    db.commit()
+
+    arrays, sessions = read_metric_columns(
+        db, 1, ("id", "focus_score", "is_ml_ready", "session_index"), batch_size=2
+    )
+    assert arrays["id"].tolist() == [big, big + 2, big + 6]
+    np.testing.assert_array_equal(arrays["focus_score"], np.array([120.5, np.nan, 80.25], "<f4"))
+    assert arrays["is_ml_ready"].tolist() == [1, 0, 0]
+    assert sessions == ["s1", "s2", "unknown"]
+    assert [sessions[i] for i in arrays["session_index"]] == ["s2", "unknown", "s1"]
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,64 @@
+import sys
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import json
+import pytest
+from config import load_settings, Settings, FOCUS_METHOD_NAMES
+
+def test_defaults_match_previous_constants():
+    """Without overrides the settings keep the old hardcoded values"""
+    settings = load_settings({})
+    assert settings.thumbnail_size == (200, 200)
+    assert settings.thumbnail_quality == 70
+    assert settings.binarization_threshold == 50
+    assert settings.database_url == "sqlite:///./organoid_qc.db"
+
+def test_environment_overrides_file(tmp_path):
+    """Env variables win over the JSON file, and both are coerced to field types"""
+    config_file = tmp_path / "settings.json"
+    config_file.write_text(json.dumps({"thumbnail_quality": 80, "analysis_workers": 2}))
+    settings = load_settings({
+        "ORGANOIDQC_CONFIG_FILE": str(config_file),
+        "ORGANOIDQC_THUMBNAIL_QUALITY": "90",
+        "ORGANOIDQC_THUMBNAIL_SIZE": "256",
+        "ORGANOIDQC_THUMBNAIL_DRAFT": "false",
+        "ORGANOIDQC_UPLOAD_DIR": "/data/uploads",
+    })
+    assert settings.thumbnail_quality == 90
+    assert settings.analysis_workers == 2
+    assert settings.thumbnail_size == (256, 256)
+    assert settings.thumbnail_draft is False
+    assert settings.upload_dir == Path("/data/uploads")
+
+def test_invalid_settings_rejected(tmp_path):
+    """Unknown keys, bad types and out-of-range values fail at load time"""
+    config_file = tmp_path / "settings.json"
+    config_file.write_text(json.dumps({"thumbnail_qualty": 80}))
+    with pytest.raises(ValueError, match="thumbnail_qualty"):
+        load_settings({"ORGANOIDQC_CONFIG_FILE": str(config_file)})
+    with pytest.raises(ValueError, match="db_pool_size"):
+        load_settings({"ORGANOIDQC_DB_POOL_SIZE": "many"})
+    with pytest.raises(ValueError, match="sqlite_journal_mode"):
+        Settings(sqlite_journal_mode="FAST")
+    with pytest.raises(ValueError, match="default_focus_method"):
+        load_settings({"ORGANOIDQC_DEFAULT_FOCUS_METHOD": "sobel"})
+
+def test_non_sqlite_database_rejected():
+    """The schema relies on SQLite-specific SQL, so other backends fail at load time"""
+    with pytest.raises(ValueError, match="database_url"):
+        load_settings({"ORGANOIDQC_DATABASE_URL": "postgresql://qc@db:5432/qc"})
+    assert Settings(database_url="sqlite+pysqlite:///qc.db").database_url == "sqlite+pysqlite:///qc.db"
+
+def test_focus_method_names_match_implementations():
+    from services.image_processing import FOCUS_METHODS
+    assert tuple(FOCUS_METHODS) == FOCUS_METHOD_NAMES
+
+def test_public_dict_masks_credentials():
+    settings = Settings(database_url="sqlite+pysqlcipher://:secret@/data/qc.db")
+    assert settings.public_dict()["database_url"] == "sqlite+pysqlcipher://***@/data/qc.db"
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
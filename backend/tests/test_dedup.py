@@ -0,0 +1,39 @@
+import sys
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import random
+from collections import namedtuple
+import pytest
+from services.dedup import BKTree, find_duplicate_groups, hamming_distance, hash_bands
+
+Row = namedtuple("Row", "id phash focus_score")
+
+def test_bk_tree_matches_brute_force():
+    """BK-tree radius search returns exactly the brute-force matches"""
+    rng = random.Random(0)
+    hashes = [rng.getrandbits(64) for _ in range(500)]
+    tree = BKTree()
+    for i, h in enumerate(hashes):
+        tree.add(h, i)
+
+    query = hashes[0] ^ 0b1011
+    expected = {i for i, h in enumerate(hashes) if hamming_distance(query, h) <= 10}
+    assert {i for _, i in tree.search(query, 10)} == expected
+
+def test_hash_bands_cover_signed_hashes():
+    """Negative (signed) hashes split into unsigned 16-bit bands"""
+    bands = hash_bands(-1)
+    assert bands == (0xFFFF,) * 4
+
+def test_duplicate_groups_keep_sharpest():
+    """Each group lists its best-focus member first"""
+    rows = [Row(1, 0b1111, 10.0), Row(2, 0b1110, 99.0), Row(3, -12345, 50.0)]
+    groups = find_duplicate_groups(rows, max_distance=2)
+    assert len(groups) == 1
+    assert [r.id for r in groups[0]] == [2, 1]
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,80 @@
+import sys
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import asyncio
+import pytest
+from services.events import EventBus
+
+async def take(stream, n):
+    frames = []
+    for _ in range(n):
+        frames.append(await asyncio.wait_for(stream.__anext__(), timeout=1))
+    return frames
+
+def test_live_events_are_streamed():
+    """Events published after subscribing reach the subscriber"""
+    async def scenario():
+        bus = EventBus()
+        stream = bus.stream(1)
+        pending = asyncio.ensure_future(take(stream, 1))
+        await asyncio.sleep(0.05)
+        bus.publish(2, "image_analyzed", {"id": 99})
+        bus.publish(1, "image_analyzed", {"id": 7})
+        frames = await pending
+        await stream.aclose()
+        return frames
+    frames = asyncio.run(scenario())
+    assert "event: image_analyzed" in frames[0]
+    assert '"id": 7' in frames[0]
+
+def test_resume_returns_only_missed_events():
+    """Reconnecting with Last-Event-ID replays just the newer events"""
+    async def scenario():
+        bus = EventBus()
+        first = bus.publish(1, "image_analyzed", {"id": 1})
+        bus.publish(1, "image_analyzed", {"id": 2})
+        bus.publish(1, "image_analyzed", {"id": 3})
+        stream = bus.stream(1, first)
+        frames = await take(stream, 2)
+        await stream.aclose()
+        return frames
+    frames = asyncio.run(scenario())
+    assert ['"id": 2' in frames[0], '"id": 3' in frames[1]] == [True, True]
+
+def test_log_dropped_after_experiment_deleted_is_delivered():
+    """Subscribers get the final event and the stream ends; then the log is freed"""
+    async def scenario():
+        bus = EventBus()
+        bus.publish(2, "experiment_deleted", {"id": 2})
+        stream = bus.stream(1)
+        pending = asyncio.ensure_future(take(stream, 1))
+        await asyncio.sleep(0.05)
+        bus.publish(1, "experiment_deleted", {"id": 1})
+        assert 1 in bus._logs
+        frames = await pending
+        with pytest.raises(StopAsyncIteration):
+            await stream.__anext__()
+        return frames, bus
+    frames, bus = asyncio.run(scenario())
+    assert "event: experiment_deleted" in frames[0]
+    assert (bus._logs, bus._subscribers, bus._closing) == ({}, {}, set())
+
+def test_resync_when_events_were_evicted():
+    """A token older than the buffer yields a resync event instead of a partial replay"""
+    async def scenario():
+        bus = EventBus(buffer_size=2)
+        first = bus.publish(1, "image_analyzed", {"id": 1})
+        for i in range(2, 5):
+            bus.publish(1, "image_analyzed", {"id": i})
+        stream = bus.stream(1, first)
+        frames = await take(stream, 1)
+        await stream.aclose()
+        return frames
+    frames = asyncio.run(scenario())
+    assert "event: resync" in frames[0]
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,34 @@
+import sys
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+from sqlalchemy import text
+from services.image_processing import FOCUS_DEFAULT_THRESHOLDS
+
+def default_profile(client, exp_id):
+    return next(p for p in client.get(f"/experiments/{exp_id}/profiles").json() if p["name"] == "default")
+
+def test_default_profile_uses_focus_method_scale(client):
+    exp_id = client.post("/experiments", json={"name": "A", "focus_method": "fft_high_freq"}).json()["id"]
+    assert default_profile(client, exp_id)["focus_threshold"] == FOCUS_DEFAULT_THRESHOLDS["fft_high_freq"]
+
+def test_focus_method_change_only_without_images(client, db):
+    exp_id = client.post("/experiments", json={"name": "A"}).json()["id"]
+    response = client.patch(f"/experiments/{exp_id}", json={"focus_method": "tenengrad"})
+    assert response.status_code == 200
+    assert default_profile(client, exp_id)["focus_threshold"] == FOCUS_DEFAULT_THRESHOLDS["tenengrad"]
+
+    db.execute(text("""
+        INSERT INTO images (experiment_id, filename, microscope_id, focus_score, focus_method)
+        VALUES (:id, 'a.png', 'm1', 3000, 'tenengrad')
+    """), {"id": exp_id})
+    db.commit()
+    response = client.patch(f"/experiments/{exp_id}", json={"focus_method": "brenner"})
+    assert response.status_code == 409
+    assert client.patch(f"/experiments/{exp_id}", json={"analysis_mode": "reduced"}).status_code == 200
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
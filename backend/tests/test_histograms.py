@@ -0,0 +1,97 @@
+import sys
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from collections import Counter
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from database import init_db
+from services.histograms import bin_index, percentile, otsu_threshold, read_histograms
+
+def histogram(metric, values):
+    return dict(Counter(bin_index(metric, v) for v in values))
+
+def test_percentiles_within_bin_resolution():
+    """Log bins of 1/8 octave keep heavy-tailed focus percentiles within a few percent"""
+    focus = np.random.default_rng(0).lognormal(5, 1, 20000)
+    counts = histogram("focus", focus)
+    for q in (5, 25, 50, 75, 95):
+        estimate = percentile("focus", counts, q)
+        assert estimate == pytest.approx(np.percentile(focus, q), rel=0.05)
+
+def test_otsu_splits_blurred_from_sharp():
+    rng = np.random.default_rng(1)
+    focus = np.concatenate([rng.lognormal(2, 0.3, 300), rng.lognormal(6, 0.3, 700)])
+    threshold, separation = otsu_threshold("focus", histogram("focus", focus))
+    assert np.exp(2.6) < threshold < np.exp(5.4)
+    assert separation > 0.8
+
+def test_triggers_keep_histograms_in_step_with_images():
+    engine = create_engine("sqlite://")
+    init_db(engine)
+    rng = np.random.default_rng(2)
+    with Session(engine) as db:
+        db.execute(text("INSERT INTO experiments (name) VALUES ('A')"))
+        for n in range(200):
+            db.execute(text("""
+                INSERT INTO images (experiment_id, filename, focus_score, contrast_level,
+                                    exposure_level, imaging_session_id, microscope_id)
+                VALUES (1, 'x.png', :focus, :contrast, :exposure, :session, 'm1')
+            """), {"focus": float(rng.lognormal(5, 1)), "contrast": float(rng.uniform(0, 80)),
+                   "exposure": float(rng.uniform(0, 255)), "session": f"s{n % 3}"})
+        db.execute(text("UPDATE images SET focus_score = focus_score * 3 WHERE id % 2 = 0"))
+        db.execute(text("DELETE FROM images WHERE id % 5 = 0"))
+        db.commit()
+
+        stored = read_histograms(db, ("focus", "exposure"), experiment_id=1)
+        rows = db.execute(text("SELECT focus_score, exposure_level FROM images")).fetchall()
+        assert stored["focus"] == histogram("focus", [r.focus_score for r in rows])
+        assert stored["exposure"] == histogram("exposure", [r.exposure_level for r in rows])
+
+def test_focus_histograms_kept_per_focus_method(client, db):
+    db.execute(text("INSERT INTO experiments (name, focus_method) VALUES ('A', 'laplacian'), ('B', 'fft_high_freq')"))
+    for exp_id, method, focus in ((1, "laplacian", 400.0), (2, "fft_high_freq", 30.0)):
+        db.execute(text("""
+            INSERT INTO images (experiment_id, filename, focus_score, exposure_level, microscope_id, focus_method)
+            VALUES (:exp, 'x.png', :focus, 120, 'm1', :method)
+        """), {"exp": exp_id, "focus": focus, "method": method})
+    db.commit()
+
+    assert read_histograms(db, ("focus",), microscope="m1")["focus"] == histogram("focus", [400.0])
+    response = client.get("/microscopes/m1/distributions?metrics=focus,exposure&focus_method=fft_high_freq")
+    metrics = response.json()["metrics"]
+    assert (metrics["focus"]["count"], metrics["exposure"]["count"]) == (1, 2)
+    assert metrics["focus"]["percentiles"]["p50"] == pytest.approx(30, rel=0.05)
+    assert client.get("/experiments/2/distributions").json()["metrics"]["focus"]["count"] == 1
+
+def test_batch_report_median_uses_experiment_focus_method(client, db):
+    exp_id = client.post("/experiments", json={"name": "A", "focus_method": "tenengrad"}).json()["id"]
+    db.execute(text("""
+        INSERT INTO images (experiment_id, filename, focus_score, contrast_level, exposure_level,
+                            microscope_id, focus_method)
+        VALUES (:exp, 'x.png', 5000.0, 30, 120, 'm1', 'tenengrad')
+    """), {"exp": exp_id})
+    db.commit()
+
+    report = client.get(f"/experiments/{exp_id}/batch-report").json()
+    assert report["median_focus"] == pytest.approx(5000, rel=0.05)
+
+def test_histograms_rebuilt_once_per_schema_version(db):
+    db.execute(text("INSERT INTO experiments (name) VALUES ('A')"))
+    db.execute(text("INSERT INTO images (experiment_id, filename, focus_score, microscope_id) VALUES (1, 'x.png', 200, 'm1')"))
+    db.execute(text("DELETE FROM metric_histograms"))
+    db.commit()
+    init_db(db.get_bind())
+    assert read_histograms(db, ("focus",))["focus"] == {}
+
+    db.execute(text("UPDATE schema_versions SET version = 1 WHERE component = 'metric_histograms'"))
+    db.commit()
+    init_db(db.get_bind())
+    assert read_histograms(db, ("focus",))["focus"] == histogram("focus", [200])
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -3,13 +3,22 @@ from pathlib import Path
 
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "benchmarks"))
 
 import pytest
 from services.image_processing import (
     compute_focus_score,
     compute_contrast_level,
-    compute_exposure_level
+    compute_exposure_level,
+    compute_perceptual_hash,
+    analyze_image,
+    decode_grayscale,
+    focus_from_array,
+    default_focus_threshold,
+    FOCUS_METHODS
 )
+from config import ANALYSIS_MODES
+from common import synthetic_field
 import cv2
 import numpy as np
 
@@ -60,5 +69,83 @@ def test_exposure_level():
     exposure = compute_exposure_level(img_bytes)
     assert 0 <= exposure <= 255
 
+def test_laplacian_matches_float64_reference():
+    """int16 Laplacian path reproduces the original float64 variance"""
+    img = cv2.imdecode(np.frombuffer(create_test_image("good"), np.uint8), cv2.IMREAD_GRAYSCALE)
+    reference = cv2.Laplacian(img, cv2.CV_64F).var()
+    assert FOCUS_METHODS["laplacian"](img) == pytest.approx(reference, rel=1e-9)
+
+@pytest.mark.parametrize("method", list(FOCUS_METHODS))
+def test_focus_methods_rank_sharp_above_blurred(method):
+    """Every focus measure scores a sharp field above its defocused copy"""
+    sharp = cv2.imdecode(np.frombuffer(create_field_image(3, 0), np.uint8), cv2.IMREAD_GRAYSCALE)
+    blurred = cv2.GaussianBlur(sharp, (0, 0), 3)
+    assert FOCUS_METHODS[method](sharp) > FOCUS_METHODS[method](blurred)
+
+def test_unknown_focus_method_rejected():
+    """Unregistered focus method names are a client error"""
+    from fastapi import HTTPException
+    with pytest.raises(HTTPException):
+        compute_focus_score(create_test_image("good"), method="nope")
+
+def create_field_image(layout_seed, noise_seed):
+    """Synthetic field of view with several organoids"""
+    rng = np.random.default_rng(layout_seed)
+    img = np.full((512, 512), 150, dtype=np.uint8)
+    for _ in range(12):
+        center = tuple(int(v) for v in rng.integers(0, 512, 2))
+        cv2.circle(img, center, int(rng.integers(15, 60)), int(rng.integers(20, 90)), -1)
+    noise = np.random.default_rng(noise_seed).normal(0, 5, img.shape)
+    img = np.clip(img + noise, 0, 255).astype(np.uint8)
+    _, buffer = cv2.imencode('.png', img)
+    return buffer.tobytes()
+
+def test_perceptual_hash_near_duplicates():
+    """Re-acquired fields hash close together, different fields far apart"""
+    from services.dedup import hamming_distance
+    original = compute_perceptual_hash(create_field_image(1, 0))
+    reacquired = compute_perceptual_hash(create_field_image(1, 1))
+    other = compute_perceptual_hash(create_field_image(2, 0))
+    assert hamming_distance(original, reacquired) <= 4
+    assert hamming_distance(original, other) > 10
+
+@pytest.mark.parametrize("mode", ["reduced", "triage"])
+def test_reduced_modes_agree_with_full(mode):
+    """Reduced decodes keep the focus ranking and report full-resolution sizes"""
+    sharp = cv2.imdecode(np.frombuffer(create_field_image(4, 0), np.uint8), cv2.IMREAD_GRAYSCALE)
+    series = [
+        cv2.imencode('.jpg', cv2.GaussianBlur(sharp, (0, 0), sigma) if sigma else sharp)[1].tobytes()
+        for sigma in (0, 1, 2, 4)
+    ]
+    full = [analyze_image(b, thumbnail=False) for b in series]
+    reduced = [analyze_image(b, mode=mode, thumbnail=False) for b in series]
+
+    scores = [r["focus"] for r in reduced]
+    assert scores == sorted(scores, reverse=True)
+    assert reduced[0]["analysis_mode"] == mode
+    assert (reduced[0]["width"], reduced[0]["height"]) == (512, 512)
+    assert reduced[0]["diameter"] == pytest.approx(full[0]["diameter"], rel=0.1)
+    assert reduced[0]["exposure"] == pytest.approx(full[0]["exposure"], rel=0.02)
+
+# Minimum share of pass/fail verdicts at the default Laplacian threshold that
+# reduced modes must reproduce on layouts FOCUS_SCALE_CORRECTION was not
+# fitted on (same 4096 px JPEG defocus series as the benchmark)
+VERDICT_AGREEMENT = {"reduced": 0.95, "triage": 0.9}
+
+def test_reduced_mode_verdicts_match_full_at_default_threshold():
+    threshold = default_focus_threshold("laplacian")
+    agreement = {mode: [] for mode in VERDICT_AGREEMENT}
+    for layout in (3, 4):
+        for sigma in (0, 0.25, 0.5, 0.75, 1, 1.5):
+            field = synthetic_field(layout, sigma, 4096)
+            data = cv2.imencode(".jpg", field, [cv2.IMWRITE_JPEG_QUALITY, 92])[1].tobytes()
+            passed = focus_from_array(decode_grayscale(data), "laplacian") >= threshold
+            for mode in VERDICT_AGREEMENT:
+                factor = ANALYSIS_MODES[mode]
+                score = focus_from_array(decode_grayscale(data, factor), "laplacian", factor)
+                agreement[mode].append((score >= threshold) == passed)
+    for mode, bound in VERDICT_AGREEMENT.items():
+        assert np.mean(agreement[mode]) >= bound, mode
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
\ No newline at end of file
@@ -0,0 +1,81 @@
+import sys
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+import pytest
+from sqlalchemy import text
+from services.plate import parse_well_metadata, format_well_id, parse_well_id, layout_for
+
+@pytest.mark.parametrize("filename, expected", [
+    ("r02c03f01p01-ch1sk1fk1fl1.tiff", (None, 1, 2, 1, 1)),
+    ("PlateA_B03_f02_z01.tif", ("A", 1, 2, 2, 1)),
+    ("Plate_7-AF48_s3.png", ("7", 31, 47, 3, None)),
+    ("exp1_H12.jpg", (None, 7, 11, None, None)),
+    ("img001.png", (None, None, None, None, None)),
+    ("org_c1_t1_d3.tif", (None, None, None, None, None)),
+    ("org_t1_D03.tif", (None, 3, 2, None, None)),
+    ("exp_t01_B03.png", (None, 1, 2, None, None)),
+    ("img_c02_A01.png", (None, 0, 0, None, None)),
+    ("exp_d03_w02_H12.tif", (None, 7, 11, None, None)),
+    ("exp_T01_B03.png", (None, 1, 2, None, None)),
+    ("exp_t01.png", (None, None, None, None, None)),
+    ("r00c01f01p01.tiff", (None, None, None, None, None)),
+    ("r01c00f01p01.tiff", (None, None, None, None, None)),
+])
+def test_parse_well_metadata(filename, expected):
+    """Plate, well, field and z are read from common naming schemes"""
+    meta = parse_well_metadata(filename)
+    assert (meta["plate_id"], meta["well_row"], meta["well_col"],
+            meta["field_index"], meta["z_index"]) == expected
+
+def test_well_id_round_trip():
+    """Canonical well ids round-trip, including 1536-well double-letter rows"""
+    for row, col in [(0, 0), (7, 11), (26, 3), (31, 47)]:
+        assert parse_well_id(format_well_id(row, col)) == (row, col)
+
+def test_layout_inference():
+    """Smallest standard plate containing the wells is chosen"""
+    assert layout_for(7, 11) == (8, 12)
+    assert layout_for(8, 0) == (16, 24)
+    assert layout_for(31, 47) == (32, 48)
+
+def test_plate_map(client, db):
+    db.execute(text("INSERT INTO experiments (name) VALUES ('A')"))
+    # (-1, 0) is a row stored by an older parser from "r00c01..."; it must not wrap around
+    for row, col, focus in [(0, 0, 100.0), (0, 0, 200.0), (1, 11, 50.0), (-1, 0, 999.0)]:
+        db.execute(text("""
+            INSERT INTO images (experiment_id, filename, microscope_id, focus_score,
+                                plate_id, well_row, well_col)
+            VALUES (1, 'x.png', 'm1', :focus, 'P1', :row, :col)
+        """), {"row": row, "col": col, "focus": focus})
+    db.commit()
+
+    heatmap = client.get("/experiments/1/plate-map").json()
+    assert (heatmap["plate_id"], heatmap["rows"], heatmap["cols"]) == ("P1", 8, 12)
+    assert heatmap["values"][0] == 150.0 and heatmap["counts"][0] == 2
+    assert heatmap["values"][23] == 50.0
+    assert sum(v is not None for v in heatmap["values"]) == 2
+
+    binary = client.get("/experiments/1/plate-map", params={"format": "binary", "layout": 384})
+    assert (binary.headers["X-Plate-Rows"], binary.headers["X-Plate-Cols"]) == ("16", "24")
+    values = np.frombuffer(binary.content[:384 * 4], "<f4")
+    counts = np.frombuffer(binary.content[384 * 4:], "<u4")
+    assert values[0] == 150.0 and counts[24 + 11] == 1 and np.isnan(values[1])
+    assert np.isnan(values[-24]) and counts.sum() == 3
+
+def test_invalid_well_id_rejected_before_analysis(client, db, object_store):
+    db.execute(text("INSERT INTO experiments (name) VALUES ('A')"))
+    db.commit()
+    response = client.post(
+        "/upload/1",
+        files={"file": ("x.png", b"not an image", "image/png")},
+        data={"imaging_session_id": "s1", "microscope_id": "m1", "well_id": "Q99"},
+    )
+    assert response.status_code == 400
+    assert not object_store.root.exists()
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,114 @@
+import sys
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+from sqlalchemy import text
+from database import init_db
+from services.analysis import determine_ml_readiness
+from services.profiles import (
+    ensure_default_profile, evaluate_new_image, update_profile, get_profile, create_profile,
+    reevaluate_experiment
+)
+
+# focus, contrast, exposure
+IMAGES = [(100, 30, 120), (160, 30, 120), (190, 30, 210), (250, 30, 225), (300, 30, 230)]
+
+@pytest.fixture
+def experiment(db):
+    exp_id = db.execute(text("INSERT INTO experiments (name) VALUES ('A') RETURNING id")).scalar()
+    profile = ensure_default_profile(db, exp_id)
+    for focus, contrast, exposure in IMAGES:
+        # As in ingest: verdict under the active profile, then cached for every profile
+        ready, reason = determine_ml_readiness(
+            focus, contrast, exposure, profile.focus_threshold, profile.contrast_threshold,
+            profile.exposure_min, profile.exposure_max
+        )
+        image_id = db.execute(text("""
+            INSERT INTO images (experiment_id, filename, microscope_id, focus_score,
+                                contrast_level, exposure_level, is_ml_ready, quality_reason)
+            VALUES (:exp, 'x.png', 'm1', :focus, :contrast, :exposure, :ready, :reason) RETURNING id
+        """), {"exp": exp_id, "focus": focus, "contrast": contrast, "exposure": exposure,
+               "ready": ready, "reason": reason}).scalar()
+        evaluate_new_image(db, image_id)
+    db.commit()
+    return exp_id
+
+def stored_verdicts(db, exp_id):
+    return db.execute(text("""
+        SELECT focus_score, contrast_level, exposure_level, is_ml_ready, quality_reason
+        FROM images WHERE experiment_id = :id ORDER BY id
+    """), {"id": exp_id}).fetchall()
+
+def assert_synced(db, exp_id, profile):
+    """images.is_ml_ready/quality_reason match a fresh evaluation under profile"""
+    for row in stored_verdicts(db, exp_id):
+        expected = determine_ml_readiness(
+            row.focus_score, row.contrast_level, row.exposure_level,
+            profile.focus_threshold, profile.contrast_threshold,
+            profile.exposure_min, profile.exposure_max
+        )
+        assert (bool(row.is_ml_ready), row.quality_reason) == expected
+
+def test_threshold_change_reevaluates_only_images_between_bounds(db, experiment):
+    profile = get_profile(db, experiment)
+    # focus 150 -> 200: [150, 200) holds 160 and 190
+    assert update_profile(db, profile, {"focus_threshold": 200}) == 2
+    # exposure_max 225 -> 200: (200, 225] holds 210 and 225
+    assert update_profile(db, get_profile(db, experiment), {"exposure_max": 200}) == 2
+    assert update_profile(db, get_profile(db, experiment), {"contrast_threshold": 40}) == 5
+    assert_synced(db, experiment, get_profile(db, experiment))
+
+def test_cached_evaluations_match_python_verdicts(db, experiment):
+    """The SQL evaluation in image_evaluations agrees with determine_ml_readiness"""
+    cached = db.execute(text("""
+        SELECT e.is_ml_ready, e.quality_reason FROM image_evaluations e
+        JOIN threshold_profiles p ON p.id = e.profile_id AND p.is_active = 1
+        ORDER BY e.image_id
+    """)).fetchall()
+    stored = stored_verdicts(db, experiment)
+    assert [(bool(c.is_ml_ready), c.quality_reason) for c in cached] == \
+           [(bool(s.is_ml_ready), s.quality_reason) for s in stored]
+    assert [bool(row.is_ml_ready) for row in stored] == [False, True, True, True, False]
+    assert [row.quality_reason for row in stored][::4] == ["focus_too_low", "exposure_problem"]
+
+def test_update_syncs_verdicts_to_images(db, experiment):
+    update_profile(db, get_profile(db, experiment), {"focus_threshold": 120, "exposure_max": 240})
+    assert_synced(db, experiment, get_profile(db, experiment))
+    assert all(row.is_ml_ready for row in stored_verdicts(db, experiment)[1:])
+
+def test_switching_active_profile_changes_batch_report(client, db, experiment):
+    report = client.get(f"/experiments/{experiment}/batch-report").json()
+    assert (report["profile"], report["ml_ready_images"]) == ("default", 3)
+
+    create_profile(db, experiment, "strict", {
+        "focus_threshold": 280, "contrast_threshold": 20, "exposure_min": 30, "exposure_max": 250
+    })
+    assert client.post(f"/experiments/{experiment}/profiles/strict/activate").status_code == 200
+
+    report = client.get(f"/experiments/{experiment}/batch-report").json()
+    assert (report["profile"], report["ml_ready_images"]) == ("strict", 1)
+    assert_synced(db, experiment, get_profile(db, experiment))
+
+def test_reevaluate_chunk_only_syncs_its_images(db, experiment):
+    """Reanalysis chunks re-sync their own images, not the whole experiment"""
+    ids = [row.id for row in db.execute(text("SELECT id FROM images ORDER BY id")).fetchall()]
+    db.execute(text("UPDATE images SET focus_score = 400, is_ml_ready = 0, quality_reason = 'stale'"))
+    assert reevaluate_experiment(db, experiment, ids[:2]) == 2
+    reasons = [row.quality_reason for row in stored_verdicts(db, experiment)]
+    assert reasons == ["passed_all_checks", "passed_all_checks", "stale", "stale", "stale"]
+
+def test_default_profile_backfilled_at_startup_not_on_read(client, db):
+    """Experiments from before profiles get theirs from init_db; GETs never insert"""
+    db.execute(text("INSERT INTO experiments (name) VALUES ('legacy')"))
+    db.commit()
+    assert client.get("/experiments/1/profiles").json() == []
+
+    init_db(db.get_bind())
+    init_db(db.get_bind())
+    assert [p["name"] for p in client.get("/experiments/1/profiles").json()] == ["default"]
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,127 @@
+import sys
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from database import init_db
+from services.query import parse_query, run_query, QueryCache
+
+GROUPING = "experiment,operator,microscope,session,day"
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    init_db(engine)
+    with Session(engine) as session:
+        session.execute(text("INSERT INTO experiments (name) VALUES ('A'), ('B')"))
+        rows = [
+            (1, 200.0, 30, 1, "s1", "m1", "alice", "2026-01-05 10:00:00"),
+            (1, 90.0, 30, 0, "s1", "m1", "alice", "2026-01-05 11:00:00"),
+            # Not analysed: averages skip it, counts include it
+            (1, None, None, 0, "s1", "m1", "alice", "2026-01-05 12:00:00"),
+            (1, 300.0, 30, 1, "s2", "m2", None, "2026-02-10 09:00:00"),
+            (2, 50.0, 30, 0, None, "m1", "bob", "2026-02-11 09:00:00"),
+        ]
+        for exp, focus, contrast, ready, sess, scope, operator, created in rows:
+            session.execute(text("""
+                INSERT INTO images (experiment_id, filename, focus_score, contrast_level,
+                                    exposure_level, is_ml_ready, imaging_session_id,
+                                    microscope_id, operator_id, created_at)
+                VALUES (:exp, 'x.png', :focus, :contrast, 120, :ready, :sess, :scope, :operator, :created)
+            """), {"exp": exp, "focus": focus, "contrast": contrast, "ready": ready, "sess": sess,
+                   "scope": scope, "operator": operator, "created": created})
+        session.commit()
+        yield session
+
+def summary_and_scan(db, **params):
+    """Same query answered from image_summary and, via a no-op metric filter, from images"""
+    summary = run_query(db, parse_query(**params), QueryCache(4))
+    scan = run_query(db, parse_query(metric_filters=["ml_ready>=0"], **params), QueryCache(4))
+    assert (summary["source"], scan["source"]) == ("image_summary", "images")
+    return summary["rows"], scan["rows"]
+
+def test_summary_matches_images_after_updates_and_deletes(db):
+    summary, scan = summary_and_scan(db, group_by=GROUPING)
+    assert summary == scan
+
+    db.execute(text("UPDATE images SET is_ml_ready = 1, operator_id = 'carol' WHERE focus_score = 90"))
+    db.execute(text("DELETE FROM images WHERE experiment_id = 2"))
+    db.commit()
+
+    summary, scan = summary_and_scan(db, group_by=GROUPING)
+    assert summary == scan
+    assert sum(row["count"] for row in summary) == 4
+
+def test_summary_averages_skip_missing_metrics(db):
+    summary, scan = summary_and_scan(db, group_by="day")
+    assert summary == scan
+    assert (summary[0]["count"], summary[0]["avg_focus"], summary[0]["avg_contrast"]) == (3, 145.0, 30.0)
+
+def test_grouped_pass_rate_by_month(db):
+    rows = run_query(db, parse_query(group_by="month", metrics="count,pass_rate"), QueryCache(4))["rows"]
+    assert rows == [
+        {"month": "2026-01", "count": 3, "pass_rate": 33.33},
+        {"month": "2026-02", "count": 2, "pass_rate": 50.0},
+    ]
+
+def test_week_is_iso_week_across_year_boundary(db):
+    """Days either side of New Year fall into ISO weeks, not %W calendar weeks"""
+    db.execute(text("DELETE FROM images"))
+    for created in ("2024-12-29", "2024-12-30", "2025-01-05", "2025-01-06",
+                    "2026-12-31", "2027-01-03", "2027-01-04"):
+        db.execute(text("INSERT INTO images (experiment_id, filename, microscope_id, created_at) VALUES (1, 'x.png', 'm1', :c)"),
+                   {"c": created + " 12:00:00"})
+    db.commit()
+
+    summary, scan = summary_and_scan(db, group_by="week", metrics="count")
+    assert summary == scan
+    assert [(row["week"], row["count"]) for row in summary] == [
+        ("2024-W52", 1), ("2025-W01", 2), ("2025-W02", 1), ("2026-W53", 2), ("2027-W01", 1),
+    ]
+
+def test_cache_invalidated_by_data_change(db):
+    cache = QueryCache(4)
+    spec = parse_query(metrics="count")
+    assert run_query(db, spec, cache)["cached"] is False
+    assert run_query(db, spec, cache)["cached"] is True
+
+    db.execute(text("DELETE FROM images WHERE experiment_id = 2"))
+    db.commit()
+    result = run_query(db, spec, cache)
+    assert result["cached"] is False
+    assert result["rows"] == [{"count": 4}]
+
+def test_ingest_only_invalidates_queries_on_its_experiment(db):
+    cache = QueryCache(4)
+    other, same, everything = (parse_query(metrics="count", filters={"experiment": e}) for e in ("2", "1", None))
+    for spec in (other, same, everything):
+        run_query(db, spec, cache)
+
+    db.execute(text("INSERT INTO images (experiment_id, filename, microscope_id) VALUES (1, 'y.png', 'm1')"))
+    db.commit()
+    assert [run_query(db, spec, cache)["cached"] for spec in (other, same, everything)] == [True, False, False]
+
+def test_summary_rebuilt_once_for_outdated_schema(db):
+    db.execute(text("DELETE FROM image_summary"))
+    db.commit()
+    init_db(db.get_bind())
+    assert db.execute(text("SELECT COUNT(*) FROM image_summary")).scalar() == 0
+
+    db.execute(text("UPDATE schema_versions SET version = 1 WHERE component = 'image_summary'"))
+    db.commit()
+    init_db(db.get_bind())
+    assert db.execute(text("SELECT SUM(n), SUM(n_focus) FROM image_summary")).fetchone() == (5, 4)
+
+def test_rejects_unknown_dimensions_and_filters():
+    with pytest.raises(HTTPException):
+        parse_query(group_by="operator,filename")
+    with pytest.raises(HTTPException):
+        parse_query(metric_filters=["focus_score; DROP TABLE images"])
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
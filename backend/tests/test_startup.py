@@ -0,0 +1,23 @@
+import sys
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "benchmarks"))
+
+import pytest
+from bench_startup import measure_import
+
+def test_app_import_is_light():
+    """Importing the API loads no imaging libraries and creates no files.
+
+    Import time itself is machine-dependent and is checked against its
+    budget by benchmarks/bench_startup.py, not here.
+    """
+    _, _, loaded, created = measure_import("main")
+
+    assert loaded == []
+    assert created == []
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,52 @@
+import sys
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import asyncio
+import pytest
+from services.storage import LocalObjectStore, original_key, thumbnail_key, content_digest
+
+def test_put_is_atomic_and_sharded(tmp_path):
+    """Objects land in sharded directories with no temp files left behind"""
+    store = LocalObjectStore(tmp_path)
+    digest = content_digest(b"abc")
+    key = original_key(1, "well_A01.tif", digest)
+    store.put(key, b"abc")
+
+    assert store.get(key) == b"abc"
+    assert key.startswith(f"experiment_1/originals/{digest[:2]}/{digest[2:4]}/")
+    assert not list(store.path_for(key).parent.glob(".tmp-*"))
+
+def test_same_name_different_content_does_not_overwrite(tmp_path):
+    """Two uploads named alike but differing in content get distinct keys"""
+    key_a = original_key(1, "img.png", content_digest(b"a"))
+    key_b = original_key(1, "img.png", content_digest(b"b"))
+    assert key_a != key_b
+
+def test_filename_cannot_escape_experiment_dir():
+    """Path components in uploaded filenames are stripped"""
+    key = thumbnail_key(3, "../../etc/passwd.jpg", content_digest(b"x"))
+    assert ".." not in key
+    assert key.endswith("_passwd_thumb.jpg")
+
+def test_put_many_writes_all(tmp_path):
+    """Batched writes return one relative path per object"""
+    store = LocalObjectStore(tmp_path)
+    paths = asyncio.run(store.put_many([("a/1", b"1"), ("b/2", b"2")]))
+    assert len(paths) == 2
+    assert store.get("b/2") == b"2"
+
+def test_keys_by_prefix_and_move(tmp_path):
+    store = LocalObjectStore(tmp_path)
+    for key in ("partial/u.2.chunk", "partial/u.1.chunk", "partial/v.1.chunk"):
+        store.put(key, b"x", durable=True)
+    assert store.keys("partial/u.") == ["partial/u.1.chunk", "partial/u.2.chunk"]
+    assert store.keys("missing/u.") == []
+
+    store.move("partial/u.2.chunk", "partial/u.1.chunk")
+    assert store.keys("partial/u.") == ["partial/u.1.chunk"]
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
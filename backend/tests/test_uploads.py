@@ -0,0 +1,190 @@
+import sys
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import asyncio
+import hashlib
+import mmap
+import cv2
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+import services.ingest as ingest
+from services.ingest import claim_idempotency_key
+from services.uploads import partial_key, chunk_key, append_chunk
+
+METADATA = {"imaging_session_id": "s1", "microscope_id": "m1"}
+
+def create_png(seed=0):
+    pixels = np.random.default_rng(seed).integers(0, 256, (64, 64), dtype=np.uint8)
+    return cv2.imencode(".png", pixels)[1].tobytes()
+
+@pytest.fixture
+def exp_id(client):
+    return client.post("/experiments", json={"name": "A"}).json()["id"]
+
+def upload(client, exp_id, data, key=None):
+    return client.post(
+        f"/upload/{exp_id}", files={"file": ("a.png", data, "image/png")}, data=METADATA,
+        headers={"Idempotency-Key": key} if key else {}
+    )
+
+def start_upload(client, exp_id, data, **fields):
+    body = {"filename": "a.png", "size": len(data), **METADATA, **fields}
+    return client.post(f"/experiments/{exp_id}/uploads", json=body).json()["upload_id"]
+
+def patch(client, upload_id, offset, chunk):
+    return client.patch(f"/uploads/{upload_id}", content=chunk, headers={"Upload-Offset": str(offset)})
+
+def image_count(db):
+    return db.execute(text("SELECT COUNT(*) FROM images")).scalar()
+
+def test_idempotency_key_replays_first_response(client, db, exp_id):
+    data = create_png()
+    first = upload(client, exp_id, data, key="k1")
+    replay = upload(client, exp_id, data, key="k1")
+    assert (first.status_code, replay.status_code) == (201, 201)
+    assert replay.json() == first.json()
+    assert image_count(db) == 1
+
+def test_idempotency_key_reused_for_different_content_is_rejected(client, db, exp_id):
+    assert upload(client, exp_id, create_png(0), key="k1").status_code == 201
+    assert upload(client, exp_id, create_png(1), key="k1").status_code == 422
+    assert image_count(db) == 1
+
+def test_idempotency_key_in_progress_is_rejected(db):
+    assert claim_idempotency_key(db, "k1", "upload:1:a.png:abc") is None
+    with pytest.raises(HTTPException) as error:
+        claim_idempotency_key(db, "k1", "upload:1:a.png:abc")
+    assert error.value.status_code == 409
+
+def test_wrong_offset_returns_server_offset(client, exp_id):
+    data = create_png()
+    upload_id = start_upload(client, exp_id, data)
+    assert patch(client, upload_id, 0, data[:100]).status_code == 204
+
+    response = patch(client, upload_id, 0, data[:100])
+    assert response.status_code == 409
+    assert response.headers["Upload-Offset"] == "100"
+    assert response.json()["detail"]["offset"] == 100
+
+def test_retry_without_idempotency_key_returns_existing_image(client, db, exp_id):
+    """The same bytes under the same name map to the first image; a new name is a new image"""
+    data = create_png()
+    first = upload(client, exp_id, data)
+    retry = upload(client, exp_id, data)
+    assert (first.status_code, retry.status_code) == (201, 201)
+    assert retry.json() == first.json()
+    assert image_count(db) == 1
+
+    renamed = client.post(
+        f"/upload/{exp_id}", files={"file": ("b.png", data, "image/png")}, data=METADATA
+    )
+    assert renamed.json()["id"] != first.json()["id"]
+    assert image_count(db) == 2
+
+def test_losing_writer_leaves_accepted_chunk_intact(client, db, object_store, exp_id):
+    """A chunk whose offset update loses the race is discarded without touching the winner's bytes"""
+    data = create_png()
+    upload_id = start_upload(client, exp_id, data)
+
+    async def body():
+        yield b"\0" * 50
+        # Another process stores its chunk at the same offset meanwhile
+        object_store.put(chunk_key(upload_id, 0), data[:100])
+        db.execute(text("UPDATE upload_sessions SET received = 100 WHERE id = :id"), {"id": upload_id})
+        db.commit()
+        yield b"\0" * 50
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(append_chunk(db, upload_id, 0, body()))
+    assert error.value.detail["offset"] == 100
+    assert object_store.keys(f"partial/{upload_id}.") == [chunk_key(upload_id, 0)]
+    assert object_store.get(chunk_key(upload_id, 0)) == data[:100]
+
+def test_oversized_chunk_stops_reading_body(client, db, exp_id):
+    """The body is rejected as soon as it passes the declared size, not after buffering it all"""
+    data = create_png()
+    upload_id = start_upload(client, exp_id, data)
+    consumed = []
+
+    async def body():
+        for _ in range(1000):
+            consumed.append(1)
+            yield b"\0" * 1024
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(append_chunk(db, upload_id, 0, body()))
+    assert error.value.status_code == 413
+    assert len(consumed) <= len(data) // 1024 + 1
+
+def test_finalize_analyses_the_file_without_reading_it_into_memory(client, exp_id, monkeypatch):
+    data = create_png()
+    upload_id = start_upload(client, exp_id, data)
+    assert patch(client, upload_id, 0, data[:100]).status_code == 204
+    assert patch(client, upload_id, 100, data[100:]).status_code == 204
+
+    analysed = []
+    def analyze_image(contents, *args):
+        analysed.append(type(contents))
+        return original(contents, *args)
+    original = ingest.analyze_image
+    monkeypatch.setattr(ingest, "analyze_image", analyze_image)
+    response = client.post(f"/uploads/{upload_id}/finalize")
+    assert response.status_code == 201
+    assert analysed == [mmap.mmap]
+    assert client.get(f"/images/{response.json()['id']}").content == data
+
+def test_finalize_incomplete_upload(client, exp_id):
+    data = create_png()
+    upload_id = start_upload(client, exp_id, data)
+    patch(client, upload_id, 0, data[:100])
+
+    response = client.post(f"/uploads/{upload_id}/finalize")
+    assert response.status_code == 409
+    assert response.json()["detail"]["offset"] == 100
+
+def test_retried_finalize_returns_same_image(client, db, object_store, exp_id):
+    data = create_png()
+    upload_id = start_upload(client, exp_id, data)
+    patch(client, upload_id, 0, data)
+
+    first = client.post(f"/uploads/{upload_id}/finalize")
+    retry = client.post(f"/uploads/{upload_id}/finalize")
+    assert (first.status_code, retry.status_code) == (201, 201)
+    assert retry.json()["id"] == first.json()["id"]
+    assert image_count(db) == 1
+    assert not object_store.path_for(partial_key(upload_id)).exists()
+    assert client.get(f"/images/{first.json()['id']}").content == data
+
+def test_failed_finalize_keeps_upload_data_for_retry(client, db, object_store, exp_id, monkeypatch):
+    """The part file survives an insert that fails, so finalize can be retried"""
+    data = create_png()
+    upload_id = start_upload(client, exp_id, data)
+    patch(client, upload_id, 0, data)
+
+    def fail(db, image_id):
+        raise RuntimeError("database went away")
+    with monkeypatch.context() as patched:
+        patched.setattr(ingest, "evaluate_new_image", fail)
+        with pytest.raises(RuntimeError):
+            client.post(f"/uploads/{upload_id}/finalize")
+    assert object_store.path_for(partial_key(upload_id)).read_bytes() == data
+    assert image_count(db) == 0
+
+    assert client.post(f"/uploads/{upload_id}/finalize").status_code == 201
+    assert image_count(db) == 1
+
+def test_sha256_mismatch_rejected(client, db, exp_id):
+    data = create_png()
+    upload_id = start_upload(client, exp_id, data, sha256=hashlib.sha256(b"other").hexdigest())
+    patch(client, upload_id, 0, data)
+
+    assert client.post(f"/uploads/{upload_id}/finalize").status_code == 422
+    assert image_count(db) == 0
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
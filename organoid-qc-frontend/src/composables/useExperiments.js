@@ -2,7 +2,7 @@ import { ref } from "vue";
 import { useApi } from "./useApi";
 
 export function useExperiments() {
-  const { get, post, del, isLoading, apiError } = useApi();
+  const { get, post, put, del, isLoading, apiError } = useApi();
 
   const experiments = ref([]);
   const selectedExp = ref(null);
@@ -39,14 +39,17 @@ export function useExperiments() {
     await loadEquipmentHealth(expId);
   };
 
-  const loadBatchReport = async (expId, thresholds = {}) => {
+  // Without thresholds the server reports on the experiment's active profile
+  const loadBatchReport = async (expId, thresholds = null) => {
     try {
-      const params = new URLSearchParams({
-        focus_threshold: thresholds.focus || 80,
-        contrast_threshold: thresholds.contrast || 20,
-        exposure_min: thresholds.exposure_min || 30,
-        exposure_max: thresholds.exposure_max || 225
-      });
+      const params = thresholds
+        ? new URLSearchParams({
+            focus_threshold: thresholds.focus ?? 150,
+            contrast_threshold: thresholds.contrast ?? 20,
+            exposure_min: thresholds.exposure_min ?? 30,
+            exposure_max: thresholds.exposure_max ?? 225
+          })
+        : new URLSearchParams();
       const data = await get(
         `/experiments/${expId}/batch-report?${params.toString()}`
       );
@@ -56,6 +59,30 @@ export function useExperiments() {
     }
   };
 
+  const loadActiveProfile = async (expId) => {
+    try {
+      const profiles = await get(`/experiments/${expId}/profiles`);
+      return profiles.find((p) => p.is_active) || null;
+    } catch (e) {
+      console.error("Failed to load threshold profile", e);
+      return null;
+    }
+  };
+
+  const saveProfile = async (expId, name, thresholds) => {
+    try {
+      return await put(`/experiments/${expId}/profiles/${encodeURIComponent(name)}`, {
+        focus_threshold: thresholds.focus,
+        contrast_threshold: thresholds.contrast,
+        exposure_min: thresholds.exposure_min,
+        exposure_max: thresholds.exposure_max
+      });
+    } catch (e) {
+      console.error("Failed to save threshold profile", e);
+      return null;
+    }
+  };
+
   const loadImages = async (expId) => {
     try {
       const data = await get(`/experiments/${expId}/images`);
@@ -75,6 +102,69 @@ export function useExperiments() {
   };
 
 
+  // Live updates: the server pushes each analyzed image over server-sent
+  // events so we patch local state instead of refetching the experiment.
+  let eventSource = null;
+
+  const round2 = (value) => Math.round(value * 100) / 100;
+
+  const applyImageEvent = (expId, { image, delta }) => {
+    images.value = [image, ...images.value];
+
+    const report = batchReport.value;
+    if (!report || report.profile !== delta.profile) {
+      // Report was built with other thresholds; deltas don't apply
+      loadBatchReport(expId);
+      return;
+    }
+    const total = report.total_images + delta.total_images;
+    report.avg_focus = round2((report.avg_focus * report.total_images + delta.sum_focus) / total);
+    report.avg_contrast = round2((report.avg_contrast * report.total_images + delta.sum_contrast) / total);
+    report.avg_exposure = round2((report.avg_exposure * report.total_images + delta.sum_exposure) / total);
+    report.total_images = total;
+    report.ml_ready_images += delta.ml_ready_images;
+    report.pass_rate = round2((report.ml_ready_images / total) * 100);
+
+    const session = report.sessions[delta.session] || { total: 0, ready: 0, issues: [] };
+    session.total += 1;
+    if (delta.ml_ready_images) {
+      session.ready += 1;
+    } else {
+      session.issues.push(image.quality_reason || "unknown_issue");
+    }
+    report.sessions[delta.session] = session;
+  };
+
+  const subscribeToEvents = (expId, onChange = () => {}) => {
+    unsubscribeFromEvents();
+    const { API_URL } = useApi();
+    // EventSource resends Last-Event-ID on reconnect, so only missed events are replayed
+    eventSource = new EventSource(`${API_URL}/experiments/${expId}/events`);
+
+    eventSource.addEventListener("image_analyzed", (e) => {
+      applyImageEvent(expId, JSON.parse(e.data));
+      onChange();
+    });
+
+    const reload = async () => {
+      await loadBatchReport(expId);
+      await loadImages(expId);
+      onChange();
+    };
+    eventSource.addEventListener("profile_changed", reload);
+    eventSource.addEventListener("resync", reload);
+    eventSource.addEventListener("images_reanalyzed", reload);
+  };
+
+  const unsubscribeFromEvents = () => {
+    if (eventSource) {
+      eventSource.close();
+      eventSource = null;
+    }
+  };
+
+  const isStreaming = () => eventSource?.readyState === EventSource.OPEN;
+
   const uploadImages = async (expId, files, metadata) => {
     try {
       const { uploadFile } = useApi();
@@ -91,8 +181,10 @@ export function useExperiments() {
         );
       }
       
-      await loadBatchReport(expId);
-      await loadImages(expId);
+      if (!isStreaming()) {
+        await loadBatchReport(expId);
+        await loadImages(expId);
+      }
       await loadEquipmentHealth(expId);
       return true;
     } catch (e) {
@@ -165,6 +257,11 @@ export function useExperiments() {
     selectExperiment,
     loadBatchReport,
     loadImages,
+    loadActiveProfile,
+    saveProfile,
+    subscribeToEvents,
+    unsubscribeFromEvents,
+    isStreaming,
     uploadImages,
     deleteExperiment,
     exportMlReady,